@@ -0,0 +1,58 @@
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import atan2
+import complex_multiplier
+import fixed_point
+
+class Model:
+    def __init__(self, C_DW, CFO_DW, DDS_DW):
+        self.C_DW = int(C_DW)
+        self.CFO_DW = int(CFO_DW)
+        self.DDS_DW = int(DDS_DW)
+        self.ATAN_IN_DW = 16
+        self.SAMPLE_RATE = 3840000
+        self.multiplier = complex_multiplier.Model(self.C_DW // 2, self.C_DW // 2, self.ATAN_IN_DW)
+        self.atan2 = atan2.Model(self.ATAN_IN_DW, self.ATAN_IN_DW, self.CFO_DW)
+
+    def input_scaling(self, C0, C1):
+        """scales C0 and C1 up like the INPUT_SCALING state, returns the 4 scaled components
+
+        The HDL searches from bit C_DW / 2 - 2 downwards for the first bit that differs from the sign bit
+        in any of the components and shifts this bit to position C_DW / 2 - 2.
+        """
+        width = self.C_DW // 2
+        comps = np.stack(fixed_point.unpack_iq(C0, self.C_DW) + fixed_point.unpack_iq(C1, self.C_DW))
+        # bits that differ from the sign bit, the highest one is bit_length() - 1
+        used = np.bitwise_or.reduce(np.where(comps < 0, ~comps, comps), axis = 0)
+        msb = np.zeros(used.shape, np.int64)
+        for bit in range(width - 2):
+            msb = np.where(used >> (bit + 1), bit + 1, msb)
+        shift = width - 2 - msb
+        return fixed_point.sign_extend(comps << shift, width)
+
+    def process(self, C0, C1):
+        """bit exact CFO_angle_o and CFO_DDS_inc_o for arrays of C0_i and C1_i
+
+        C0 and C1 can be packed C_DW words or complex values, every pair is one independent calculation.
+        Returns (CFO_angle, DDS_inc) as signed integers.
+        """
+        C0 = np.asarray(C0)
+        C1 = np.asarray(C1)
+        if np.iscomplexobj(C0):
+            C0 = fixed_point.pack_complex(C0, self.C_DW)
+        if np.iscomplexobj(C1):
+            C1 = fixed_point.pack_complex(C1, self.C_DW)
+        C0_re, C0_im, C1_re, C1_im = self.input_scaling(C0, C1)
+        # C1 is conjugated by negating the C_DW / 2 bit wide imaginary part, this wraps around for the most negative value
+        prod_re, prod_im = self.multiplier.multiply(fixed_point.pack_iq(C0_re, C0_im, self.C_DW),
+                                                    fixed_point.pack_iq(C1_re, -C1_im, self.C_DW))
+        angle = self.atan2.calc(prod_im, prod_re)
+        return angle, self.DDS_inc(angle)
+
+    def DDS_inc(self, angle):
+        """CFO_DDS_inc_o for a CFO_angle_o, angle / 128 in DDS_DW bits"""
+        angle_rshift7 = np.asarray(angle) >> 7
+        return angle_rshift7 >> max(self.CFO_DW - self.DDS_DW, 0)
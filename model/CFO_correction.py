@@ -0,0 +1,86 @@
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import complex_multiplier
+import dds
+import fixed_point
+
+class Model:
+    def __init__(self, IN_DW, DDS_OUT_DW = 32, DDS_PHASE_DW = 20, COMPL_MULT_OUT_DW = 32):
+        self.IN_DW = int(IN_DW)
+        self.DDS_OUT_DW = int(DDS_OUT_DW)
+        self.DDS_PHASE_DW = int(DDS_PHASE_DW)
+        self.COMPL_MULT_OUT_DW = int(COMPL_MULT_OUT_DW)
+        self.dds = dds.Model(self.DDS_PHASE_DW, self.DDS_OUT_DW // 2, LUT_DW = 16, USE_TAYLOR = 1)
+        # the input is a rotating vector with length 2 ** (IN_DW / 2 - 1), therefore bit growth is 2 bits less than worst case
+        self.multiplier = complex_multiplier.Model(self.DDS_OUT_DW // 2, self.IN_DW // 2, self.COMPL_MULT_OUT_DW // 2, GROWTH_BITS = -2)
+        self.CFO_norm = 0
+        # register stages of the dds between DDS_phase and the multiplier input, and clock cycles from the edge
+        # that samples the multiplier inputs to the edge after which m_axis_dout_tvalid is set
+        self.DDS_LATENCY = 4
+        self.MULT_LATENCY = 6
+
+    def set_CFO(self, CFO_norm):
+        """sets the phase increment, CFO_norm = CFO_hz / fs * (2 ** DDS_PHASE_DW - 1)"""
+        self.CFO_norm = int(CFO_norm) & ((1 << self.DDS_PHASE_DW) - 1)
+
+    def process_chunk(self, samples, tvalid = None):
+        """streaming mode, rotates a block of samples by the DDS output in one pass
+
+        samples can be packed IN_DW words or complex values, only samples with tvalid = 1 advance the phase
+        accumulator. The first sample after reset is multiplied with phase 0, the HDL drops the samples
+        before the DDS output is valid, see process_cycles(). Returns the multiplier
+        outputs for the valid samples as complex values with COMPL_MULT_OUT_DW / 2 bit components.
+        """
+        samples = np.asarray(samples)
+        if tvalid is not None:
+            samples = samples[np.asarray(tvalid, bool)]
+        if np.iscomplexobj(samples):
+            in_re, in_im = fixed_point.complex_iq(samples, self.IN_DW)
+        else:
+            in_re, in_im = fixed_point.unpack_iq(samples, self.IN_DW)
+        cos, sin = self.dds.calc(self.dds.phases(self.CFO_norm, len(samples)))
+        re, im = self.multiplier.multiply_iq(cos, sin, in_re, in_im)
+        return re + 1j * im
+
+    def process(self, samples, tvalid = None):
+        """block mode, like process_chunk() but starting from reset state"""
+        self.reset()
+        return self.process_chunk(samples, tvalid)
+
+    def process_cycles(self, samples, tvalid, CFO_norm_in):
+        """cycle accurate block mode of the DDS_phase register, dds and complex_multiplier starting from reset state
+
+        samples, tvalid and CFO_norm_in are s_axis_in_tdata, s_axis_in_tvalid and CFO_norm_in for every clock cycle,
+        CFO_norm_in can also be a single value. The phase register adds the unregistered CFO_norm_in with every valid
+        sample, and the multiplier only gives an output if the DDS output is valid in the same cycle, so the first
+        samples after reset are dropped. Returns (out, valid_out) for every clock cycle, extended by MULT_LATENCY
+        cycles. Index k holds m_axis_dout_tdata and m_axis_dout_tvalid after the clock edge that samples input k.
+        """
+        tvalid = np.asarray(tvalid, bool)
+        num_cycles = len(tvalid)
+        samples = np.asarray(samples)
+        if np.iscomplexobj(samples):
+            samples = fixed_point.pack_complex(samples, self.IN_DW)
+        mask = (1 << self.DDS_PHASE_DW) - 1
+        inc = np.broadcast_to(np.asarray(CFO_norm_in).astype(np.int64) & mask, num_cycles)
+        # DDS_phase and DDS_phase_valid after every clock edge
+        phase = np.cumsum(np.where(tvalid, inc, 0)) & mask
+        phase_valid = np.cumsum(tvalid) > 0
+        # the multiplier samples the DDS output for DDS_phase DDS_LATENCY + 1 cycles earlier
+        src = np.arange(num_cycles) - self.DDS_LATENCY - 1
+        dds_valid = np.where(src >= 0, phase_valid[np.maximum(src, 0)], False)
+        cycles = np.flatnonzero(tvalid & dds_valid)
+        in_re, in_im = fixed_point.unpack_iq(samples[cycles], self.IN_DW)
+        cos, sin = self.dds.calc(phase[src[cycles]])
+        re, im = self.multiplier.multiply_iq(cos, sin, in_re, in_im)
+        out = np.zeros(num_cycles + self.MULT_LATENCY, complex)
+        valid_out = np.zeros(num_cycles + self.MULT_LATENCY, bool)
+        out[cycles + self.MULT_LATENCY] = re + 1j * im
+        valid_out[cycles + self.MULT_LATENCY] = True
+        return out, valid_out
+
+    def reset(self):
+        self.dds.reset()
@@ -0,0 +1,146 @@
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import complex_multiplier
+import fixed_point
+
+class Model:
+    def __init__(self, IN_DW, HALF_CP_ADVANCE = 1, OUT_DW = 16, NFFT = 8, BWP_LEN = 240, BLK_EXP_LEN = 8):
+        self.IN_DW = int(IN_DW)
+        self.HALF_CP_ADVANCE = int(HALF_CP_ADVANCE)
+        self.OUT_DW = int(OUT_DW)
+        self.NFFT = int(NFFT)
+        self.BWP_LEN = int(BWP_LEN)
+        self.BLK_EXP_LEN = int(BLK_EXP_LEN)
+        self.FFT_LEN = 2 ** self.NFFT
+        self.CP1 = 20 * self.FFT_LEN // 256
+        self.CP2 = 18 * self.FFT_LEN // 256
+        # the FFT core works with IN_DW / 2 bit components, the upper OUT_DW / 2 bits are used
+        self.FFT_DW = self.IN_DW // 2
+        # twiddle factors exp(-2j * pi * k / FFT_LEN) of the radix-2 stages with TWDL_WIDTH = IN_DW / 2 bits
+        self.TWDL_WIDTH = self.FFT_DW
+        k = np.arange(self.FFT_LEN // 2)
+        scale = 2 ** (self.TWDL_WIDTH - 1) - 1
+        self.twiddle_re = np.round(np.cos(2 * np.pi * k / self.FFT_LEN) * scale).astype(np.int64)
+        self.twiddle_im = np.round(-np.sin(2 * np.pi * k / self.FFT_LEN) * scale).astype(np.int64)
+        # the DIF stages give the bins in bit reversed order
+        self.bit_reverse = np.zeros(self.FFT_LEN, np.int64)
+        for i in range(self.NFFT):
+            self.bit_reverse |= ((np.arange(self.FFT_LEN) >> i) & 1) << (self.NFFT - 1 - i)
+
+        self.SC_START = self.FFT_LEN // 2 - self.BWP_LEN // 2
+        self.SC_END = self.SC_START + self.BWP_LEN
+        self.SSS_LEN = 127
+        self.SSS_START = self.FFT_LEN // 2 - (self.SSS_LEN + 1) // 2
+
+        # with HALF_CP_ADVANCE the FFT window starts in the middle of the CP, which causes a phase shift
+        # that depends on the subcarrier, the coefficients are calculated for CP2 like in the HDL
+        if self.HALF_CP_ADVANCE:
+            CP_ADVANCE = self.CP2 // 2
+            angle = 2 * np.pi * (self.CP2 - CP_ADVANCE) / self.FFT_LEN * np.arange(self.FFT_LEN) + np.pi * (self.CP2 - CP_ADVANCE)
+            # conversion from real to integer rounds in verilog
+            scale = 2 ** (self.OUT_DW // 2 - 1) - 1
+            self.coeff_re = np.round(np.cos(angle) * scale).astype(np.int64)
+            self.coeff_im = np.round(np.sin(angle) * scale).astype(np.int64)
+            self.multiplier = complex_multiplier.Model(self.OUT_DW // 2, self.OUT_DW // 2, self.OUT_DW // 2, GROWTH_BITS = -2)
+
+    def window_start(self, CP_len):
+        """number of samples at the start of a symbol that are skipped before the FFT window"""
+        CP_len = np.asarray(CP_len)
+        if self.HALF_CP_ADVANCE:
+            return CP_len - (CP_len >> 1)
+        return CP_len
+
+    def remove_CP(self, symbols, CP_len = None):
+        """symbols has shape (num_symbols, CP_len + FFT_LEN), returns the FFT windows with shape (num_symbols, FFT_LEN)"""
+        if CP_len is None:
+            CP_len = self.CP2
+        start = int(self.window_start(CP_len))
+        return np.asarray(symbols)[:, start:start + self.FFT_LEN]
+
+    def split_symbols(self, samples, CP_lens):
+        """cuts a stream of symbols with the given CP lengths into FFT windows with shape (len(CP_lens), FFT_LEN)"""
+        CP_lens = np.asarray(CP_lens, np.int64)
+        symbol_starts = np.concatenate(([0], np.cumsum(CP_lens + self.FFT_LEN)[:-1]))
+        starts = symbol_starts + self.window_start(CP_lens)
+        return np.asarray(samples)[starts[:, np.newaxis] + np.arange(self.FFT_LEN)]
+
+    def fft(self, windows):
+        """FFT with dynamic block scaling of a block of FFT windows with shape (num_symbols, FFT_LEN)
+
+        windows can be packed IN_DW words or complex values. The FFT is calculated with integer radix-2
+        decimation in frequency stages like int_dif2_fly in the core, the twiddle products are truncated to the
+        data LSB and the last stage has no multiplier. The block scaling is done in every stage: when the largest
+        component of a symbol after the butterflies does not fit into FFT_DW bits, all values of the symbol are
+        shifted right until it fits and the shift is added to the block exponent of the symbol.
+        The FFT core is a submodule that is not in this tree, so this is not checked bit exact against it.
+        Returns (re, im, blk_exp), re and im are in fftshift order like with SHIFTED = 1.
+        """
+        windows = np.atleast_2d(np.asarray(windows))
+        if np.iscomplexobj(windows):
+            re, im = windows.real.astype(np.int64), windows.imag.astype(np.int64)
+        else:
+            re, im = (np.asarray(x).astype(np.int64) for x in fixed_point.unpack_iq(windows, self.IN_DW))
+        num = len(re)
+        blk_exp = np.zeros(num, np.int64)
+        # FFT_DW + 2 bit data times TWDL_WIDTH bit twiddles fits into int64
+        for stage in range(self.NFFT):
+            half = self.FFT_LEN >> (stage + 1)
+            re = re.reshape(num, -1, 2, half)
+            im = im.reshape(num, -1, 2, half)
+            sum_re = re[:, :, 0] + re[:, :, 1]
+            sum_im = im[:, :, 0] + im[:, :, 1]
+            diff_re = re[:, :, 0] - re[:, :, 1]
+            diff_im = im[:, :, 0] - im[:, :, 1]
+            if half > 1:
+                w_re = self.twiddle_re[::1 << stage]
+                w_im = self.twiddle_im[::1 << stage]
+                diff_re, diff_im = ((diff_re * w_re - diff_im * w_im) >> (self.TWDL_WIDTH - 1),
+                                    (diff_re * w_im + diff_im * w_re) >> (self.TWDL_WIDTH - 1))
+            re = np.stack((sum_re, diff_re), axis = 2).reshape(num, -1)
+            im = np.stack((sum_im, diff_im), axis = 2).reshape(num, -1)
+            shift = self.block_shift(re, im)
+            re >>= shift[:, np.newaxis]
+            im >>= shift[:, np.newaxis]
+            blk_exp += shift
+        re = np.fft.fftshift(re[:, self.bit_reverse], axes = 1)
+        im = np.fft.fftshift(im[:, self.bit_reverse], axes = 1)
+        return re, im, blk_exp & ((1 << self.BLK_EXP_LEN) - 1)
+
+    def block_shift(self, re, im):
+        """right shift for every symbol so that its largest component fits into FFT_DW bits"""
+        peak = np.maximum(np.maximum(re, -re - 1), np.maximum(im, -im - 1)).max(axis = 1)
+        peak_bits = np.floor(np.log2(np.maximum(peak, 1))).astype(np.int64) + 1
+        return np.maximum(peak_bits - (self.FFT_DW - 1), 0)
+
+    def process(self, windows):
+        """demodulates a block of FFT windows with shape (num_symbols, FFT_LEN) in one call
+
+        Returns (data, blk_exp) where data has shape (num_symbols, BWP_LEN) and contains m_axis_out_tdata
+        as complex values with OUT_DW / 2 bit components, blk_exp is the block exponent of every symbol.
+        """
+        re, im, blk_exp = self.fft(windows)
+        re = fixed_point.truncate(re[:, self.SC_START:self.SC_END], self.FFT_DW - self.OUT_DW // 2)
+        im = fixed_point.truncate(im[:, self.SC_START:self.SC_END], self.FFT_DW - self.OUT_DW // 2)
+        if self.HALF_CP_ADVANCE:
+            coeff_re = self.coeff_re[self.SC_START:self.SC_END]
+            coeff_im = self.coeff_im[self.SC_START:self.SC_END]
+            re, im = self.multiplier.multiply_iq(re, im, coeff_re, coeff_im)
+        return re + 1j * im, blk_exp
+
+    def demod(self, samples, CP_lens):
+        """like process(), but for a stream of symbols with the given CP lengths"""
+        return self.process(self.split_symbols(samples, CP_lens))
+
+    def SSS(self, data):
+        """subcarriers of the output that are marked with SSS_valid_o in symbol 1 of an SSB,
+        in symbol 0 PBCH_valid_o marks all BWP_LEN subcarriers"""
+        return data[..., self.SSS_START - self.SC_START:][..., :self.SSS_LEN]
+
+    def tuser(self, blk_exp, meta = 0, PBCH_symbol = 0):
+        """packs m_axis_out_tuser, meta are the frame number, subframe number and symbol number bits from s_axis_in_tuser"""
+        meta = np.asarray(meta, np.int64)
+        blk_exp = np.asarray(blk_exp, np.int64) & ((1 << self.BLK_EXP_LEN) - 1)
+        return (meta << (self.BLK_EXP_LEN + 1)) | (blk_exp << 1) | (np.asarray(PBCH_symbol, np.int64) & 1)
@@ -1,10 +1,10 @@
+import os
+import sys
 import numpy as np
 
-def _twos_comp(val, bits):
-    """compute the 2's complement of int value val"""
-    if (val & (1 << (bits - 1))) != 0:
-        val = val - (1 << bits)
-    return int(val)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import PSS_taps
+import fixed_point
 
 class Model:
     def __init__(self, IN_DW, OUT_DW, TAP_DW, PSS_LEN, PSS_LOCAL, ALGO, USE_TAP_FILE = 0, TAP_FILE = ''):
@@ -12,86 +12,136 @@ class Model:
         self.OUT_DW = int(OUT_DW)
         self.TAP_DW = int(TAP_DW)
         self.IN_DW = int(IN_DW)
+        self.ALGO = int(ALGO)
         self.POSSIBLE_IN_DW = int(self.OUT_DW - (np.ceil(np.log2(self.PSS_LEN) + 1)) * 2  - 3)
         self.IN_OP_DW = self.POSSIBLE_IN_DW // 2
         self.TAP_OP_DW = self.POSSIBLE_IN_DW // 2 + (self.POSSIBLE_IN_DW % 2)
 
-        # print(f'model IN_DW = {IN_DW}')
-        # print(f'model OUT_DW = {OUT_DW}')
-        # print(f'model PSS_LEN = {PSS_LEN}')
-        # print(f'model PSS_LOCAL = {PSS_LOCAL}')
-        self.taps = np.empty(PSS_LEN, 'complex')
-
-        if False:
-            # don't do rounding for truncations, because its also not implemented in HDL
-            if self.trunc_taps > 1:
-                round_bits = 2 ** (self.trunc_taps - 2) - 1
-            else:
-                round_bits = 0
-        else:
-            round_bits = 0
-
         if USE_TAP_FILE:
             print(f'using tap file {TAP_FILE}')
-            temp_taps = np.loadtxt(TAP_FILE, delimiter = ' ', dtype = int, converters={0:lambda s: int(s, 16)})
-
-        for i in range(PSS_LEN):
-            if USE_TAP_FILE:
-                self.taps[i] = _twos_comp(temp_taps[i]                          & (2 ** (self.TAP_DW // 2) - 1), self.TAP_DW // 2) \
-                        + 1j * _twos_comp((temp_taps[i] >> (self.TAP_DW // 2))  & (2 ** (self.TAP_DW // 2) - 1), self.TAP_DW // 2)
-            else:
-                self.taps[i] =    _twos_comp(((PSS_LOCAL >> (self.TAP_DW * i))                    & (2 ** (self.TAP_DW // 2) - 1)),
-                                self.TAP_DW // 2) \
-                            + 1j*_twos_comp(((PSS_LOCAL >> (self.TAP_DW * i + self.TAP_DW // 2)) & (2 ** (self.TAP_DW // 2) - 1)),
-                                self.TAP_DW // 2)
+            self.taps = PSS_taps.read_tap_file(TAP_FILE, self.TAP_DW)[:self.PSS_LEN]
+        else:
+            self.taps = PSS_taps.unpack(PSS_LOCAL, self.PSS_LEN, self.TAP_DW)
 
-        # for i in range(PSS_LEN):
-        #     print(f'taps[{i}] = {self.taps[i]}')
+        self.REQUIRED_OUT_DW = int(np.ceil(np.log2(self.PSS_LEN)) + self.IN_DW // 2 + self.TAP_DW // 2 + 1)
+        self.truncate = max(self.REQUIRED_OUT_DW - self.OUT_DW, 0)
+        if self.ALGO == 0:
+            self.corr_taps = self.taps.copy()
+        else:
+            # ALGO=1 exploits the complex conjugate central symmetry of the PSS,
+            # the HDL calculates sum(tap[i] * (in[i] + conj(in[PSS_LEN - i]))) for i = 1 .. PSS_LEN / 2 - 1
+            # which is the same as correlating with these taps, in[0] and in[PSS_LEN / 2] are not used
+            self.corr_taps = np.zeros(self.PSS_LEN, 'complex')
+            half = self.PSS_LEN // 2
+            self.corr_taps[1:half] = self.taps[1:half]
+            self.corr_taps[self.PSS_LEN - 1:half:-1] = np.conj(self.taps[1:half])
+        self.taps_re = self.corr_taps.real.astype(np.int64)
+        self.taps_im = self.corr_taps.imag.astype(np.int64)
+        self.taps_re_rev = self.taps_re[::-1].copy()
+        self.taps_im_rev = self.taps_im[::-1].copy()
+        self.pipeline_stages = 3
 
         self.reset()
 
     def tick(self):
-        self.valid[1:] = self.valid[:-1]
-        self.result[1:] = self.result[:-1]
-        self.valid[0] = False
+        # the pipelines are ring buffers, a clock cycle only moves the write position
+        self.out_pos = (self.out_pos + 1) % self.pipeline_stages
+        self.valid[self.out_pos] = False
 
         if self.in_buffer is not None:
-            self.in_pipeline[1:] = self.in_pipeline[:-1]
-            self.in_pipeline[0] = self.in_buffer
-            self.valid[0] = True
+            # every sample is stored twice, so that the last PSS_LEN samples are always a contiguous slice
+            self.in_pos = (self.in_pos + 1) % self.PSS_LEN
+            self.in_re[self.in_pos] = self.in_re[self.in_pos + self.PSS_LEN] = int(self.in_buffer.real)
+            self.in_im[self.in_pos] = self.in_im[self.in_pos + self.PSS_LEN] = int(self.in_buffer.imag)
             self.in_buffer = None
 
-            result_re = 0
-            result_im = 0
-            for i in range(self.PSS_LEN):
-                # bit growth inside this loop is ceil(log2(PSS_LEN)) + IN_DW/2 for result_re and result_im
-                result_re += (  int(self.taps[i].real) * int(self.in_pipeline[i].real) \
-                                - int(self.taps[i].imag) * int(self.in_pipeline[i].imag))
-                result_im += (  int(self.taps[i].real) * int(self.in_pipeline[i].imag) \
-                                + int(self.taps[i].imag) * int(self.in_pipeline[i].real))
-            # result_abs = result_re ** 2 + result_im ** 2
-            if np.abs(result_re) > np.abs(result_im):
-                result_abs = np.abs(result_re) + (int(np.abs(result_im))>>2)
-            else:
-                result_abs = np.abs(result_im) + (int(np.abs(result_re))>>2)
-            truncate = int(np.ceil(np.log2(self.PSS_LEN)) + self.IN_DW//2 + self.TAP_DW//2 + 1 - self.OUT_DW)
-            if truncate < 0:
-                truncate = 0
-            self.result[0] = (result_abs >> truncate) & (2 ** self.OUT_DW - 1)
+            # oldest sample first, so the taps are used in reverse order
+            in_re = self.in_re[self.in_pos + 1:self.in_pos + self.PSS_LEN + 1]
+            in_im = self.in_im[self.in_pos + 1:self.in_pos + self.PSS_LEN + 1]
+            result_re = in_re @ self.taps_re_rev - in_im @ self.taps_im_rev
+            result_im = in_im @ self.taps_re_rev + in_re @ self.taps_im_rev
+            self.result[self.out_pos] = self.filter_result(result_re, result_im)
+            self.valid[self.out_pos] = True
 
     def set_data(self, data_in):
-        self.in_buffer =      _twos_comp((data_in & (2 ** (self.IN_DW // 2) - 1)),                        self.IN_DW // 2) \
-                         + 1j*_twos_comp(((data_in >> (self.IN_DW // 2)) & (2 ** (self.IN_DW // 2) - 1)), self.IN_DW // 2)
+        self.in_buffer = complex(fixed_point.unpack_complex(data_in, self.IN_DW))
+
+    def unpack_samples(self, samples):
+        """split packed IN_DW words or complex samples into signed int64 re and im arrays"""
+        samples = np.asarray(samples)
+        if np.iscomplexobj(samples):
+            # the HDL only sees the lower IN_DW / 2 bits of each component
+            re, im = fixed_point.complex_iq(samples, self.IN_DW)
+        else:
+            re, im = fixed_point.unpack_iq(samples, self.IN_DW)
+        return np.asarray(re), np.asarray(im)
+
+    def correlate(self, in_re, in_im):
+        """bit exact correlation of signed int64 re and im arrays, starting from an empty pipeline"""
+        num = len(in_re)
+        sum_re = np.convolve(in_re, self.taps_re)[:num] - np.convolve(in_im, self.taps_im)[:num]
+        sum_im = np.convolve(in_re, self.taps_im)[:num] + np.convolve(in_im, self.taps_re)[:num]
+        return sum_re, sum_im
+
+    def filter_result(self, sum_re, sum_im):
+        """alpha max beta min abs approximation and output truncation like in the HDL"""
+        abs_re = np.abs(sum_re)
+        abs_im = np.abs(sum_im)
+        # max + min / 4, like the HDL that adds a quarter of the smaller component to the larger one
+        result = np.maximum(abs_re, abs_im) + (np.minimum(abs_re, abs_im) >> 2)
+        return (result >> self.truncate) & (2 ** self.OUT_DW - 1)
+
+    def process(self, samples, tvalid = None):
+        """block mode, calculates the whole output stream for samples at once
+
+        samples can be packed IN_DW words or complex values, processing starts from reset state.
+        tvalid optionally gives s_axis_in_tvalid for every sample, samples with tvalid = 0 are ignored
+        like in the HDL. Returns (result, valid) with one entry per input sample, result[i] is the value
+        that the HDL outputs for sample i and valid[i] is the corresponding m_axis_out_tvalid.
+        """
+        in_re, in_im = self.unpack_samples(samples)
+        if tvalid is None:
+            valid = np.ones(len(in_re), bool)
+        else:
+            valid = np.asarray(tvalid, bool)
+        result = np.zeros(len(in_re), np.int64)
+        result[valid] = self.filter_result(*self.correlate(in_re[valid], in_im[valid]))
+        return result, valid
+
+    def process_chunk(self, samples, tvalid = None):
+        """streaming mode, works like process() but keeps the last PSS_LEN - 1 samples for the next call
+
+        Chunks can have arbitrary length, concatenating the outputs of consecutive calls gives the same
+        result as calling process() on the concatenated input. Call reset() to start a new stream.
+        """
+        in_re, in_im = self.unpack_samples(samples)
+        if tvalid is None:
+            valid = np.ones(len(in_re), bool)
+        else:
+            valid = np.asarray(tvalid, bool)
+        hist_len = self.PSS_LEN - 1
+        in_re = np.concatenate((self.stream_re, in_re[valid]))
+        in_im = np.concatenate((self.stream_im, in_im[valid]))
+        self.stream_re = in_re[len(in_re) - hist_len:]
+        self.stream_im = in_im[len(in_im) - hist_len:]
+        result = np.zeros(len(valid), np.int64)
+        result[valid] = self.filter_result(*self.correlate(in_re, in_im))[hist_len:]
+        return result, valid
 
     def reset(self):
-        self.in_pipeline = np.zeros(self.PSS_LEN, 'complex')
+        self.in_re = np.zeros(2 * self.PSS_LEN, np.int64)
+        self.in_im = np.zeros(2 * self.PSS_LEN, np.int64)
+        self.in_pos = 0
         self.in_buffer = None
-        pipeline_stages = 3
-        self.valid = np.zeros(pipeline_stages, bool)
-        self.result = np.zeros(pipeline_stages)
+        self.stream_re = np.zeros(self.PSS_LEN - 1, np.int64)
+        self.stream_im = np.zeros(self.PSS_LEN - 1, np.int64)
+        self.valid = np.zeros(self.pipeline_stages, bool)
+        self.result = np.zeros(self.pipeline_stages, np.int64)
+        self.out_pos = 0
 
     def data_valid(self):
-        return self.valid[-1]
+        # the oldest pipeline stage is the one that gets overwritten next
+        return self.valid[(self.out_pos + 1) % self.pipeline_stages]
 
     def get_data(self):
-        return self.result[-1]
+        return self.result[(self.out_pos + 1) % self.pipeline_stages]
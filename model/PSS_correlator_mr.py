@@ -0,0 +1,121 @@
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import PSS_correlator
+
+class Model:
+    def __init__(self, IN_DW, OUT_DW, TAP_DW, PSS_LEN, PSS_LOCAL, ALGO, MULT_REUSE):
+        self.IN_DW = int(IN_DW)
+        self.OUT_DW = int(OUT_DW)
+        self.TAP_DW = int(TAP_DW)
+        self.PSS_LEN = int(PSS_LEN)
+        self.ALGO = int(ALGO)
+        self.MULT_REUSE = int(MULT_REUSE)
+        # PSS_correlator_mr calculates the same sums as PSS_correlator, only spread over MULT_REUSE cycles
+        self.correlator = PSS_correlator.Model(IN_DW, OUT_DW, TAP_DW, PSS_LEN, PSS_LOCAL, ALGO)
+
+        self.PSS_LEN_USED = (self.PSS_LEN - 2) // 2 if self.ALGO else self.PSS_LEN
+        self.REQ_MULTS = int(np.ceil(self.PSS_LEN_USED / self.MULT_REUSE))
+        # input sample to m_axis_out_tvalid in clock cycles
+        self.LATENCY = self.MULT_REUSE + 1
+
+        # tap positions that each multiplier processes in cycle idx
+        self.step_pos = []
+        self.step_mult = []
+        for idx in range(self.MULT_REUSE):
+            pos = []
+            mult = []
+            for i_g in range(self.REQ_MULTS):
+                mult_reuse_cur = self.MULT_REUSE if self.PSS_LEN_USED - i_g * self.MULT_REUSE >= self.MULT_REUSE \
+                                 else self.PSS_LEN_USED % self.MULT_REUSE
+                if idx < mult_reuse_cur:
+                    pos.append(i_g * self.MULT_REUSE + idx + (1 if self.ALGO else 0))
+                    mult.append(i_g)
+            self.step_pos.append(np.array(pos, int))
+            self.step_mult.append(np.array(mult, int))
+
+    def accepted_inputs(self, tvalid):
+        """returns the clock cycles in which an input sample starts a correlation
+
+        Samples that arrive less than MULT_REUSE cycles after an accepted sample are shifted into the
+        input pipeline but do not produce an output, the HDL reports an error in that case.
+        """
+        in_cycles = np.flatnonzero(np.asarray(tvalid, bool))
+        if np.all(np.diff(in_cycles) >= self.MULT_REUSE):
+            return in_cycles
+        accepted = []
+        next_free = 0
+        for cycle in in_cycles:
+            if cycle >= next_free:
+                accepted.append(cycle)
+                next_free = cycle + self.MULT_REUSE
+        return np.array(accepted, int)
+
+    def process(self, samples, tvalid):
+        """cycle accurate block mode, processes samples starting from reset state
+
+        samples and tvalid are s_axis_in_tdata and s_axis_in_tvalid for every clock cycle, samples can be
+        packed IN_DW words or complex values. Returns (result, valid, C0, C1) for every clock cycle,
+        extended by LATENCY cycles so that the outputs for the last samples are included. Index k holds
+        m_axis_out_tdata, m_axis_out_tvalid, C0 and C1 after the clock edge that samples input k, the output
+        for an accepted sample in cycle k therefore appears in cycle k + LATENCY.
+        C0 and C1 are returned as complex values.
+        """
+        in_re, in_im = self.correlator.unpack_samples(samples)
+        tvalid = np.asarray(tvalid, bool)
+        num_cycles = len(tvalid)
+        in_re = in_re[tvalid]
+        in_im = in_im[tvalid]
+        # number of samples in the input pipeline after each clock cycle
+        in_count = np.cumsum(tvalid)
+
+        starts = self.accepted_inputs(tvalid)
+        mult_re = np.zeros((len(starts), self.REQ_MULTS), np.int64)
+        mult_im = np.zeros((len(starts), self.REQ_MULTS), np.int64)
+        taps_re = self.correlator.taps_re
+        taps_im = self.correlator.taps_im
+
+        def pipeline(count, pos):
+            # in_re[pos] and in_im[pos] of the HDL shift register, when it contains count samples
+            sample_idx = count[:, np.newaxis] - 1 - pos[np.newaxis, :]
+            used = sample_idx >= 0
+            sample_idx = np.maximum(sample_idx, 0)
+            return np.where(used, in_re[sample_idx], 0), np.where(used, in_im[sample_idx], 0)
+
+        for idx in range(self.MULT_REUSE):
+            pos = self.step_pos[idx]
+            if len(pos) == 0 or len(starts) == 0:
+                continue
+            # multiplier step idx sees the pipeline as it is after clock cycle start + idx
+            count = in_count[np.minimum(starts + idx, num_cycles - 1)]
+            x_re, x_im = pipeline(count, pos)
+            prod_re = x_re * taps_re[pos] - x_im * taps_im[pos]
+            prod_im = x_re * taps_im[pos] + x_im * taps_re[pos]
+            if self.ALGO:
+                mirror = self.PSS_LEN - pos
+                x_re, x_im = pipeline(count, mirror)
+                prod_re += x_re * taps_re[mirror] - x_im * taps_im[mirror]
+                prod_im += x_re * taps_im[mirror] + x_im * taps_re[mirror]
+            mult_re[:, self.step_mult[idx]] += prod_re
+            mult_im[:, self.step_mult[idx]] += prod_im
+
+        half = self.REQ_MULTS // 2
+        sum_re = mult_re.sum(axis = 1)
+        sum_im = mult_im.sum(axis = 1)
+        C0 = mult_re[:, :half].sum(axis = 1) + 1j * mult_im[:, :half].sum(axis = 1)
+        C1 = mult_re[:, half:].sum(axis = 1) + 1j * mult_im[:, half:].sum(axis = 1)
+
+        out_cycles = starts + self.LATENCY
+        result = np.zeros(num_cycles + self.LATENCY, np.int64)
+        valid = np.zeros(num_cycles + self.LATENCY, bool)
+        result[out_cycles] = self.correlator.filter_result(sum_re, sum_im)
+        valid[out_cycles] = True
+        # C0 and C1 keep their value until the next output
+        C0_out = np.zeros(num_cycles + self.LATENCY, complex)
+        C1_out = np.zeros(num_cycles + self.LATENCY, complex)
+        C0_out[out_cycles] = C0
+        C1_out[out_cycles] = C1
+        last_out = np.maximum.accumulate(np.where(valid, np.arange(len(valid)), 0))
+        return result, valid, C0_out[last_out], C1_out[last_out]
@@ -0,0 +1,204 @@
+import os
+import sys
+import numpy as np
+import scipy.fft
+from numpy.lib.stride_tricks import sliding_window_view
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import PSS_correlator
+import peak_detector
+
+SEARCH = 0
+FIND = 1
+PAUSE = 2
+
+class Model:
+    def __init__(self, IN_DW, OUT_DW, TAP_DW, PSS_LEN, PSS_LOCAL, ALGO, WINDOW_LEN, USE_TAP_FILE = 0, TAP_FILE = ('', '', '')):
+        self.IN_DW = int(IN_DW)
+        self.OUT_DW = int(OUT_DW)
+        self.TAP_DW = int(TAP_DW)
+        self.PSS_LEN = int(PSS_LEN)
+        self.ALGO = int(ALGO)
+        self.WINDOW_LEN = int(WINDOW_LEN)
+
+        # one correlator model per N_id_2, they are only used for tap decoding and as reference
+        self.correlators = [PSS_correlator.Model(IN_DW, OUT_DW, TAP_DW, PSS_LEN, PSS_LOCAL[i], ALGO, USE_TAP_FILE, TAP_FILE[i])
+                            for i in range(3)]
+        taps_re = np.stack([c.taps_re for c in self.correlators])
+        taps_im = np.stack([c.taps_im for c in self.correlators])
+        # [in_re, in_im] @ taps_matrix gives [sum_re_0..2, sum_im_0..2]
+        self.taps_matrix = np.block([[taps_re.T, taps_im.T], [-taps_im.T, taps_re.T]])
+        # float64 matmul is exact as long as all partial sums fit into the 53 bit mantissa
+        max_sum_bits = self.IN_DW // 2 + self.TAP_DW // 2 + int(np.ceil(np.log2(2 * self.PSS_LEN)))
+        self.matmul_dtype = np.float64 if max_sum_bits <= 52 else np.int64
+        self.block_len = 8192
+        # inputs from 4096 samples on are correlated with FFT convolution, the rounding error of the float64 FFT
+        # stays far below 0.5 as long as the sums are not wider than 44 bits, so rounding gives the exact sums.
+        # Inputs up to fft_len samples are transformed at once with a length that scipy.fft handles fast, longer
+        # inputs with overlap-save
+        self.min_fft_len = 4096
+        self.fft_len = 2 ** 14
+        self.use_fft = max_sum_bits <= 44
+        self.corr_taps = np.stack([c.taps_re + 1j * c.taps_im for c in self.correlators])
+        # FFT of the taps for every FFT length that was used
+        self.taps_fft = {}
+
+        # C0_o is the partial sum over these taps, C1_o is the rest of the sum
+        i = np.arange(self.PSS_LEN)
+        if self.ALGO == 0:
+            self.C0_mask = i < self.PSS_LEN // 2
+        else:
+            # pairs i = 1 .. PSS_LEN / 4 - 1 of the symmetric sum, these are the taps i and PSS_LEN - i
+            self.C0_mask = ((i >= 1) & (i < self.PSS_LEN // 4)) | (i > self.PSS_LEN - self.PSS_LEN // 4)
+
+        # the peak detectors get OUT_DW bit wide data from the correlators
+        self.peak_detectors = [peak_detector.Model(OUT_DW, WINDOW_LEN) for i in range(3)]
+        self.reset()
+
+    def correlate(self, in_re, in_im, hist_re = None, hist_im = None):
+        """correlates with all three PSS sequences, returns sum_re and sum_im with shape (3, len(in_re))
+
+        hist_re and hist_im are the PSS_LEN - 1 samples before in_re and in_im, oldest first, they are
+        0 after reset. Long inputs use FFT convolution, short ones one matrix multiplication per block.
+        """
+        num = len(in_re)
+        hist_len = self.PSS_LEN - 1
+        if hist_re is None:
+            hist_re = hist_im = np.zeros(hist_len, np.int64)
+        in_re = np.concatenate((hist_re, in_re))
+        in_im = np.concatenate((hist_im, in_im))
+        if self.use_fft and num >= self.min_fft_len:
+            return self.correlate_fft(in_re, in_im)
+        # window rows are ordered like the HDL shift register, newest sample first
+        win_re = sliding_window_view(in_re, self.PSS_LEN)[:, ::-1]
+        win_im = sliding_window_view(in_im, self.PSS_LEN)[:, ::-1]
+        taps_matrix = self.taps_matrix.astype(self.matmul_dtype)
+        sums = np.empty((num, 6), np.int64)
+        for start in range(0, num, self.block_len):
+            stop = min(start + self.block_len, num)
+            block = np.hstack((win_re[start:stop], win_im[start:stop])).astype(self.matmul_dtype)
+            sums[start:stop] = block @ taps_matrix
+        return sums[:, :3].T, sums[:, 3:].T
+
+    def correlate_fft(self, in_re, in_im):
+        """overlap-save FFT convolution with all three PSS sequences, in_re and in_im start with
+        PSS_LEN - 1 samples of history, returns sum_re and sum_im with shape (3, len(in_re) - PSS_LEN + 1)"""
+        hist_len = self.PSS_LEN - 1
+        fft_len = min(scipy.fft.next_fast_len(len(in_re)), self.fft_len)
+        if fft_len not in self.taps_fft:
+            self.taps_fft[fft_len] = scipy.fft.fft(self.corr_taps, fft_len, axis = 1)
+        taps_fft = self.taps_fft[fft_len]
+        step = fft_len - hist_len
+        num = len(in_re) - hist_len
+        num_frames = -(-num // step)
+        x = np.zeros(num_frames * step + hist_len, complex)
+        x.real[:len(in_re)] = in_re
+        x.imag[:len(in_im)] = in_im
+        frames = sliding_window_view(x, fft_len)[::step]
+        blocks = []
+        frames_per_block = max(self.block_len // step, 1)
+        for start in range(0, num_frames, frames_per_block):
+            stop = min(start + frames_per_block, num_frames)
+            X = scipy.fft.fft(frames[start:stop], axis = 1)
+            y = scipy.fft.ifft(X[np.newaxis] * taps_fft[:, np.newaxis], axis = 2, overwrite_x = True)[:, :, hist_len:]
+            blocks.append(y.reshape(3, -1))
+        # a single frame is used without copying it
+        sums = (blocks[0] if len(blocks) == 1 else np.concatenate(blocks, axis = 1))[:, :num]
+        return np.rint(sums.real).astype(np.int64), np.rint(sums.imag).astype(np.int64)
+
+    def partial_sums(self, N_id_2):
+        """C0_o and C1_o of correlator N_id_2 for the newest sample in the shift register as complex values,
+        C0 + C1 is the correlation result, their phase difference is used for the CFO estimation"""
+        # newest sample first, like the HDL shift register
+        in_re = self.hist_re[::-1]
+        in_im = self.hist_im[::-1]
+        taps_re = self.correlators[N_id_2].taps_re
+        taps_im = self.correlators[N_id_2].taps_im
+        prod_re = in_re * taps_re - in_im * taps_im
+        prod_im = in_re * taps_im + in_im * taps_re
+        C0 = complex(prod_re[self.C0_mask].sum(), prod_im[self.C0_mask].sum())
+        C1 = complex(prod_re[~self.C0_mask].sum(), prod_im[~self.C0_mask].sum())
+        return C0, C1
+
+    def process(self, samples, tvalid = None, mode = SEARCH, requested_N_id_2 = 0):
+        """block mode, processes samples starting from reset state
+
+        samples can be packed IN_DW words or complex values, tvalid optionally gives s_axis_in_tvalid.
+        Returns (correlation, peak_valid, N_id_2) with one entry per input sample, where correlation has
+        shape (3, len(samples)) and contains the output of correlator N_id_2 = 0, 1, 2. peak_valid is
+        N_id_2_valid_o and N_id_2 is N_id_2_o after the decision for that sample.
+        """
+        self.reset()
+        return self.process_chunk(samples, tvalid, mode, requested_N_id_2)[:3]
+
+    def process_chunk(self, samples, tvalid = None, mode = SEARCH, requested_N_id_2 = 0):
+        """streaming mode, works like process() but keeps the correlator history, the peak detectors and
+        N_id_2_o for the next call, so that the mode can change between calls
+
+        Returns (correlation, peak_valid, N_id_2, score), score is the score of the peak detector of the
+        detected N_id_2 and 0 for samples without peak_valid. Call reset() to start a new stream.
+        """
+        in_re, in_im = self.correlators[0].unpack_samples(samples)
+        if tvalid is None:
+            valid = np.ones(len(in_re), bool)
+        else:
+            valid = np.asarray(tvalid, bool)
+        correlation = np.zeros((3, len(in_re)), np.int64)
+        peak_valid = np.zeros(len(in_re), bool)
+        N_id_2 = np.full(len(in_re), self.N_id_2, np.int64)
+        score = np.zeros(len(in_re), np.int64)
+        if mode == PAUSE:
+            # correlators are disabled, the shift registers keep their content
+            return correlation, peak_valid, N_id_2, score
+
+        in_re = in_re[valid]
+        in_im = in_im[valid]
+        sum_re, sum_im = self.correlate(in_re, in_im, self.hist_re[1:], self.hist_im[1:])
+        self.hist_re = np.concatenate((self.hist_re, in_re[-self.PSS_LEN:]))[-self.PSS_LEN:]
+        self.hist_im = np.concatenate((self.hist_im, in_im[-self.PSS_LEN:]))[-self.PSS_LEN:]
+        result = self.correlators[0].filter_result(sum_re, sum_im)
+        peaks, scores = zip(*[self.peak_detectors[i].process_chunk(result[i]) for i in range(3)])
+        peaks = np.stack(peaks)
+        # peaks are rare, the decisions are only made for samples where any peak detector fired
+        idx = np.flatnonzero(peaks.any(axis = 0))
+        peaks = peaks[:, idx]
+        one_hot = peaks.sum(axis = 0) == 1
+        if mode == SEARCH:
+            detected = one_hot
+            # like in the HDL, a peak from correlator 0 does not update N_id_2_o
+            update = np.where(one_hot & peaks[1], 1, np.where(one_hot & peaks[2], 2, -1))
+        else:
+            detected = one_hot & peaks[requested_N_id_2]
+            update = np.where(detected, requested_N_id_2, -1)
+        # N_id_2_o keeps its value until the next update
+        update_idx = idx[update >= 0]
+        N_id_2_valid = np.repeat(np.concatenate(([self.N_id_2], update[update >= 0])),
+                                 np.diff(np.concatenate(([0], update_idx, [len(in_re)]))))
+        if len(N_id_2_valid):
+            self.N_id_2 = int(N_id_2_valid[-1])
+        detected_idx = idx[detected]
+        detected_score = np.stack(scores)[N_id_2_valid[detected_idx], detected_idx]
+
+        if valid.all():
+            correlation = result
+            peak_valid[detected_idx] = True
+            score[detected_idx] = detected_score
+            return correlation, peak_valid, N_id_2_valid, score
+        valid_idx = np.flatnonzero(valid)
+        correlation[:, valid] = result
+        peak_valid[valid_idx[detected_idx]] = True
+        score[valid_idx[detected_idx]] = detected_score
+        N_id_2[valid] = N_id_2_valid
+        # samples with tvalid = 0 do not change N_id_2_o
+        last_valid = np.maximum.accumulate(np.where(valid, np.arange(len(valid)), -1))
+        N_id_2 = np.where(last_valid >= 0, N_id_2[np.maximum(last_valid, 0)], N_id_2)
+        return correlation, peak_valid, N_id_2, score
+
+    def reset(self):
+        # the last PSS_LEN samples in the correlator shift register, oldest first
+        self.hist_re = np.zeros(self.PSS_LEN, np.int64)
+        self.hist_im = np.zeros(self.PSS_LEN, np.int64)
+        # N_id_2_o is 0 after reset
+        self.N_id_2 = 0
+        for peak_detector in self.peak_detectors:
+            peak_detector.reset()
@@ -0,0 +1,85 @@
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import cache
+import fixed_point
+
+# Conversion between complex PSS taps, the packed PSS_LOCAL parameter and tap files for $readmemh.
+# Every tap is a TAP_DW wide word with the real part in the lower and the imaginary part in the upper half.
+
+def calc_taps(N_id_2, PSS_LEN = 128, TAP_DW = 32, scale = None, rounding = 'trunc'):
+    """time domain PSS taps scaled to integers, the result is cached on disk
+
+    scale defaults to 2 ** (TAP_DW // 2 - 1), rounding is 'trunc' (like int()) or 'round' (like np.round)
+    """
+    if scale is None:
+        scale = 2 ** (TAP_DW // 2 - 1)
+    if rounding not in ('trunc', 'round'):
+        raise ValueError(f'unknown rounding {rounding}')
+
+    def calc():
+        import py3gpp
+        PSS = np.zeros(PSS_LEN, 'complex')
+        PSS[0:-1] = py3gpp.nrPSS(N_id_2)
+        taps = np.fft.ifft(np.fft.fftshift(PSS))
+        taps /= max(taps.real.max(), taps.imag.max())
+        taps *= scale
+        quantize = np.trunc if rounding == 'trunc' else np.round
+        return quantize(taps.real) + 1j * quantize(taps.imag)
+
+    key = {'N_id_2': int(N_id_2), 'PSS_LEN': int(PSS_LEN), 'TAP_DW': int(TAP_DW), 'scale': float(scale), 'rounding': rounding}
+    return cache.cached_array('PSS_taps', key, calc)
+
+def _powers(base, num):
+    """base ** k for k = 0 .. num - 1, as python ints if they do not fit into int64 like in fixed_point"""
+    if (base ** (num - 1)).bit_length() > 63:
+        return np.array([base ** k for k in range(num)], object)
+    return np.int64(base) ** np.arange(num, dtype = np.int64)
+
+def to_words(taps, TAP_DW):
+    """packs complex taps into TAP_DW wide words"""
+    return np.asarray(fixed_point.pack_complex(taps, TAP_DW))
+
+def from_words(words, TAP_DW):
+    """unpacks TAP_DW wide words into complex taps"""
+    return np.asarray(fixed_point.unpack_complex(words, TAP_DW))
+
+def pack(taps, TAP_DW):
+    """packs complex taps into the PSS_LOCAL parameter, tap 0 is in the lowest bits"""
+    words = to_words(taps, TAP_DW)
+    if TAP_DW > 63:
+        bits = (words[:, np.newaxis].astype(object) >> np.arange(TAP_DW).astype(object)) & 1
+    else:
+        bits = (words.astype(np.uint64)[:, np.newaxis] >> np.arange(TAP_DW, dtype = np.uint64)) & np.uint64(1)
+    return int.from_bytes(np.packbits(bits.astype(np.uint8).ravel(), bitorder = 'little').tobytes(), 'little')
+
+def unpack(PSS_LOCAL, PSS_LEN, TAP_DW):
+    """unpacks the PSS_LOCAL parameter into complex taps"""
+    num_bytes = (PSS_LEN * TAP_DW + 7) // 8
+    bits = np.unpackbits(np.frombuffer(int(PSS_LOCAL).to_bytes(num_bytes, 'little'), np.uint8), bitorder = 'little')
+    bits = bits[:PSS_LEN * TAP_DW].reshape(PSS_LEN, TAP_DW).astype(np.int64)
+    return from_words(bits @ _powers(2, TAP_DW), TAP_DW)
+
+def PSS_LOCAL(N_id_2, PSS_LEN = 128, TAP_DW = 32, scale = None, rounding = 'trunc'):
+    """PSS_LOCAL parameter for the PSS_correlator"""
+    return pack(calc_taps(N_id_2, PSS_LEN, TAP_DW, scale, rounding), TAP_DW)
+
+def write_tap_file(filename, taps, TAP_DW):
+    """writes a tap file that can be read with $readmemh"""
+    np.savetxt(filename, to_words(taps, TAP_DW), fmt = '%x', delimiter = ' ')
+
+def read_tap_file(filename, TAP_DW):
+    """reads a tap file that was written for $readmemh"""
+    with open(filename) as f:
+        hex_words = np.array(f.read().split())
+    # convert all hex strings at once, digits are looked up from the ascii codes
+    num_digits = max(int(np.char.str_len(hex_words).max()), 1)
+    codes = np.char.zfill(np.char.lower(hex_words), num_digits).view(np.uint32).reshape(len(hex_words), num_digits)
+    lut = np.zeros(128, np.int64)
+    lut[ord('0'):ord('9') + 1] = np.arange(10)
+    lut[ord('a'):ord('f') + 1] = np.arange(10, 16)
+    digits = lut[codes]
+    words = digits @ _powers(16, num_digits)[::-1]
+    return from_words(words, TAP_DW)
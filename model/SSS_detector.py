@@ -0,0 +1,73 @@
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import cache
+
+SSS_LEN = 127
+N_ID_1_MAX = 335
+N_ID_MAX = 1007
+
+def m_sequences():
+    """the two m-sequences x0 and x1 from 38.211 7.4.2.3.1, like the LFSRs in the HDL"""
+    x0 = np.zeros(SSS_LEN, np.int64)
+    x1 = np.zeros(SSS_LEN, np.int64)
+    x0[0] = 1
+    x1[0] = 1
+    for i in range(SSS_LEN - 7):
+        x0[i + 7] = (x0[i + 4] + x0[i]) % 2
+        x1[i + 7] = (x1[i + 1] + x1[i]) % 2
+    return x0, x1
+
+def calc_SSS_table():
+    x0, x1 = m_sequences()
+    N_id = np.arange(N_ID_MAX + 1)
+    N_id_1 = N_id // 3
+    N_id_2 = N_id % 3
+    m0 = 15 * (N_id_1 // 112) + 5 * N_id_2
+    m1 = N_id_1 % 112
+    n = np.arange(SSS_LEN)
+    d = (1 - 2 * x0[(n + m0[:, np.newaxis]) % SSS_LEN]) * (1 - 2 * x1[(n + m1[:, np.newaxis]) % SSS_LEN])
+    return d.astype(np.int8)
+
+def SSS_table():
+    """BPSK SSS sequences for all N_id, row N_id is nrSSS(N_id), the table is cached on disk"""
+    return cache.cached_array('SSS_table', {'SSS_LEN': SSS_LEN, 'N_ID_MAX': N_ID_MAX}, calc_SSS_table)
+
+def hard_bits(samples):
+    """BPSK demodulation like in front of the SSS_detector, a bit is 1 if the real part is not negative"""
+    return (np.real(samples) >= 0).astype(np.int64)
+
+class Model:
+    def __init__(self):
+        # rows are ordered by N_id_1, then N_id_2, float32 matmul is exact because all sums are below 2 ** 24
+        self.table = SSS_table().astype(np.float32).reshape(N_ID_1_MAX + 1, 3, SSS_LEN)
+
+    def correlate(self, bits, N_id_2):
+        """correlation of every bit vector with all N_id_1 in one matrix multiplication
+
+        bits has shape (num, SSS_LEN) or (SSS_LEN,), N_id_2 is a scalar or has one entry per bit vector.
+        Returns the accumulator values with shape (num, N_ID_1_MAX + 1). Like in the HDL, the last
+        bit is not compared.
+        """
+        bits = np.atleast_2d(np.asarray(bits, np.int64))
+        N_id_2 = np.broadcast_to(np.asarray(N_id_2, np.int64), (len(bits),))
+        acc = (2 * bits[:, :SSS_LEN - 1] - 1).astype(np.float32) @ self.table[:, :, :SSS_LEN - 1].reshape(-1, SSS_LEN - 1).T
+        return acc.reshape(len(bits), N_ID_1_MAX + 1, 3)[np.arange(len(bits)), :, N_id_2].astype(np.int64)
+
+    def process(self, bits, N_id_2):
+        """detects N_id_1 for every bit vector, returns (N_id_1, N_id, metric) with one entry per bit vector
+
+        metric is the highest absolute accumulator value. Like in the HDL the first N_id_1 with the highest
+        metric wins, and if all accumulators are 0 the outputs keep the result of the previous detection.
+        """
+        N_id_2 = np.broadcast_to(np.asarray(N_id_2, np.int64), (len(np.atleast_2d(bits)),))
+        abs_acc = np.abs(self.correlate(bits, N_id_2))
+        best = np.argmax(abs_acc, axis = 1)
+        metric = abs_acc[np.arange(len(best)), best]
+        # outputs are 0 after reset
+        found = np.maximum.accumulate(np.where(metric > 0, np.arange(len(metric)), -1))
+        N_id_1 = np.where(found >= 0, best[np.maximum(found, 0)], 0)
+        N_id = np.where(found >= 0, 3 * N_id_1 + N_id_2[np.maximum(found, 0)], 0)
+        return N_id_1, N_id, metric
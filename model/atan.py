@@ -0,0 +1,22 @@
+import numpy as np
+
+
+class Model:
+    def __init__(self, INPUT_WIDTH, OUTPUT_WIDTH):
+        self.INPUT_WIDTH = int(INPUT_WIDTH)
+        self.OUTPUT_WIDTH = int(OUTPUT_WIDTH)
+        self.MAX_LUT_IN_VAL = 2 ** self.INPUT_WIDTH - 1
+        self.MAX_LUT_OUT_VAL = 2 ** self.OUTPUT_WIDTH - 1
+
+        self.lut = self.calc_lut()
+
+    def calc_lut(self):
+        # same calculation as the initial block in the HDL, including the inaccurate pi,
+        # assigning a real to a reg rounds half away from zero and drops the bits that do not fit
+        arg = np.arange(self.MAX_LUT_IN_VAL + 1) / self.MAX_LUT_IN_VAL
+        lut = np.floor(np.arctan(arg) / (3.14159 / 4) * self.MAX_LUT_OUT_VAL + 0.5).astype(np.int64)
+        return lut & self.MAX_LUT_OUT_VAL
+
+    def calc(self, arg):
+        """angle_o for arg_i, works on whole arrays, arg_i = 2 ** INPUT_WIDTH - 1 means 1"""
+        return self.lut[np.asarray(arg).astype(np.int64) & self.MAX_LUT_IN_VAL]
@@ -0,0 +1,59 @@
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import atan
+import div
+import fixed_point
+
+class Model:
+    def __init__(self, INPUT_WIDTH, LUT_DW, OUTPUT_WIDTH):
+        self.INPUT_WIDTH = int(INPUT_WIDTH)
+        self.LUT_DW = int(LUT_DW)
+        self.OUTPUT_WIDTH = int(OUTPUT_WIDTH)
+        self.ATAN_OUT_DW = self.OUTPUT_WIDTH - 3
+        # the output range -2 ** (OUTPUT_WIDTH - 1) .. 2 ** (OUTPUT_WIDTH - 1) corresponds to -pi .. pi
+        self.PI_HALF = 2 ** (self.OUTPUT_WIDTH - 1) - 1
+        self.PI_QUARTER = 2 ** (self.OUTPUT_WIDTH - 2) - 1
+        self.div = div.Model(self.INPUT_WIDTH + self.LUT_DW, self.LUT_DW, PIPELINED = 1)
+        self.atan = atan.Model(self.LUT_DW, self.ATAN_OUT_DW)
+        # one cycle for the input stage, the pipelined divider, then LUT, quadrant correction and output register
+        self.LATENCY = self.div.LATENCY + 4
+
+    def calc(self, numerator, denominator):
+        """bit exact angle_o for signed INPUT_WIDTH bit numerator_i and denominator_i, works on whole arrays"""
+        numerator = np.asarray(fixed_point.sign_extend(numerator, self.INPUT_WIDTH))
+        denominator = np.asarray(fixed_point.sign_extend(denominator, self.INPUT_WIDTH))
+        # abs() of the most negative number overflows into the sign bit, it stays correct as unsigned value
+        abs_num = np.abs(numerator)
+        abs_den = np.abs(denominator)
+        inv_div_result = abs_den <= abs_num
+        div_num = np.where(inv_div_result, abs_den, abs_num)
+        div_den = np.where(inv_div_result, abs_num, abs_den)
+        # (numerator << LUT_DW) - 1 wraps around for numerator = 0, like in the HDL
+        numerator_wide = ((div_num << self.LUT_DW) - 1) & ((1 << (self.INPUT_WIDTH + self.LUT_DW)) - 1)
+        angle = self.atan.calc(self.div.calc(numerator_wide, div_den))
+
+        angle = np.where(inv_div_result, self.PI_QUARTER - angle, angle)
+        num_pos = numerator >= 0
+        den_pos = denominator >= 0
+        angle = np.where(num_pos & ~den_pos, self.PI_HALF - angle, angle)
+        angle = np.where(~num_pos & ~den_pos, angle - self.PI_HALF, angle)
+        angle = np.where(~num_pos & den_pos, -angle, angle)
+        return fixed_point.sign_extend(angle, self.OUTPUT_WIDTH)
+
+    def process(self, numerator, denominator, valid):
+        """cycle accurate block mode, atan2 accepts a new input in every clock cycle
+
+        numerator, denominator and valid are numerator_i, denominator_i and valid_i for every clock cycle.
+        Returns (angle, valid_out) for every clock cycle, extended by LATENCY cycles. Index k holds angle_o
+        and valid_o after the clock edge that samples input k, angle is only meaningful where valid_out is set.
+        """
+        valid = np.asarray(valid, bool)
+        in_cycles = np.flatnonzero(valid)
+        angle = np.zeros(len(valid) + self.LATENCY, np.int64)
+        valid_out = np.zeros(len(valid) + self.LATENCY, bool)
+        angle[in_cycles + self.LATENCY] = self.calc(np.asarray(numerator)[in_cycles], np.asarray(denominator)[in_cycles])
+        valid_out[in_cycles + self.LATENCY] = True
+        return angle, valid_out
@@ -0,0 +1,50 @@
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+
+# results that are expensive to calculate but only depend on a few parameters are stored as .npy files
+# in this directory, it can be changed with the OPEN5G_CACHE_DIR environment variable
+DEFAULT_CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '.cache'))
+
+def cache_dir():
+    path = os.environ.get('OPEN5G_CACHE_DIR', DEFAULT_CACHE_DIR)
+    os.makedirs(path, exist_ok = True)
+    return path
+
+def cache_file(name, key):
+    """returns the cache filename for the parameters in the dict key"""
+    digest = hashlib.sha1(json.dumps(key, sort_keys = True).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir(), f'{name}_{digest}.npy')
+
+def save(filename, data):
+    # write to a temporary file first, so that parallel test runs never see half written files
+    fd, tmp_filename = tempfile.mkstemp(dir = os.path.dirname(filename), suffix = '.npy')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, data)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        os.unlink(tmp_filename)
+        raise
+
+def cached_array(name, key, calc, mmap = False):
+    """returns the array calculated by calc(), it is only calculated if it is not already in the cache
+
+    key is a dict with all parameters that the result depends on. With mmap = True the cached file is
+    memory mapped read only instead of being loaded.
+    """
+    filename = cache_file(name, key)
+    mmap_mode = 'r' if mmap else None
+    if os.path.exists(filename):
+        try:
+            return np.load(filename, mmap_mode = mmap_mode)
+        except (ValueError, OSError):
+            # broken cache file, calculate it again
+            pass
+    data = np.asarray(calc())
+    save(filename, data)
+    if mmap:
+        return np.load(filename, mmap_mode = mmap_mode)
+    return data
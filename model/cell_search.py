@@ -0,0 +1,105 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import fir_decimator
+import receiver
+import sigmf_reader
+
+# Offline cell search over SigMF recordings with the receiver model, for example
+#   python model/cell_search.py tests/30720KSPS_dl_signal.sigmf-meta --max-workers 8
+# prints every SSB that the receiver detects and the throughput of the search.
+#
+# Measured on one core with 1 s of a 30.72 MSPS recording, the search runs at about 10 MSPS or 0.34 x real time with
+# one worker. The workers only run the receiver, the recording is read, decimated and quantized in the main process
+# at about 0.9 x real time, which limits the search with any number of workers.
+
+def recording_peak(recording, block_len):
+    """largest absolute value of a component in the recording, scaled like read_samples()"""
+    peak = 0
+    for start in range(0, len(recording), block_len):
+        data = recording.samples[start:start + block_len]
+        # max() and min() instead of abs(), which overflows for the most negative value in the type of the recording
+        for part in ('re', 'im'):
+            peak = max(peak, int(data[part].max()), -int(data[part].min()))
+    return peak * 2.0 ** -(recording.BITS - 1)
+
+def quantized_blocks(recording, dec_factor, IN_DW, block_len, scale = 0.8):
+    """reads a recording in blocks of block_len samples and yields them decimated to the receiver sample rate
+    as complex values with integer parts
+
+    The gain is set in a first pass over the recording, so that its largest component is scale * full scale of
+    IN_DW bits. So the samples do not depend on block_len, decimated samples that get larger are saturated like an ADC.
+    """
+    max_value = 2 ** (IN_DW // 2 - 1) - 1
+    decimator = fir_decimator.Decimator(dec_factor) if dec_factor > 1 else None
+    peak = recording_peak(recording, block_len)
+    gain = scale * max_value / peak if peak > 0 else 1
+    for start in range(0, len(recording) + 1, block_len):
+        count = min(block_len, len(recording) - start)
+        samples = recording.read_samples(start, count) if count > 0 else np.zeros(0, np.complex64)
+        if decimator is not None:
+            samples = decimator.process_chunk(samples)
+            if start + block_len >= len(recording):
+                samples = np.concatenate((samples, decimator.flush()))
+        if len(samples):
+            # truncated towards 0 like astype(np.int64), but without integer temporaries
+            quantized = np.empty(len(samples), np.complex128)
+            quantized.real = np.trunc(np.clip(samples.real * gain, -max_value, max_value))
+            quantized.imag = np.trunc(np.clip(samples.imag * gain, -max_value, max_value))
+            yield quantized
+
+def search(filename, max_workers = None, block_duration = 1.0, **params):
+    """cell search over one SigMF recording, params are the parameters of receiver.Model
+
+    Returns (SSBs, dec_factor, num_samples) where SSBs have receiver.SSB_DTYPE with positions at the receiver sample rate.
+    """
+    recording = sigmf_reader.Recording(filename)
+    model = receiver.Model(**params)
+    dec_factor = recording.sample_rate / model.SAMPLE_RATE
+    if dec_factor < 1 or dec_factor != int(dec_factor):
+        raise ValueError(f'sample rate {recording.sample_rate} is not a multiple of the receiver sample rate {model.SAMPLE_RATE}')
+    dec_factor = int(dec_factor)
+    block_len = max(int(block_duration * recording.sample_rate), 1)
+    blocks = quantized_blocks(recording, dec_factor, model.IN_DW, block_len)
+    _, SSBs, _ = receiver.merge(receiver.process_segments(model.segments(blocks), max_workers, **params))
+    return SSBs, dec_factor, len(recording)
+
+def main(args = None):
+    parser = argparse.ArgumentParser(description = 'cell search over SigMF recordings with the receiver model')
+    parser.add_argument('files', nargs = '+', help = '.sigmf-meta or .sigmf-data files')
+    parser.add_argument('--max-workers', type = int, default = None, help = 'number of worker processes, default is one per core')
+    parser.add_argument('--block', type = float, default = 1.0, help = 'seconds of the recording that are read at once')
+    parser.add_argument('--NFFT', type = int, default = 8, help = 'the receiver runs at 3.84 MSPS * 2 ** NFFT / 256')
+    parser.add_argument('--IN_DW', type = int, default = 32)
+    parser.add_argument('--ALGO', type = int, default = 0, help = 'CFO estimation algorithm of the PSS detector')
+    args = parser.parse_args(args)
+    params = {'NFFT': args.NFFT, 'IN_DW': args.IN_DW, 'ALGO': args.ALGO}
+
+    total_samples = 0
+    total_time = 0
+    print(f'{"file":30s} {"offset":>10s} {"time_ms":>10s} {"N_id_2":>6s} {"N_id_1":>6s} {"N_id":>5s} {"ibar_SSB":>8s} '
+          f'{"CFO_Hz":>9s} {"score":>12s}')
+    for filename in args.files:
+        start = time.perf_counter()
+        SSBs, dec_factor, num_samples = search(filename, args.max_workers, args.block, **params)
+        elapsed = time.perf_counter() - start
+        total_samples += num_samples
+        total_time += elapsed
+        name = os.path.basename(sigmf_reader.base_name(filename))
+        sample_rate = sigmf_reader.Recording(filename).sample_rate
+        for SSB in SSBs:
+            # offset is the first sample of the PBCH symbol after the PSS in samples of the recording
+            offset = int(SSB['pos']) * dec_factor
+            print(f'{name:30s} {offset:10d} {offset / sample_rate * 1e3:10.3f} {SSB["N_id_2"]:6d} {SSB["N_id_1"]:6d} '
+                  f'{SSB["N_id"]:5d} {SSB["ibar_SSB"]:8d} {SSB["CFO"]:9.1f} {SSB["score"]:12d}')
+        print(f'{name}: {len(SSBs)} SSBs, {num_samples} samples in {elapsed:.2f} s, {num_samples / elapsed / 1e6:.2f} MSPS, '
+              f'{num_samples / sample_rate / elapsed:.2f} x real time', file = sys.stderr)
+    if total_time > 0:
+        print(f'total: {total_samples} samples in {total_time:.2f} s, {total_samples / total_time / 1e6:.2f} MSPS', file = sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import atan2
+import complex_multiplier
+import dds
+import fixed_point
+import gold_sequence
+
+PBCH_DMRS_LEN = gold_sequence.PBCH_DMRS_LEN
+SYMS_PER_PBCH = 3
+# number of received samples that are used for the ibar_SSB detection, counted from the start of the PBCH
+DET_IBAR_LEN = 255
+
+def calc_PBCH_DMRS(N_id):
+    """PBCH DMRS for all 8 ibar_SSB as 2 bit values like in the HDL, returns shape (8, PBCH_DMRS_LEN)
+
+    bit 1 is c(2m) and gives the sign of the real part, bit 0 is c(2m + 1) and gives the sign of the imaginary part
+    """
+    return np.asarray(gold_sequence.PBCH_DMRS_table()[N_id], np.int64)
+
+def DMRS_symbols(PBCH_DMRS):
+    """converts the 2 bit PBCH DMRS values into complex QPSK symbols without 1 / sqrt(2) scaling"""
+    PBCH_DMRS = np.asarray(PBCH_DMRS, np.int64)
+    return (1 - 2 * (PBCH_DMRS >> 1)) + 1j * (1 - 2 * (PBCH_DMRS & 1))
+
+class Model:
+    def __init__(self, IN_DW = 32):
+        self.IN_DW = int(IN_DW)
+        self.OUT_DW = self.IN_DW
+        self.NFFT = 8
+        self.FFT_LEN = 2 ** self.NFFT
+        self.ZERO_CARRIERS = 16
+        # number of subcarriers per symbol
+        self.SC_LEN = self.FFT_LEN - self.ZERO_CARRIERS
+        self.PHASE_DW = 18
+        self.DDS_OUT_DW = 32
+        MAX_PHASE = 2 ** (self.PHASE_DW - 1) - 1
+        self.DEG45 = MAX_PHASE // 4
+        self.DEG135 = 3 * self.DEG45
+        # pilot angle for the 2 bit PBCH DMRS values 0b00, 0b01, 0b10, 0b11
+        self.pilot_angles = np.array([self.DEG45, -self.DEG45, self.DEG135, -self.DEG135], np.int64)
+        # the DMRS correlators are $clog2(120) + 2 bits wide
+        self.CORR_DW = int(np.ceil(np.log2(120))) + 2
+
+        self.atan2 = atan2.Model(self.IN_DW // 2, 14, self.PHASE_DW)
+        self.dds = dds.Model(self.PHASE_DW, self.DDS_OUT_DW // 2, LUT_DW = 16, USE_TAYLOR = 0)
+        self.multiplier = complex_multiplier.Model(self.DDS_OUT_DW // 2, self.IN_DW // 2, self.IN_DW // 2, GROWTH_BITS = -2)
+        self.N_id = 0
+        self.PBCH_DMRS = calc_PBCH_DMRS(0)
+        self.reset()
+
+    def set_N_id(self, N_id):
+        """like N_id_valid_i, generates the PBCH DMRS for all ibar_SSB"""
+        self.N_id = int(N_id)
+        self.PBCH_DMRS = calc_PBCH_DMRS(self.N_id)
+
+    def unpack(self, samples):
+        samples = np.asarray(samples)
+        if np.iscomplexobj(samples):
+            return samples.real.astype(np.int64), samples.imag.astype(np.int64)
+        return fixed_point.unpack_iq(samples, self.IN_DW)
+
+    def pilot_mask(self):
+        """(SYMS_PER_PBCH, SC_LEN) masks of pilot and data subcarriers that are used from a PBCH burst,
+        in the 2nd symbol the subcarriers 48 .. 191 belong to the SSS and are skipped"""
+        SC = np.arange(self.SC_LEN)
+        used = np.ones((SYMS_PER_PBCH, self.SC_LEN), bool)
+        used[1, 48:192] = False
+        pilot = ((SC - self.N_id) % 4 == 0) & used
+        return pilot, used & ~pilot
+
+    def correlate_ibar(self, samples):
+        """DMRS correlation of the first DET_IBAR_LEN samples of every PBCH burst with all 8 ibar_SSB
+
+        samples has shape (num, DET_IBAR_LEN) or longer. Returns (corr, corr_rot) with shape (num, 8),
+        corr_rot is the correlation of the 90 degree rotated input.
+        """
+        re, im = self.unpack(np.atleast_2d(samples)[:, :DET_IBAR_LEN])
+        pilot_idx = np.flatnonzero((np.arange(DET_IBAR_LEN) - self.N_id) % 4 == 0)
+        re = re[:, pilot_idx]
+        im = im[:, pilot_idx]
+        # hard BPSK decisions, bit 1 is the sign of the real part and bit 0 the sign of the imaginary part
+        demod = np.stack(((im < 0), (re < 0)), axis = -1).astype(np.int64)
+        demod_rot = np.stack(((re < 0), (im >= 0)), axis = -1).astype(np.int64)
+        DMRS = self.PBCH_DMRS[:, :len(pilot_idx)]
+        DMRS = np.stack((DMRS & 1, DMRS >> 1), axis = -1)
+        # +1 for every matching bit, -1 otherwise
+        corr = np.einsum('nmk,imk->ni', 1 - 2 * demod, 1 - 2 * DMRS)
+        corr_rot = np.einsum('nmk,imk->ni', 1 - 2 * demod_rot, 1 - 2 * DMRS)
+        return corr, corr_rot
+
+    def detect_ibar(self, samples):
+        """detects ibar_SSB for a block of PBCH bursts, samples has shape (num, DET_IBAR_LEN) or longer
+
+        Returns (ibar_SSB, corr) with one entry per burst. Like in the HDL, the correlators for the rotated
+        input are not cleared after a detection, they keep accumulating over consecutive bursts.
+        """
+        corr, corr_rot = self.correlate_ibar(samples)
+        corr = fixed_point.sign_extend(corr, self.CORR_DW)
+        corr_rot = np.asarray(fixed_point.sign_extend(self.DMRS_corr_rot + np.cumsum(corr_rot, axis = 0), self.CORR_DW))
+        if len(corr_rot):
+            self.DMRS_corr_rot = corr_rot[-1]
+        # abs_DMRS_corr() discards the MSB
+        abs_mask = (1 << (self.CORR_DW - 1)) - 1
+        metric = np.maximum(np.abs(corr) & abs_mask, np.abs(corr_rot) & abs_mask)
+        # the first ibar_SSB with the highest metric wins
+        ibar_SSB = np.argmax(metric, axis = 1)
+        return ibar_SSB, metric[np.arange(len(ibar_SSB)), ibar_SSB]
+
+    def equalize(self, bursts, ibar_SSB):
+        """phase correction of PBCH bursts with shape (num, SYMS_PER_PBCH, SC_LEN) like in the HDL
+
+        The correction angle of every pilot is angle(pilot) - angle(received) and it is applied piecewise
+        constant, one angle for every 3 data subcarriers. Returns the corrected data subcarriers with shape
+        (num, 432) as complex values.
+        """
+        re, im = self.unpack(bursts)
+        num = len(re)
+        pilot, data = self.pilot_mask()
+        pilot = pilot.ravel()
+        data = data.ravel()
+        re = re.reshape(num, -1)
+        im = im.reshape(num, -1)
+
+        SC_phase = self.atan2.calc(im[:, pilot], re[:, pilot])
+        pilot_angle = self.pilot_angles[self.PBCH_DMRS[np.asarray(ibar_SSB)[:, np.newaxis], np.arange(pilot.sum())]]
+        corr_angle = fixed_point.sign_extend(-(SC_phase - pilot_angle), self.PHASE_DW)
+        cos, sin = self.dds.calc(corr_angle)
+
+        # the interpolator takes a new angle with every 3rd data sample, because of the different delays of
+        # data and angle path, data sample n is multiplied with angle (n + 1) // 3
+        num_data = data.sum()
+        angle_idx = np.minimum((np.arange(num_data) + 1) // 3, pilot.sum() - 1)
+        out_re, out_im = self.multiplier.multiply_iq(cos[:, angle_idx], sin[:, angle_idx], re[:, data], im[:, data])
+        return out_re + 1j * out_im
+
+    def pass_through(self, symbols):
+        """symbols that are not PBCH symbols, pilot positions are removed and the data is multiplied with angle 0,
+        symbols has shape (num, SC_LEN) and the result has one entry for every data subcarrier"""
+        re, im = self.unpack(np.atleast_2d(symbols))
+        data = (np.arange(self.SC_LEN) - self.N_id) % 4 != 0
+        cos, sin = self.dds.calc(0)
+        out_re, out_im = self.multiplier.multiply_iq(cos, sin, re[:, data], im[:, data])
+        return out_re + 1j * out_im
+
+    def process(self, bursts):
+        """block mode, detects ibar_SSB and equalizes PBCH bursts with shape (num, SYMS_PER_PBCH, SC_LEN)
+
+        Every burst contains the SC_LEN subcarriers of the 3 PBCH symbols, like they are streamed into the HDL
+        with s_axis_in_tuser set on the first sample. Returns (data, ibar_SSB) where data has shape (num, 432)
+        and contains m_axis_out_tdata with m_axis_out_tuser = 1.
+        """
+        bursts = np.asarray(bursts)
+        ibar_SSB, _ = self.detect_ibar(bursts.reshape(len(bursts), -1))
+        return self.equalize(bursts, ibar_SSB), ibar_SSB
+
+    def reset(self):
+        self.DMRS_corr_rot = np.zeros(8, np.int64)
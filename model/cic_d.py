@@ -0,0 +1,201 @@
+import os
+import sys
+import numpy as np
+from math import comb, floor, log2
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import fixed_point
+
+def CIC_RATE(FFT_LEN):
+    """decimation factor of the CIC in the Decimator_* front ends and the receiver, localparam CIC_RATE = FFT_LEN / 128"""
+    return int(FFT_LEN) // 128
+
+def F_sq(j, N, R, M):
+    """sum of the squared impulse response coefficients from stage j to the output (Hogenauer, eq. 16)"""
+    if j <= N:
+        RM = R * M
+        h = [sum((-1) ** l * comb(N, l) * comb(N - j + k - RM * l, k - RM * l) for l in range(k // RM + 1))
+             for k in range((RM - 1) * N + j)]
+        return sum(c * c for c in h)
+    if j <= 2 * N:
+        return comb(2 * (2 * N + 1 - j), 2 * N + 1 - j)
+    return 1
+
+def pruned_bits(N, R, M, INP_DW, OUT_DW):
+    """number of LSBs that are discarded at the output of stage j = 0 .. 2 * N + 1 with Hogenauer pruning
+
+    Stages 1 .. N are the integrators, N + 1 .. 2 * N the combs and 2 * N + 1 is the output register. The
+    truncation noise of every stage is at most that of the output, stages never get wider than the stage before.
+    """
+    B_max = ((R * M) ** N - 1).bit_length() + INP_DW - 1
+    B_out = B_max - OUT_DW + 1
+    # variance of the truncation noise at the output is 2 ** (2 * B_out) / 12
+    log2_sigma_out = B_out + 0.5 * log2(1 / 12)
+    B = [0]
+    for j in range(1, 2 * N + 1):
+        B_j = floor(log2_sigma_out - 0.5 * log2(F_sq(j, N, R, M)) + 0.5 * log2(6 / N))
+        B.append(max(B_j, B[-1]))
+    B.append(B_out)
+    return B
+
+class Model:
+    def __init__(self, INP_DW, OUT_DW, CIC_R, CIC_N, CIC_M = 1, DELAY = None):
+        self.INP_DW = int(INP_DW)
+        self.OUT_DW = int(OUT_DW)
+        self.CIC_R = int(CIC_R)
+        self.CIC_N = int(CIC_N)
+        self.CIC_M = int(CIC_M)
+        # number of input samples that are still in the integrator pipeline when the downsampler takes a sample,
+        # every integrator and the downsampler register their input, so it is CIC_N in the HDL
+        self.DELAY = self.CIC_N if DELAY is None else int(DELAY)
+
+        # gain of the filter is (CIC_R * CIC_M) ** CIC_N, the first integrator is B_MAX bits wide. Every stage drops
+        # the LSBs that are pruned at its input and is B_MAX - B[j] bits wide, the registers are allowed to overflow,
+        # because the combs remove the wrap around again
+        self.B_MAX = self.INP_DW + ((self.CIC_R * self.CIC_M) ** self.CIC_N - 1).bit_length()
+        if self.B_MAX > 63:
+            raise ValueError(f'B_MAX = {self.B_MAX} does not fit into int64')
+        self.B = pruned_bits(self.CIC_N, self.CIC_R, self.CIC_M, self.INP_DW, self.OUT_DW)
+        self.widths = [self.B_MAX - B_j for B_j in self.B[:-1]]
+        # the output are the upper OUT_DW bits of the last comb
+        self.truncate = self.B[-1] - self.B[-2]
+
+        # the last integrators and the first combs that do not prune are merged, like with the noble identity every
+        # comb becomes 1 - z ** -(CIC_R * CIC_M) before the downsampler and cancels one integrator to a moving sum.
+        # q pairs give a FIR filter with ones(CIC_R * CIC_M) convolved q times, the integrator before them only
+        # needs the outputs at the downsampler, which are the running sum of the FIR outputs convolved with
+        # ones(CIC_R). So only the first integrators run at the input rate and the FIR only runs at the output rate.
+        # The register wrap around is modulo a power of 2, so the merged stages give the same bits. B never decreases,
+        # so the stages in between do not prune if the outer ones drop the same number of bits
+        q = 0
+        while q < self.CIC_N - 1 and self.B[self.CIC_N - q - 1] == self.B[self.CIC_N + q + 1]:
+            q += 1
+        self.MERGED = q
+        # integrators that run at the input rate, the next integrator gets the FIR
+        self.FIR_STAGE = self.CIC_N - q
+        fir = np.ones(self.CIC_R, np.int64)
+        for k in range(q):
+            fir = np.convolve(fir, np.ones(self.CIC_R * self.CIC_M, np.int64))
+        self.fir = fir
+        self.reset()
+
+    def prune(self, x, j):
+        """drops the LSBs that stage j discards at its input"""
+        if self.B[j] == self.B[j - 1]:
+            return x
+        return x >> (self.B[j] - self.B[j - 1])
+
+    def decimate(self, data, state):
+        """integrator, downsampler and comb stages starting from the given state,
+        returns the output samples and the new state"""
+        integrators, history, accumulator, combs, count = state
+        x = np.asarray(data).astype(np.int64, copy = False)
+        integrators = integrators.copy()
+        # int64 overflows wrap around modulo 2 ** 64, which includes the wrap around of the narrower registers,
+        # and an arithmetic shift of a wrapped value is the shifted value wrapped to the narrower stage.
+        # So only the state and the output have to be sign extended
+        for k in range(self.FIR_STAGE - 1):
+            x = integrators[k] + np.cumsum(self.prune(x, k + 1))
+            if len(x):
+                integrators[k] = fixed_point.sign_extend(x[-1], self.widths[k + 1])
+
+        # FIR outputs for the inputs that the downsampler takes, this is every CIC_R-th input
+        x = np.concatenate((history, self.prune(x, self.FIR_STAGE)))
+        history = x[len(x) - len(history):]
+        first = (self.CIC_R - 1 - count) % self.CIC_R
+        num = max(-(-(len(data) - first) // self.CIC_R), 0)
+        count = (count + len(data)) % self.CIC_R
+        fir_out = np.zeros(num, np.int64)
+        if num:
+            for i, tap in enumerate(self.fir):
+                start = len(self.fir) - 1 - i + first
+                fir_out += tap * x[start:start + (num - 1) * self.CIC_R + 1:self.CIC_R]
+        j = self.CIC_N + self.MERGED
+        x = accumulator + np.cumsum(fir_out)
+        if len(x):
+            accumulator = fixed_point.sign_extend(x[-1], self.widths[j])
+
+        combs = combs.copy()
+        for k in range(self.MERGED, self.CIC_N):
+            j = self.CIC_N + k + 1
+            x = np.concatenate((combs[k - self.MERGED], self.prune(x, j)))
+            combs[k - self.MERGED] = fixed_point.sign_extend(x[len(x) - self.CIC_M:], self.widths[j])
+            x = x[self.CIC_M:] - x[:-self.CIC_M]
+        if self.truncate >= 0:
+            x = x >> self.truncate
+        else:
+            x = x << -self.truncate
+        return np.asarray(fixed_point.sign_extend(x, self.OUT_DW)), (integrators, history, accumulator, combs, count)
+
+    def process(self, data, tvalid = None):
+        """block mode, decimates the whole input stream starting from reset state
+
+        data are the signed INP_DW bit input samples, tvalid optionally gives s_axis_in_tvalid for every
+        sample. Returns the decimated output samples, there is one output for every CIC_R valid inputs.
+        """
+        data = np.asarray(data)
+        if tvalid is not None:
+            data = data[np.asarray(tvalid, bool)]
+        state = self.initial_state()
+        data = np.concatenate((state.pop(), data))[:len(data)]
+        return self.decimate(data, tuple(state))[0]
+
+    def process_chunk(self, data, tvalid = None):
+        """streaming mode, works like process() but keeps the filter state for the next call
+
+        Concatenating the outputs of consecutive calls gives the same result as calling process() on the
+        concatenated input. Call reset() to start a new stream.
+        """
+        data = np.asarray(data)
+        if tvalid is not None:
+            data = data[np.asarray(tvalid, bool)]
+        # the outputs are emitted with the same input samples as without the pipeline, but they only
+        # contain the inputs up to DELAY samples earlier. The last DELAY samples are still in the pipeline
+        delayed = np.concatenate((self.pending, data))
+        self.pending = delayed[len(delayed) - self.DELAY:]
+        data = delayed[:len(data)]
+        state = (self.integrators, self.history, self.accumulator, self.combs, self.count)
+        out, (self.integrators, self.history, self.accumulator, self.combs, self.count) = self.decimate(data, state)
+        return out
+
+    def initial_state(self):
+        """[integrators, history, accumulator, combs, count, pending] after reset, history are the last inputs of the
+        FIR, accumulator is the output of the last merged comb"""
+        integrators = np.zeros(self.FIR_STAGE - 1, np.int64)
+        history = np.zeros(len(self.fir) - 1, np.int64)
+        combs = np.zeros((self.CIC_N - self.MERGED, self.CIC_M), np.int64)
+        return [integrators, history, 0, combs, 0, np.zeros(self.DELAY, np.int64)]
+
+    def reset(self):
+        self.integrators, self.history, self.accumulator, self.combs, self.count, self.pending = self.initial_state()
+
+class Decimator:
+    """the cic_d instances for the real and imaginary part in the Decimator_* front ends and the receiver"""
+    def __init__(self, IN_DW, FFT_LEN = 256, CIC_N = 3):
+        self.IN_DW = int(IN_DW)
+        self.CIC_RATE = CIC_RATE(FFT_LEN)
+        self.real = Model(self.IN_DW // 2, self.IN_DW // 2, self.CIC_RATE, CIC_N)
+        self.imag = Model(self.IN_DW // 2, self.IN_DW // 2, self.CIC_RATE, CIC_N)
+
+    def unpack_samples(self, samples):
+        """signed IN_DW / 2 bit re and im arrays of packed IN_DW words or complex samples"""
+        samples = np.asarray(samples)
+        if np.iscomplexobj(samples):
+            re, im = fixed_point.complex_iq(samples, self.IN_DW)
+        else:
+            re, im = fixed_point.unpack_iq(samples, self.IN_DW)
+        return np.asarray(re), np.asarray(im)
+
+    def process(self, samples, tvalid = None):
+        """block mode, returns the decimated complex samples like m_axis_cic_tdata"""
+        re, im = self.unpack_samples(samples)
+        return self.real.process(re, tvalid) + 1j * self.imag.process(im, tvalid)
+
+    def process_chunk(self, samples, tvalid = None):
+        """streaming mode, see Model.process_chunk()"""
+        re, im = self.unpack_samples(samples)
+        return self.real.process_chunk(re, tvalid) + 1j * self.imag.process_chunk(im, tvalid)
+
+    def reset(self):
+        self.real.reset()
+        self.imag.reset()
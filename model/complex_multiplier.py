@@ -0,0 +1,46 @@
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import fixed_point
+
+class Model:
+    def __init__(self, OPERAND_WIDTH_A, OPERAND_WIDTH_B, OPERAND_WIDTH_OUT, GROWTH_BITS = 0):
+        self.OPERAND_WIDTH_A = int(OPERAND_WIDTH_A)
+        self.OPERAND_WIDTH_B = int(OPERAND_WIDTH_B)
+        self.OPERAND_WIDTH_OUT = int(OPERAND_WIDTH_OUT)
+        self.GROWTH_BITS = int(GROWTH_BITS)
+        # a * b needs A + B + 1 bits per component, the output keeps the upper OPERAND_WIDTH_OUT bits
+        # GROWTH_BITS < 0 can be used if the operands never reach the worst case
+        self.FULL_WIDTH = self.OPERAND_WIDTH_A + self.OPERAND_WIDTH_B + 1
+        # products that do not fit into int64 are calculated with python ints
+        self.wide = self.FULL_WIDTH > 63
+        self.truncate = max(self.FULL_WIDTH + self.GROWTH_BITS - self.OPERAND_WIDTH_OUT, 0)
+
+    def multiply(self, a, b):
+        """complex product of packed words or complex values a and b, works on whole arrays
+
+        Returns (re, im) as signed OPERAND_WIDTH_OUT bit int64 arrays.
+        """
+        a_re, a_im = self.unpack(a, self.OPERAND_WIDTH_A)
+        b_re, b_im = self.unpack(b, self.OPERAND_WIDTH_B)
+        return self.multiply_iq(a_re, a_im, b_re, b_im)
+
+    def multiply_iq(self, a_re, a_im, b_re, b_im):
+        """like multiply(), but for operands that are already split into signed re and im arrays"""
+        if self.wide:
+            a_re, a_im, b_re, b_im = (np.asarray(x).astype(object) for x in (a_re, a_im, b_re, b_im))
+        re = a_re * b_re - a_im * b_im
+        im = a_re * b_im + a_im * b_re
+        return (fixed_point.sign_extend(fixed_point.truncate(re, self.truncate), self.OPERAND_WIDTH_OUT),
+                fixed_point.sign_extend(fixed_point.truncate(im, self.truncate), self.OPERAND_WIDTH_OUT))
+
+    @staticmethod
+    def unpack(samples, width):
+        samples = np.asarray(samples)
+        if np.iscomplexobj(samples):
+            re, im = fixed_point.complex_iq(samples, 2 * width)
+        else:
+            re, im = fixed_point.unpack_iq(samples, 2 * width)
+        return np.asarray(re), np.asarray(im)
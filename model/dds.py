@@ -0,0 +1,94 @@
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import cache
+import fixed_point
+
+def read_lut_file(filename):
+    """reads a $readmemh file with optional @address lines, like tests/sine_lut_16_16.hex"""
+    with open(filename) as f:
+        tokens = f.read().split()
+    values = {}
+    addr = 0
+    for token in tokens:
+        if token.startswith('@'):
+            addr = int(token[1:], 16)
+        else:
+            values[addr] = int(token, 16)
+            addr += 1
+    lut = np.zeros(max(values) + 1, np.int64)
+    lut[list(values.keys())] = list(values.values())
+    return lut
+
+class Model:
+    def __init__(self, PHASE_DW, OUT_DW, LUT_DW = 16, USE_TAYLOR = 1, USE_LUT_FILE = 0, LUT_FILE = ''):
+        self.PHASE_DW = int(PHASE_DW)
+        self.OUT_DW = int(OUT_DW)
+        self.LUT_DW = int(LUT_DW)
+        self.USE_TAYLOR = int(USE_TAYLOR)
+        # the phase is split into 2 quadrant bits, LUT_DW address bits and the remaining bits for the taylor correction
+        self.TAYLOR_DW = self.PHASE_DW - 2 - self.LUT_DW
+        if self.TAYLOR_DW < 0:
+            raise ValueError('PHASE_DW has to be at least LUT_DW + 2')
+        # 2 * pi in 16 bit fixed point, used to convert the remaining phase bits to radians
+        self.TWO_PI = int(np.round(2 * np.pi * 2 ** 16))
+
+        # quarter sine wave, the table is only created once and then taken from the cache
+        if USE_LUT_FILE:
+            self.lut = read_lut_file(LUT_FILE)
+        else:
+            self.lut = cache.cached_array('sine_lut', {'LUT_DW': self.LUT_DW, 'OUT_DW': self.OUT_DW}, self.calc_lut)
+
+        # the full wave is built from the quarter wave LUT once, so that calc() only needs one lookup
+        quadrant = np.arange(4 << self.LUT_DW) >> self.LUT_DW
+        addr = np.arange(4 << self.LUT_DW) & ((1 << self.LUT_DW) - 1)
+        # cos(x) = sin(pi / 2 - x), the LUT has no entry for pi / 2, which is the maximum value
+        sin_q = self.lut[addr]
+        cos_q = np.where(addr == 0, 2 ** (self.OUT_DW - 1) - 1, self.lut[(1 << self.LUT_DW) - addr & ((1 << self.LUT_DW) - 1)])
+        self.sin_wave = np.choose(quadrant, [sin_q, cos_q, -sin_q, -cos_q])
+        self.cos_wave = np.choose(quadrant, [cos_q, -sin_q, -cos_q, sin_q])
+        # for small PHASE_DW the output for every possible phase fits into a table, cos and sin are stored
+        # next to each other in the smallest integer type, so that calc() only needs one lookup per phase
+        self.phase_table = None
+        if self.PHASE_DW <= 22:
+            dtype = np.int16 if self.OUT_DW <= 16 else np.int32
+            self.phase_table = np.stack(self.calc_wave(np.arange(1 << self.PHASE_DW)), axis = 1).astype(dtype)
+        self.reset()
+
+    def calc_lut(self):
+        """quarter sine wave with 2 ** LUT_DW entries, this is the content of sine_lut_16_16.hex"""
+        return np.round(np.sin(np.pi / 2 * np.arange(2 ** self.LUT_DW) / 2 ** self.LUT_DW) * (2 ** (self.OUT_DW - 1) - 1)).astype(np.int64)
+
+    def calc(self, phase):
+        """returns (cos, sin) for PHASE_DW bit phases, works on whole arrays"""
+        phase = np.asarray(phase).astype(np.int64, copy = False) & ((1 << self.PHASE_DW) - 1)
+        if self.phase_table is not None:
+            wave = self.phase_table.take(phase, axis = 0)
+            return wave[..., 0].astype(np.int64), wave[..., 1].astype(np.int64)
+        return self.calc_wave(phase)
+
+    def calc_wave(self, phase):
+        """with USE_TAYLOR the phase bits below the LUT address are used for a first order correction
+        sin(x + d) = sin(x) + d * cos(x), the result is saturated to OUT_DW bits"""
+        addr = phase >> self.TAYLOR_DW
+        sin = self.sin_wave[addr]
+        cos = self.cos_wave[addr]
+        if self.USE_TAYLOR and self.TAYLOR_DW > 0:
+            frac = phase & ((1 << self.TAYLOR_DW) - 1)
+            shift = 16 + self.PHASE_DW
+            round_bit = 1 << (shift - 1)
+            sin, cos = (sin + ((cos * frac * self.TWO_PI + round_bit) >> shift),
+                        cos - ((sin * frac * self.TWO_PI + round_bit) >> shift))
+        return fixed_point.saturate(cos, self.OUT_DW), fixed_point.saturate(sin, self.OUT_DW)
+
+    def phases(self, phase_inc, num):
+        """streaming phase accumulator, returns the phases for the next num samples and advances the accumulator"""
+        mask = (1 << self.PHASE_DW) - 1
+        phase = (self.phase + np.arange(num, dtype = np.int64) * (int(phase_inc) & mask)) & mask
+        self.phase = int((self.phase + num * (int(phase_inc) & mask)) & mask)
+        return phase
+
+    def reset(self):
+        self.phase = 0
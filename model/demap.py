@@ -0,0 +1,93 @@
+import os
+import sys
+import itertools
+import concurrent.futures
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import fixed_point
+
+class Model:
+    def __init__(self, IQ_DW = 16, LLR_DW = 8):
+        # IQ_DW is the width of one component, the input words are 2 * IQ_DW bits wide
+        self.IQ_DW = int(IQ_DW)
+        self.LLR_DW = int(LLR_DW)
+
+    def unpack(self, samples):
+        samples = np.asarray(samples)
+        if np.iscomplexobj(samples):
+            return samples.real.astype(np.int64), samples.imag.astype(np.int64)
+        return fixed_point.unpack_iq(samples, 2 * self.IQ_DW)
+
+    def llr(self, samples):
+        """QPSK LLRs of every sample, the upper LLR_DW bits of I and Q, returns (llr_I, llr_Q)
+
+        If LLR_DW > IQ_DW the components are shifted left instead. A positive LLR stands for bit 0.
+        """
+        re, im = self.unpack(samples)
+        if self.LLR_DW > self.IQ_DW:
+            shift = self.LLR_DW - self.IQ_DW
+            return np.asarray(re) << shift, np.asarray(im) << shift
+        shift = self.IQ_DW - self.LLR_DW
+        return np.asarray(fixed_point.truncate(re, shift)), np.asarray(fixed_point.truncate(im, shift))
+
+    def process(self, samples, tuser = 0, tlast = None):
+        """block mode, demaps an array of equalized symbols of any length
+
+        samples are 2 * IQ_DW bit words or complex values, tuser and tlast are s_axis_in_tuser and
+        s_axis_in_tlast for every sample. Like in the HDL the output fifo sends llr_I and then llr_Q
+        for every sample, both with the tuser of the sample and tlast only on llr_Q.
+        Returns (llr, tuser, tlast) with two entries per input sample.
+        """
+        samples = np.asarray(samples).ravel()
+        llr_I, llr_Q = self.llr(samples)
+        llr = np.stack((llr_I, llr_Q), axis = -1).ravel()
+        tuser = np.repeat(np.broadcast_to(np.asarray(tuser, np.int64) & 3, samples.shape), 2)
+        last = np.zeros((len(samples), 2), bool)
+        if tlast is not None:
+            last[:, 1] = np.broadcast_to(np.asarray(tlast, bool), samples.shape)
+        return llr, tuser, last.ravel()
+
+def quantize(samples, IQ_DW):
+    """scales complex samples so that the largest component uses the full IQ_DW bit range and truncates them like the tests do"""
+    samples = np.asarray(samples)
+    samples = samples / max(np.abs(samples.real).max(), np.abs(samples.imag).max())
+    samples *= 2 ** (IQ_DW - 1) - 1
+    return samples.real.astype(np.int64) + 1j * samples.imag.astype(np.int64)
+
+def evaluate(samples, IQ_DW, LLR_DW, bits = None):
+    """quantization quality of the LLRs for recorded equalized symbols with the given widths
+
+    Returns a dict with the number of hard decisions that differ from the unquantized samples,
+    the number of LLRs that are 0 and the signal to quantization noise ratio of the LLRs in dB.
+    If the transmitted bits are given, two per sample in the order of the LLRs, it also contains
+    the bit error rate of the hard decisions.
+    """
+    samples = np.asarray(samples).ravel()
+    ideal = np.stack((samples.real, samples.imag), axis = -1).ravel()
+    ideal = ideal / np.abs(ideal).max()
+    llr = Model(IQ_DW, LLR_DW).process(quantize(samples, IQ_DW))[0]
+    scaled = llr * 2.0 ** (IQ_DW - LLR_DW) / (2 ** (IQ_DW - 1) - 1)
+    noise = np.sum((scaled - ideal) ** 2)
+    result = {
+        'IQ_DW': IQ_DW,
+        'LLR_DW': LLR_DW,
+        'bit_errors': int(np.sum((llr < 0) != (ideal < 0))),
+        'zero_llrs': int(np.sum(llr == 0)),
+        'sqnr_dB': 10 * np.log10(np.sum(ideal ** 2) / noise) if noise > 0 else np.inf
+    }
+    if bits is not None:
+        result['ber'] = float(np.mean((llr < 0) != np.asarray(bits, bool).ravel()))
+    return result
+
+def sweep(samples, IQ_DWs, LLR_DWs, max_workers = None, bits = None):
+    """evaluate() for every combination of IQ_DW and LLR_DW, the combinations run in a process pool
+
+    Combinations with LLR_DW > IQ_DW are skipped, because they only append zeros to the LLRs.
+    Returns a list of dicts ordered like itertools.product(IQ_DWs, LLR_DWs).
+    """
+    samples = np.asarray(samples)
+    params = [(IQ_DW, LLR_DW) for IQ_DW, LLR_DW in itertools.product(IQ_DWs, LLR_DWs) if LLR_DW <= IQ_DW]
+    with concurrent.futures.ProcessPoolExecutor(max_workers = max_workers) as executor:
+        futures = [executor.submit(evaluate, samples, IQ_DW, LLR_DW, bits) for IQ_DW, LLR_DW in params]
+        return [future.result() for future in futures]
@@ -0,0 +1,69 @@
+import numpy as np
+
+
+class Model:
+    def __init__(self, INPUT_WIDTH, RESULT_WIDTH, PIPELINED = 0):
+        self.INPUT_WIDTH = int(INPUT_WIDTH)
+        self.RESULT_WIDTH = int(RESULT_WIDTH)
+        self.PIPELINED = int(PIPELINED)
+        if self.INPUT_WIDTH > 63 or self.RESULT_WIDTH > 63:
+            raise ValueError('INPUT_WIDTH and RESULT_WIDTH have to fit into int64')
+        # clock cycles from the edge that samples valid_i to the edge after which valid_o is set,
+        # the iterative divider needs one cycle per result bit, the pipelined one has one stage per result bit
+        self.LATENCY = self.RESULT_WIDTH
+
+    def calc(self, numerator, denominator):
+        """bit exact quotients of the unsigned INPUT_WIDTH bit operands, works on whole arrays
+
+        The HDL does restoring division with one result bit per stage starting at the MSB, a quotient
+        that does not fit into RESULT_WIDTH bits therefore saturates to all ones.
+        """
+        numerator = np.asarray(numerator).astype(np.int64) & ((1 << self.INPUT_WIDTH) - 1)
+        denominator = np.asarray(denominator).astype(np.int64) & ((1 << self.INPUT_WIDTH) - 1)
+        max_result = (1 << self.RESULT_WIDTH) - 1
+        result = np.minimum(numerator // np.maximum(denominator, 1), max_result)
+        if self.PIPELINED:
+            # every stage subtracts 0, so all result bits get set
+            result = np.where(denominator == 0, max_result, result)
+        else:
+            # the iterative divider skips the calculation if one operand is 0
+            result = np.where((denominator == 0) | (numerator == 0), 0, result)
+        return result
+
+    def accepted_inputs(self, numerator, denominator, valid):
+        """returns the clock cycles in which the divider accepts an input
+
+        The pipelined divider accepts an input in every cycle, the iterative one ignores inputs while it
+        is busy. Inputs with a zero operand are finished right away.
+        """
+        in_cycles = np.flatnonzero(np.asarray(valid, bool))
+        if self.PIPELINED:
+            return in_cycles
+        zero = (np.asarray(numerator)[in_cycles] == 0) | (np.asarray(denominator)[in_cycles] == 0)
+        accepted = []
+        next_free = 0
+        for cycle, is_zero in zip(in_cycles.tolist(), zero.tolist()):
+            if cycle >= next_free:
+                accepted.append(cycle)
+                next_free = cycle + 1 if is_zero else cycle + self.LATENCY + 1
+        return np.array(accepted, int)
+
+    def process(self, numerator, denominator, valid):
+        """cycle accurate block mode, processes the inputs starting from reset state
+
+        numerator, denominator and valid are numerator_i, denominator_i and valid_i for every clock cycle.
+        Returns (result, valid_out) for every clock cycle, extended by LATENCY cycles. Index k holds result_o
+        and valid_o after the clock edge that samples input k, result is only meaningful where valid_out is set.
+        """
+        numerator = np.asarray(numerator).astype(np.int64)
+        denominator = np.asarray(denominator).astype(np.int64)
+        num_cycles = len(numerator)
+        starts = self.accepted_inputs(numerator, denominator, valid)
+        out_cycles = starts + self.LATENCY
+        if not self.PIPELINED:
+            out_cycles = np.where((numerator[starts] == 0) | (denominator[starts] == 0), starts, out_cycles)
+        result = np.zeros(num_cycles + self.LATENCY, np.int64)
+        valid_out = np.zeros(num_cycles + self.LATENCY, bool)
+        result[out_cycles] = self.calc(numerator[starts], denominator[starts])
+        valid_out[out_cycles] = True
+        return result, valid_out
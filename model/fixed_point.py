@@ -0,0 +1,93 @@
+import numpy as np
+
+# Fixed point helpers that work on whole arrays, scalars are accepted as well.
+# Complex samples are packed like in the HDL, a DW wide word holds the real part in the lower
+# and the imaginary part in the upper DW / 2 bits. Values that do not fit into int64, like wide packed
+# words or products of wide operands, are handled as python ints in object arrays.
+
+def _result(values):
+    # 0-d arrays are returned as scalars
+    if isinstance(values, np.ndarray):
+        return values[()]
+    return values
+
+def _as_array(values):
+    if isinstance(values, np.ndarray):
+        return values
+    try:
+        return np.asarray(values, np.int64)
+    except OverflowError:
+        # python ints wider than 63 bits
+        return np.asarray(values, object)
+
+def _wide(values):
+    # values that do not fit into int64 are processed as python ints
+    return values.dtype == object or values.dtype == np.uint64
+
+def unsigned(values, bits):
+    """lower bits of values as unsigned int64, or as python ints if bits > 63"""
+    values = _as_array(values)
+    mask = (1 << bits) - 1
+    if bits > 63:
+        return _result(values.astype(object) & mask)
+    if _wide(values):
+        return _result(np.asarray(values.astype(object) & mask, np.int64))
+    return _result(values.astype(np.int64, copy = False) & mask)
+
+def sign_extend(values, bits):
+    """interprets the lower bits of values as signed bits wide numbers"""
+    values = _as_array(values)
+    if bits <= 63 and not _wide(values):
+        # shifting bit bits - 1 to the sign bit of int64 and back again needs only two passes over the data
+        shift = 64 - bits
+        return _result((values.astype(np.int64, copy = False) << shift) >> shift)
+    sign = 1 << (bits - 1)
+    return _result((np.asarray(unsigned(values, bits)) ^ sign) - sign)
+
+def unpack_iq(words, DW):
+    """splits DW wide words into signed re and im int64 arrays"""
+    words = _as_array(words)
+    if _wide(words):
+        words = words.astype(object)
+    return sign_extend(words, DW // 2), sign_extend(words >> (DW // 2), DW // 2)
+
+def unpack_complex(words, DW):
+    """unpacks DW wide words into complex samples"""
+    re, im = unpack_iq(words, DW)
+    return re + 1j * im
+
+def complex_iq(samples, DW):
+    """signed re and im int64 arrays of complex samples as they are seen in DW wide words, this is
+    unpack_iq(pack_complex(samples, DW), DW) without packing the samples"""
+    samples = np.asarray(samples)
+    return sign_extend(samples.real, DW // 2), sign_extend(samples.imag, DW // 2)
+
+def pack_iq(re, im, DW):
+    """packs re and im into DW wide words, the result is int64 if DW < 64 and python ints otherwise"""
+    re = np.asarray(unsigned(re, DW // 2))
+    im = np.asarray(unsigned(im, DW // 2))
+    if DW >= 64:
+        re = re.astype(object)
+        im = im.astype(object)
+    return _result((im << (DW // 2)) | re)
+
+def pack_complex(samples, DW):
+    """packs complex samples into DW wide words, fractional parts are truncated"""
+    samples = np.asarray(samples)
+    return pack_iq(samples.real, samples.imag, DW)
+
+def saturate(values, bits):
+    """clips values to the range of a signed bits wide number"""
+    values = _as_array(values)
+    if _wide(values) or bits > 64:
+        values = values.astype(object)
+    else:
+        values = values.astype(np.int64)
+    return _result(np.clip(values, -(1 << (bits - 1)), (1 << (bits - 1)) - 1))
+
+def truncate(values, shift):
+    """drops the lowest shift bits like an arithmetic right shift in the HDL, this rounds towards -inf"""
+    values = _as_array(values)
+    if _wide(values):
+        return _result(values.astype(object) >> shift)
+    return _result(np.asarray(values, np.int64) >> shift)
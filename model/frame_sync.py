@@ -0,0 +1,290 @@
+import numpy as np
+
+WAIT_FOR_SSB = 0
+WAIT_FOR_IBAR = 1
+SYNCED = 2
+
+class Model:
+    def __init__(self, NFFT = 8, TRACK_SSB = 0):
+        self.NFFT = int(NFFT)
+        # in SYNCED the HDL only restarts syms_since_last_SSB for an SSB on the last sample of a symbol, an SSB that
+        # is found on time does not restart it and the counter wraps around in its register, so every third SSB is
+        # missed and the sync is lost. The symbol timing also stays at the first SSB. With TRACK_SSB every found SSB
+        # restarts the counter and the symbol timing follows the SSBs, so that long captures stay synced
+        self.TRACK_SSB = int(TRACK_SSB)
+        self.FFT_LEN = 2 ** self.NFFT
+        self.CP1_LEN = 20 * self.FFT_LEN // 256
+        self.CP2_LEN = 18 * self.FFT_LEN // 256
+        self.MAX_CP_LEN = self.CP1_LEN
+        self.SFN_MAX = 1023
+        self.SUBFRAMES_PER_FRAME = 20
+        self.SYM_PER_SF = 14
+        self.SFN_WIDTH = int(np.ceil(np.log2(self.SFN_MAX)))
+        self.SUBFRAME_NUMBER_WIDTH = int(np.ceil(np.log2(self.SUBFRAMES_PER_FRAME - 1)))
+        self.SYMBOL_NUMBER_WIDTH = int(np.ceil(np.log2(self.SYM_PER_SF - 1)))
+        self.CP_LEN_WIDTH = int(np.ceil(np.log2(self.MAX_CP_LEN)))
+        self.USER_WIDTH = self.SFN_WIDTH + self.SUBFRAME_NUMBER_WIDTH + self.SYMBOL_NUMBER_WIDTH + self.CP_LEN_WIDTH
+        self.SYMS_BTWN_SSB = self.SUBFRAMES_PER_FRAME * self.SYM_PER_SF
+        # syms_since_last_SSB is $clog2(SYMS_BTWN_SSB + 100) bits wide
+        self.SYMS_SINCE_SSB_DW = int(np.ceil(np.log2(self.SYMS_BTWN_SSB + 100)))
+        self.reset()
+
+    def pack_tuser(self, sfn, subframe_number, sym_cnt, CP_len):
+        """packs {sfn, subframe_number, sym_cnt, CP_len} like m_axis_out_tuser"""
+        tuser = np.asarray(sfn, np.int64)
+        tuser = (tuser << self.SUBFRAME_NUMBER_WIDTH) | np.asarray(subframe_number, np.int64)
+        tuser = (tuser << self.SYMBOL_NUMBER_WIDTH) | np.asarray(sym_cnt, np.int64)
+        return (tuser << self.CP_LEN_WIDTH) | np.asarray(CP_len, np.int64)
+
+    def unpack_tuser(self, tuser):
+        """splits m_axis_out_tuser into (sfn, subframe_number, sym_cnt, CP_len)"""
+        tuser = np.asarray(tuser, np.int64)
+        CP_len = tuser & ((1 << self.CP_LEN_WIDTH) - 1)
+        tuser = tuser >> self.CP_LEN_WIDTH
+        sym_cnt = tuser & ((1 << self.SYMBOL_NUMBER_WIDTH) - 1)
+        tuser = tuser >> self.SYMBOL_NUMBER_WIDTH
+        subframe_number = tuser & ((1 << self.SUBFRAME_NUMBER_WIDTH) - 1)
+        return tuser >> self.SUBFRAME_NUMBER_WIDTH, subframe_number, sym_cnt, CP_len
+
+    def CP_len(self, sym_cnt):
+        return np.where((np.asarray(sym_cnt) == 0) | (np.asarray(sym_cnt) == 7), self.CP1_LEN, self.CP2_LEN)
+
+    def next_subframe(self, subframe_number, sfn):
+        if subframe_number == self.SUBFRAMES_PER_FRAME - 1:
+            return 0, 0 if sfn == self.SFN_MAX - 1 else sfn + 1
+        return subframe_number + 1, sfn
+
+    def next_symbol(self, sym_cnt, subframe_number, sfn):
+        """counters after the end of a symbol, sym_cnt can only be 14 or 15 after an ibar_SSB correction
+        and wraps around in its 4 bit register without incrementing the subframe number then"""
+        if sym_cnt == self.SYM_PER_SF - 1:
+            return (0,) + self.next_subframe(subframe_number, sfn)
+        return (sym_cnt + 1) & ((1 << self.SYMBOL_NUMBER_WIDTH) - 1), subframe_number, sfn
+
+    def next_symbols(self, num):
+        """(sym_cnt, subframe_number, sfn, CP_len) of the num symbols that follow the current symbol"""
+        sym_cnt, subframe_number, sfn = self.sym_cnt, self.subframe_number, self.sfn
+        head = []
+        while sym_cnt >= self.SYM_PER_SF and len(head) < num:
+            sym_cnt, subframe_number, sfn = self.next_symbol(sym_cnt, subframe_number, sfn)
+            head.append((sym_cnt, subframe_number, sfn))
+        cnt = sym_cnt + np.arange(1, num - len(head) + 1)
+        subframes = subframe_number + cnt // self.SYM_PER_SF
+        sym = np.concatenate(([h[0] for h in head], cnt % self.SYM_PER_SF)).astype(np.int64)
+        sf = np.concatenate(([h[1] for h in head], subframes % self.SUBFRAMES_PER_FRAME)).astype(np.int64)
+        sfns = np.concatenate(([h[2] for h in head], (sfn + subframes // self.SUBFRAMES_PER_FRAME) % self.SFN_MAX)).astype(np.int64)
+        return sym, sf, sfns, self.CP_len(sym)
+
+    def correct_ibar(self, ibar_SSB):
+        """sym_cnt correction when ibar_SSB_valid_i arrives in WAIT_FOR_IBAR, like in the HDL"""
+        if ibar_SSB == 1:
+            self.sym_cnt = self.sym_cnt + 6 if self.sym_cnt + 6 < self.SYM_PER_SF else self.sym_cnt + 6 - self.SYM_PER_SF
+        elif ibar_SSB in (2, 3):
+            # the comparison in the HDL is never true for ibar_SSB = 2 and 3
+            self.sym_cnt = (self.sym_cnt + 6 - self.SYM_PER_SF) & ((1 << self.SYMBOL_NUMBER_WIDTH) - 1)
+            self.subframe_number, self.sfn = self.next_subframe(self.subframe_number, self.sfn)
+
+    def symbol_len(self):
+        return self.FFT_LEN + self.CP_len_cur
+
+    def tuser(self):
+        return int(self.pack_tuser(self.sfn, self.subframe_number, self.sym_cnt, self.CP_len_cur))
+
+    def emit(self, start, tuser, tvalid, tlast, first):
+        start = np.atleast_1d(start)
+        self.out.append((start,) + tuple(np.broadcast_to(x, start.shape) for x in (tuser, tvalid, tlast, first)))
+
+    def end_of_symbol(self, pos, SSB_at_end):
+        self.sym_cnt, self.subframe_number, self.sfn = self.next_symbol(self.sym_cnt, self.subframe_number, self.sfn)
+        self.CP_len_cur = int(self.CP_len(self.sym_cnt))
+        self.sym_start = pos + 1
+        if SSB_at_end or (self.state == WAIT_FOR_IBAR and self.syms_since_SSB == self.SYMS_BTWN_SSB - 1):
+            self.syms_since_SSB = 0
+        else:
+            self.syms_since_SSB = (self.syms_since_SSB + 1) % (1 << self.SYMS_SINCE_SSB_DW)
+
+    def count_symbols(self, num):
+        # in WAIT_FOR_IBAR syms_since_last_SSB wraps around after SYMS_BTWN_SSB symbols,
+        # in SYNCED it is only reset by an SSB at the end of a symbol and otherwise wraps around in its register
+        if self.state == WAIT_FOR_IBAR:
+            self.syms_since_SSB = (self.syms_since_SSB + num) % self.SYMS_BTWN_SSB
+        else:
+            self.syms_since_SSB = (self.syms_since_SSB + num) % (1 << self.SYMS_SINCE_SSB_DW)
+
+    def run(self, stop):
+        """free running symbol counting for the samples self.pos .. stop - 1, which must not contain any events"""
+        end = self.sym_start + self.symbol_len()
+        self.emit(self.pos, self.tuser(), self.tvalid, end <= stop, self.pos == self.sym_start)
+        self.pos = stop
+        if end > stop:
+            return
+        # every symbol is at least FFT_LEN + CP2_LEN long, so the symbol that contains stop is within the next num symbols
+        num = (stop - end) // (self.FFT_LEN + self.CP2_LEN) + 1
+        sym, sf, sfn, CP = self.next_symbols(num)
+        starts = end + np.concatenate(([0], np.cumsum(self.FFT_LEN + CP)))
+        started = int(np.searchsorted(starts[:num], stop))
+        self.emit(starts[:started], self.pack_tuser(sfn[:started], sf[:started], sym[:started], CP[:started]),
+                  self.tvalid, starts[1:started + 1] <= stop, True)
+        current = int(np.searchsorted(starts[:num], stop, 'right')) - 1
+        self.sym_cnt, self.subframe_number, self.sfn, self.CP_len_cur = int(sym[current]), int(sf[current]), int(sfn[current]), int(CP[current])
+        self.sym_start = int(starts[current])
+        self.count_symbols(current + 1)
+
+    def next_trigger(self):
+        """sample where find_SSB gets set, this is the second last sample of the symbol before the next expected SSB"""
+        num = (self.SYMS_BTWN_SSB - 1 - self.syms_since_SSB) % (1 << self.SYMS_SINCE_SSB_DW)
+        if num == 0 and self.pos - self.sym_start > self.symbol_len() - 2:
+            num = 1 << self.SYMS_SINCE_SSB_DW
+        if num == 0:
+            return self.sym_start + self.symbol_len() - 2
+        CP = self.next_symbols(num)[3]
+        return self.sym_start + self.symbol_len() + int(np.sum(self.FFT_LEN + CP)) - 2
+
+    def step(self, pos, SSB, ibar_SSB):
+        """processes the single sample pos, SSB is N_id_2_valid_i and ibar_SSB is None if ibar_SSB_valid_i is low"""
+        if self.state == WAIT_FOR_SSB:
+            if SSB:
+                # SSB_pattern for case A is [2, 8, 16, 22], the HDL assumes symbol 3 until ibar_SSB arrives
+                self.sym_cnt = 3
+                self.CP_len_cur = self.CP2_LEN
+                self.sym_start = pos
+                self.tvalid = 1
+                self.state = WAIT_FOR_IBAR
+                self.syms_since_SSB = 0
+                self.SSB_start.append(pos)
+            self.emit(pos, self.tuser(), self.tvalid, False, SSB)
+            return
+
+        sample_cnt = pos - self.sym_start
+        last = sample_cnt == self.symbol_len() - 1
+        next_state = self.state
+        if self.state == WAIT_FOR_IBAR:
+            if ibar_SSB is not None:
+                self.correct_ibar(ibar_SSB)
+                next_state = SYNCED
+            if SSB:
+                self.SSB_start.append(pos)
+        else:
+            trigger = sample_cnt == self.symbol_len() - 2 and self.syms_since_SSB == self.SYMS_BTWN_SSB - 1
+            if self.TRACK_SSB and trigger and not self.find_SSB:
+                # the PSS peak can be one decimated sample early, with TRACK_SSB the SSB is also found in the
+                # cycle where find_SSB gets set
+                self.find_SSB = True
+                self.tvalid = 0
+            if self.find_SSB:
+                if SSB:
+                    self.tvalid = 1
+                    self.SSB_start.append(pos)
+                    self.find_SSB = False
+                    if self.TRACK_SSB:
+                        # samples from the expected start of the SSB, an early SSB belongs to the next symbol
+                        offset = sample_cnt if sample_cnt < self.symbol_len() // 2 else sample_cnt - self.symbol_len()
+                        if offset != 0 and offset == self.SSB_offset:
+                            # the PSS peak jitters by one decimated sample, the symbol timing only follows the SSBs
+                            # if two of them in a row have the same offset. An early SSB ends the current symbol,
+                            # a late one restarts it
+                            if offset < 0:
+                                self.end_of_symbol(pos - 1, True)
+                            sample_cnt = 0
+                            last = False
+                            self.sym_start = pos
+                        # the counter wraps around to 0 at the end of the symbol before an early SSB
+                        self.syms_since_SSB = 0 if sample_cnt < self.symbol_len() // 2 else (1 << self.SYMS_SINCE_SSB_DW) - 1
+                        self.SSB_offset = offset
+                if sample_cnt == 3:
+                    # could not find SSB, connection is lost
+                    self.find_SSB = False
+                    next_state = WAIT_FOR_SSB
+            elif trigger:
+                self.find_SSB = True
+                self.tvalid = 0
+        self.emit(pos, self.tuser(), self.tvalid, last, sample_cnt == 0)
+        if last:
+            self.end_of_symbol(pos, SSB)
+        self.state = next_state
+
+    def process(self, num_samples, SSB_pos, ibar_SSB = 0, ibar_pos = None):
+        """block mode, symbol timing for a whole stream of num_samples valid input samples starting from reset state
+
+        SSB_pos are the samples where N_id_2_valid_i is high, ibar_pos the samples where ibar_SSB_valid_i is high
+        and ibar_SSB the corresponding ibar_SSB_i. The sample where an SSB is detected in WAIT_FOR_SSB becomes the
+        first sample of symbol 3. The stream is described by runs of samples with the same outputs, sample n belongs
+        to the run i with start[i] <= n < start[i + 1]. Returns (start, tuser, tvalid, tlast, symbol_start, SSB_start)
+        where tuser is m_axis_out_tuser, tvalid is m_axis_out_tvalid, tlast is set if the last sample of the run is
+        the last sample of a symbol, symbol_start are the symbol boundaries and SSB_start the samples with SSB_start_o.
+        Outputs are aligned to the input samples, the register delays of the HDL are not modelled.
+        """
+        SSB_pos = np.unique(np.asarray(SSB_pos, np.int64))
+        SSB_pos = SSB_pos[(SSB_pos >= 0) & (SSB_pos < num_samples)]
+        if ibar_pos is None:
+            ibar_pos = []
+        ibar_pos = np.atleast_1d(np.asarray(ibar_pos, np.int64))
+        ibar_SSB = np.broadcast_to(np.asarray(ibar_SSB, np.int64), ibar_pos.shape)
+        order = np.argsort(ibar_pos, kind = 'stable')
+        ibar_pos = ibar_pos[order]
+        ibar_SSB = ibar_SSB[order]
+        self.reset()
+
+        while self.pos < num_samples:
+            # next sample where something else happens than counting samples
+            SSB_idx = np.searchsorted(SSB_pos, self.pos)
+            event = SSB_pos[SSB_idx] if SSB_idx < len(SSB_pos) else num_samples
+            if self.state == WAIT_FOR_SSB:
+                if event > self.pos:
+                    self.emit(self.pos, self.tuser(), self.tvalid, False, False)
+            else:
+                ibar_idx = np.searchsorted(ibar_pos, self.pos)
+                if self.state == WAIT_FOR_IBAR and ibar_idx < len(ibar_pos):
+                    event = min(event, ibar_pos[ibar_idx])
+                if self.find_SSB:
+                    event = min(event, self.lost_pos)
+                elif self.state == SYNCED:
+                    event = min(event, self.next_trigger())
+                if event > self.pos:
+                    self.run(min(event, num_samples))
+            if event >= num_samples:
+                break
+
+            event = int(event)
+            ibar_idx = np.searchsorted(ibar_pos, event)
+            ibar = int(ibar_SSB[ibar_idx]) if ibar_idx < len(ibar_pos) and ibar_pos[ibar_idx] == event else None
+            find_SSB = self.find_SSB
+            self.step(event, SSB_idx < len(SSB_pos) and SSB_pos[SSB_idx] == event, ibar)
+            if self.find_SSB and not find_SSB:
+                # lost if the SSB is not found before sample 3 of the next symbol
+                self.lost_pos = self.sym_start + self.symbol_len() + 3
+            self.pos = event + 1
+
+        if len(self.out) == 0:
+            empty = np.zeros(0, np.int64)
+            return empty, empty, empty, np.zeros(0, bool), empty, empty
+        start, tuser, tvalid, tlast, first = (np.concatenate(x) for x in zip(*self.out))
+        start = start.astype(np.int64)
+        # the same counters can be emitted twice around events, merge them
+        keep = np.ones(len(start), bool)
+        keep[1:] = (tuser[1:] != tuser[:-1]) | (tvalid[1:] != tvalid[:-1]) | tlast[:-1] | first[1:]
+        # a run with tlast is always the last one of a merged run
+        merged_tlast = np.zeros(int(keep.sum()), bool)
+        merged_tlast[(np.cumsum(keep) - 1)[tlast.astype(bool)]] = True
+        return (start[keep], tuser[keep].astype(np.int64), tvalid[keep].astype(np.int64), merged_tlast,
+                start[first.astype(bool)], np.asarray(self.SSB_start, np.int64))
+
+    def expand(self, start, values, num_samples):
+        """per sample values from the runs that are returned by process()"""
+        return np.repeat(values, np.diff(np.append(start, num_samples)))
+
+    def reset(self):
+        self.state = WAIT_FOR_SSB
+        self.sfn = 0
+        self.subframe_number = 0
+        self.sym_cnt = 0
+        self.CP_len_cur = self.CP2_LEN
+        self.sym_start = 0
+        self.syms_since_SSB = 0
+        self.find_SSB = False
+        self.SSB_offset = 0
+        self.lost_pos = 0
+        self.tvalid = 0
+        self.pos = 0
+        self.out = []
+        self.SSB_start = []
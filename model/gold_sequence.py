@@ -0,0 +1,64 @@
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import cache
+
+# Pseudo random sequences from 38.211 5.2.1 and tables of the sequences that are used for the PBCH.
+# The tables are calculated once for all cell ids and then memory mapped from the cache.
+
+NC = 1600
+MAX_CELL_ID = 1007
+PBCH_DMRS_LEN = 144
+# number of PBCH bits per SSB
+PBCH_E = 864
+# the scrambling sequence has an offset of v * E, with v = 0 .. 7 for L_max = 8
+PBCH_MAX_V = 8
+
+def gold_sequence(c_init, length, Nc = NC):
+    """c(n) for n = 0 .. length - 1 for every value in c_init, returns uint8 bits with shape (len(c_init), length)"""
+    c_init = np.atleast_1d(np.asarray(c_init, np.int64)).ravel()
+    total = Nc + length
+    x1 = np.zeros(total + 31, np.uint8)
+    x2 = np.zeros((len(c_init), total + 31), np.uint8)
+    x1[0] = 1
+    x2[:, :31] = (c_init[:, np.newaxis] >> np.arange(31)) & 1
+    # x(n + 31) only depends on x(n) .. x(n + 3), so 28 new bits can be calculated per step
+    for n in range(0, total, 28):
+        stop = min(n + 28, total)
+        x1[n + 31:stop + 31] = x1[n + 3:stop + 3] ^ x1[n:stop]
+        x2[:, n + 31:stop + 31] = x2[:, n + 3:stop + 3] ^ x2[:, n + 2:stop + 2] ^ x2[:, n + 1:stop + 1] ^ x2[:, n:stop]
+    return x1[Nc:total] ^ x2[:, Nc:total]
+
+def PBCH_DMRS_c_init(N_id, ibar_SSB):
+    """c_init of the PBCH DMRS from 38.211 7.4.1.4.1"""
+    N_id = np.asarray(N_id, np.int64)
+    ibar_SSB = np.asarray(ibar_SSB, np.int64)
+    return (((ibar_SSB + 1) * ((N_id >> 2) + 1)) << 11) + ((ibar_SSB + 1) << 6) + (N_id % 4)
+
+def calc_PBCH_DMRS(N_id, ibar_SSB):
+    """PBCH DMRS as 2 bit values like in the channel_estimator, bit 1 is c(2m) and bit 0 is c(2m + 1),
+    N_id and ibar_SSB are broadcast against each other and the result has an extra axis of length PBCH_DMRS_LEN"""
+    c_init = PBCH_DMRS_c_init(N_id, ibar_SSB)
+    c = gold_sequence(c_init, 2 * PBCH_DMRS_LEN)
+    return ((c[:, 0::2] << 1) | c[:, 1::2]).reshape(c_init.shape + (PBCH_DMRS_LEN,))
+
+def PBCH_DMRS_table():
+    """PBCH DMRS for all cell ids and ibar_SSB as uint8 array with shape (MAX_CELL_ID + 1, 8, PBCH_DMRS_LEN)"""
+    def calc():
+        return calc_PBCH_DMRS(np.arange(MAX_CELL_ID + 1)[:, np.newaxis], np.arange(8))
+    return cache.cached_array('PBCH_DMRS', {'MAX_CELL_ID': MAX_CELL_ID, 'PBCH_DMRS_LEN': PBCH_DMRS_LEN}, calc, mmap = True)
+
+def PBCH_scrambling_table():
+    """PBCH scrambling sequences c(n) with c_init = N_id for all cell ids, uint8 bits with shape (MAX_CELL_ID + 1, PBCH_MAX_V * PBCH_E)"""
+    def calc():
+        return gold_sequence(np.arange(MAX_CELL_ID + 1), PBCH_MAX_V * PBCH_E)
+    return cache.cached_array('PBCH_scrambling', {'MAX_CELL_ID': MAX_CELL_ID, 'LEN': PBCH_MAX_V * PBCH_E}, calc, mmap = True)
+
+def PBCH_scrambling(N_id, v, E = PBCH_E):
+    """scrambling sequence of the PBCH bits like nrPBCHPRBS(N_id, v, E), as int64 so that it can be
+    used in arithmetic like 1 - 2 * c without overflowing the uint8 table entries"""
+    if (v + 1) * E <= PBCH_MAX_V * PBCH_E:
+        return np.array(PBCH_scrambling_table()[N_id, v * E:(v + 1) * E], np.int64)
+    return gold_sequence(N_id, (v + 1) * E)[0, v * E:].astype(np.int64)
@@ -5,9 +5,114 @@ class Model:
     def __init__(self, IN_DW, WINDOW_LEN):
         self.IN_DW = int(IN_DW)
         self.WINDOW_LEN = int(WINDOW_LEN)
+        self.NOISE_LIMIT = 2 ** (self.IN_DW // 2)
+        self.DETECTION_FACTOR = 16
+        self.AVERAGE_SHIFT = int(np.ceil(np.log2(self.WINDOW_LEN))) - int(np.ceil(np.log2(self.DETECTION_FACTOR)))
+        self.AVERAGE_DW = self.IN_DW + int(np.ceil(np.log2(self.WINDOW_LEN)))
+        self.reset()
+
+    def threshold(self, average):
+        if self.AVERAGE_SHIFT > 0:
+            return average >> self.AVERAGE_SHIFT
+        # the shift happens inside the AVERAGE_DW wide average register, overflowing bits get lost
+        return (average << -self.AVERAGE_SHIFT) & (2 ** self.AVERAGE_DW - 1)
 
     def tick(self):
-        pass
+        if self.in_buffer is None:
+            return
+        data = self.in_buffer
+        self.in_buffer = None
+        threshold = self.threshold(self.average)
+        if self.init_counter == self.WINDOW_LEN and data > threshold and data > self.NOISE_LIMIT:
+            self.peak_detected = 1
+            self.score = (data - threshold) & (2 ** self.IN_DW - 1)
+        else:
+            self.peak_detected = 0
+            self.score = 0
+        if self.init_counter < self.WINDOW_LEN:
+            self.init_counter += 1
+        # average gets updated with the previous sample, like in the HDL
+        # the window is a ring buffer, the oldest sample is the one after the newest one
+        oldest_pos = (self.window_pos + 1) % self.WINDOW_LEN
+        self.average += self.window[self.window_pos] - self.window[oldest_pos]
+        self.window[oldest_pos] = data
+        self.window_pos = oldest_pos
+
+    def set_data(self, data_in):
+        self.in_buffer = int(data_in)
+
+    def detect(self, samples, history, count):
+        """peak decisions for valid samples, history are the WINDOW_LEN samples before them and count
+        is the number of samples that were processed before, returns (peak, score)"""
+        num = len(samples)
+        # sliding window sum over samples[n - WINDOW_LEN] .. samples[n - 2], the HDL adds in_buffer[0]
+        # which is the previous sample, so the current and previous sample are not part of the average
+        csum = np.concatenate(([0], np.cumsum(np.concatenate((history, samples)))))
+        average = csum[self.WINDOW_LEN - 1:self.WINDOW_LEN - 1 + num] - csum[:num]
+        threshold = self.threshold(average)
+        peak = (samples > threshold) & (samples > self.NOISE_LIMIT)
+        # no peaks until the window is filled
+        peak[:max(self.WINDOW_LEN - count, 0)] = False
+        score = np.zeros(num, np.int64)
+        idx = np.flatnonzero(peak)
+        score[idx] = (samples[idx] - threshold[idx]) & (2 ** self.IN_DW - 1)
+        return peak, score
+
+    def process(self, data, tvalid = None):
+        """block mode, processes the whole input stream at once starting from reset state
+
+        tvalid optionally gives s_axis_in_tvalid for every input. Returns (peak_detected, score) with one
+        entry per input, outputs keep their value for inputs with tvalid = 0 like the HDL registers.
+        """
+        data = np.asarray(data).astype(np.int64)
+        if tvalid is None:
+            valid = np.ones(len(data), bool)
+        else:
+            valid = np.asarray(tvalid, bool)
+        peak, score = self.detect(data[valid], np.zeros(self.WINDOW_LEN, np.int64), 0)
+
+        # number of valid inputs so far, selects the output of the last valid input
+        last_valid = np.cumsum(valid)
+        peak_detected = np.concatenate(([False], peak))[last_valid]
+        score_out = np.concatenate(([0], score))[last_valid]
+        return peak_detected, score_out
+
+    def process_chunk(self, data, tvalid = None):
+        """streaming mode, works like process() but keeps the state for the next call
+
+        Concatenating the outputs of consecutive calls gives the same result as calling process() on the
+        concatenated input. Call reset() to start a new stream.
+        """
+        data = np.asarray(data).astype(np.int64, copy = False)
+        valid = np.ones(len(data), bool) if tvalid is None else np.asarray(tvalid, bool)
+        samples = data if tvalid is None else data[valid]
+        peak, score = self.detect(samples, self.history, self.count)
+        self.history = np.concatenate((self.history, samples[-self.WINDOW_LEN:]))[-self.WINDOW_LEN:]
+        self.count += len(samples)
+        if tvalid is None:
+            if len(samples):
+                self.last_peak = bool(peak[-1])
+                self.last_score = int(score[-1])
+            return peak, score
+
+        last_valid = np.cumsum(valid)
+        peak_detected = np.concatenate(([self.last_peak], peak))[last_valid]
+        score_out = np.concatenate(([self.last_score], score))[last_valid]
+        if len(samples):
+            self.last_peak = bool(peak[-1])
+            self.last_score = int(score[-1])
+        return peak_detected, score_out
 
     def reset(self):
-        pass
\ No newline at end of file
+        self.window = [0] * self.WINDOW_LEN
+        self.window_pos = 0
+        self.average = 0
+        self.init_counter = 0
+        self.in_buffer = None
+        self.peak_detected = 0
+        self.score = 0
+        # state of process_chunk()
+        self.history = np.zeros(self.WINDOW_LEN, np.int64)
+        self.count = 0
+        self.last_peak = False
+        self.last_score = 0
@@ -0,0 +1,398 @@
+import os
+import sys
+import time
+import collections
+import concurrent.futures
+import itertools
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import CFO_calc
+import CFO_correction
+import FFT_demod
+import PSS_detector
+import PSS_taps
+import SSS_detector
+import channel_estimator
+import cic_d
+import demap
+import frame_sync
+
+# Model of hdl/receiver.sv that chains the block models. The samples are processed in chunks, the PSS detector
+# mode FSM of frame_sync and the CFO feedback to the DDS are applied at the sample where a PSS is detected.
+# Like in the tests there is one input sample per clock cycle, the pipeline delays of the HDL are only modelled
+# where they decide which samples still see the old mode and CFO correction.
+#
+# Measured on one core with 2 s of input at 3.84 MSPS, the model runs at about 1.3 - 1.4 x real time with an SSB
+# every 20 ms, where the PSS detector pauses between the SSBs, and at 1.0 - 1.3 x real time on noise, where the
+# correlators never pause. The numbers vary by about 20 % between runs, on a slower machine the model can be
+# below real time. timing_report() gives the numbers of the last run.
+
+# detections of the PSS detector, pos is the input sample with N_id_2_valid_o, CFO is the estimated CFO of the
+# input in Hz after the DDS increment of this detection has been applied
+PEAK_DTYPE = np.dtype([('pos', np.int64), ('N_id_2', np.int64), ('score', np.int64), ('CFO_angle', np.int64),
+                       ('CFO_DDS_inc', np.int64), ('CFO', np.float64)])
+# SSBs that frame_sync accepted with SSB_start_o, pos is the first sample of the PBCH symbol after the PSS
+SSB_DTYPE = np.dtype([('pos', np.int64), ('N_id_2', np.int64), ('N_id_1', np.int64), ('N_id', np.int64),
+                      ('ibar_SSB', np.int64), ('score', np.int64), ('CFO_angle', np.int64), ('CFO_DDS_inc', np.int64),
+                      ('CFO', np.float64)])
+
+STAGES = ('CFO_correction', 'decimator', 'PSS_detector', 'frame_sync', 'FFT_demod', 'SSS_detector', 'channel_estimator', 'demap')
+
+class Model:
+    def __init__(self, IN_DW = 32, OUT_DW = 32, TAP_DW = 32, PSS_LEN = 128, PSS_LOCAL = None, ALGO = 0, WINDOW_LEN = 8,
+                 HALF_CP_ADVANCE = 1, USE_TAP_FILE = 0, TAP_FILE = ('', '', ''), LLR_DW = 8, NFFT = 8, TRACK_SSB = 1):
+        self.IN_DW = int(IN_DW)
+        self.TRACK_SSB = int(TRACK_SSB)
+        self.PSS_LEN = int(PSS_LEN)
+        self.NFFT = int(NFFT)
+        self.FFT_LEN = 2 ** self.NFFT
+        self.CIC_RATE = cic_d.CIC_RATE(self.FFT_LEN)
+        self.CIC_N = 3
+        self.FFT_OUT_DW = 16
+        self.DDS_PHASE_DW = 20
+        self.CFO_DW = 20
+        self.C_DW = self.IN_DW + int(TAP_DW) + 2 + 2 * int(np.ceil(np.log2(self.PSS_LEN)))
+        self.SAMPLE_RATE = 3840000 * self.FFT_LEN // 256
+        # PSS detector FSM in frame_sync, the clock runs at the sample rate
+        self.CLKS_20MS = int(self.SAMPLE_RATE * 0.02)
+        self.CLKS_PSS_EARLY_WAKEUP = int(self.SAMPLE_RATE * 0.0001)
+        self.CLKS_PSS_LATE_TOLERANCE = int(self.SAMPLE_RATE * 0.0001)
+        # clock cycles from a sample entering the correlators until N_id_2_valid_o, C0_o and C1_o that are taken
+        # with it already contain the samples of the next PEAK_LATENCY - 2 cycles. With CIC_RATE = 2 that is the
+        # decimated sample after the peak. If the PSS is aligned to the decimated samples, its correlation is
+        # much smaller than at the peak and the CFO estimate is mostly noise, it can be several kHz off and the
+        # errors add up from SSB to SSB until the PSS is no longer detected. PSS_detector.sv latches C0 and C1 like
+        # this, with TRACK_SSB = 0 the model does the same, with TRACK_SSB C0 and C1 are taken at the peak and
+        # frame_sync restarts its SSB counter with every SSB, so that the model can follow long captures
+        self.PEAK_LATENCY = 4
+        # clock cycles after N_id_2_valid_o until the new mode from frame_sync disables the correlators
+        self.MODE_LATENCY = 2
+        # the CIC output with the last sample of the PSS symbol comes 2 input samples after it and after the CIC_N
+        # samples in the integrator pipeline, rounded up to whole outputs. DELAY_LINE_LEN is chosen so that
+        # frame_sync starts the PBCH symbol right after the PSS symbol
+        self.SSB_OFFSET = -1 - -(-self.CIC_N // self.CIC_RATE) * self.CIC_RATE
+        # a chunk with a detection is processed again up to the detection, short chunks keep this cheap
+        self.CHUNK_LEN = 2 ** 14
+
+        if PSS_LOCAL is None:
+            PSS_LOCAL = [PSS_taps.PSS_LOCAL(i, self.PSS_LEN, TAP_DW) for i in range(3)]
+        self.CFO_correction = CFO_correction.Model(self.IN_DW, DDS_PHASE_DW = self.DDS_PHASE_DW)
+        self.decimator = cic_d.Decimator(self.IN_DW, self.FFT_LEN, self.CIC_N)
+        self.PSS_detector = PSS_detector.Model(self.IN_DW, OUT_DW, TAP_DW, self.PSS_LEN, PSS_LOCAL, ALGO, WINDOW_LEN,
+                                               USE_TAP_FILE, TAP_FILE)
+        self.CFO_calc = CFO_calc.Model(self.C_DW, self.CFO_DW, self.DDS_PHASE_DW)
+        self.frame_sync = frame_sync.Model(self.NFFT, self.TRACK_SSB)
+        self.FFT_demod = FFT_demod.Model(self.IN_DW, HALF_CP_ADVANCE, self.FFT_OUT_DW, self.NFFT)
+        self.SSS_detector = SSS_detector.Model()
+        self.channel_estimator = channel_estimator.Model(self.FFT_OUT_DW)
+        self.demap = demap.Model(self.FFT_OUT_DW // 2, LLR_DW)
+        # segments of process_parallel() are one SSB period long, before a segment the correlators and the peak
+        # detector need PSS_LEN + WINDOW_LEN decimated samples of history, the CIC settles within a few samples.
+        # After a segment the SSB of a PSS at its end has to be complete, including the start of the next symbol.
+        self.SEGMENT_LEN = self.CLKS_20MS
+        self.SEGMENT_HISTORY = (self.PSS_LEN + int(WINDOW_LEN) + 3) * self.CIC_RATE
+        self.SEGMENT_TAIL = ((channel_estimator.SYMS_PER_PBCH + 2) * (self.FFT_LEN + self.frame_sync.CP1_LEN)
+                             + self.PEAK_LATENCY + self.MODE_LATENCY)
+        self.reset()
+
+    def timed(self, stage, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.timing[stage] += time.perf_counter() - start
+        return result
+
+    def CFO(self):
+        """CFO of the input in Hz that is currently corrected by the DDS"""
+        inc = int(self.CFO_correction.CFO_norm)
+        if inc >= 1 << (self.DDS_PHASE_DW - 1):
+            inc -= 1 << self.DDS_PHASE_DW
+        return -inc * self.SAMPLE_RATE / 2 ** self.DDS_PHASE_DW
+
+    def PSS_mode(self, pos):
+        """mode of the PSS detector at input sample pos and the first sample where it changes"""
+        if self.last_peak is None:
+            return PSS_detector.SEARCH, None
+        # clks_since_SSB starts one cycle after N_id_2_valid_o, mode_o is registered once more
+        valid = self.last_peak + self.PEAK_LATENCY + self.MODE_LATENCY
+        find_start = valid + self.CLKS_20MS - self.CLKS_PSS_EARLY_WAKEUP + 1
+        search_start = valid + self.CLKS_20MS + self.CLKS_PSS_LATE_TOLERANCE + 1
+        if pos < find_start:
+            return PSS_detector.PAUSE, find_start
+        if pos < search_start:
+            return PSS_detector.FIND, search_start
+        return PSS_detector.SEARCH, None
+
+    def save_state(self):
+        # the models replace their state arrays instead of changing them, so references are enough
+        cic_state = ('integrators', 'history', 'accumulator', 'combs', 'count', 'pending')
+        state = [(self.CFO_correction.dds, ('phase',)), (self.decimator.real, cic_state), (self.decimator.imag, cic_state),
+                 (self.PSS_detector, ('hist_re', 'hist_im', 'N_id_2'))]
+        state += [(p, ('history', 'count', 'last_peak', 'last_score')) for p in self.PSS_detector.peak_detectors]
+        return [(obj, {name: getattr(obj, name) for name in names}) for obj, names in state] + [self.num_decimated]
+
+    def restore_state(self, state):
+        for obj, values in state[:-1]:
+            for name, value in values.items():
+                setattr(obj, name, value)
+        self.num_decimated = state[-1]
+
+    def acquire_chunk(self, samples, corrected, start, stop, mode):
+        """CFO correction, decimation and PSS detection of the input samples start .. stop - 1,
+        returns the first input sample with N_id_2_valid_o, its N_id_2 and score or None"""
+        out = self.timed('CFO_correction', self.CFO_correction.process_chunk, samples[start:stop])
+        corrected[start:stop] = out
+        decimated = self.timed('decimator', self.decimator.process_chunk, out)
+        first = self.num_decimated
+        self.num_decimated += len(decimated)
+        if mode == PSS_detector.PAUSE or len(decimated) == 0:
+            return None
+        _, peak_valid, N_id_2, score = self.timed('PSS_detector', self.PSS_detector.process_chunk, decimated,
+                                                  mode = mode, requested_N_id_2 = self.requested_N_id_2)
+        peaks = np.flatnonzero(peak_valid)
+        if len(peaks) == 0:
+            return None
+        # the decimated sample k is taken with input sample k * CIC_RATE + CIC_RATE - 1
+        pos = (first + int(peaks[0])) * self.CIC_RATE + self.CIC_RATE - 1
+        return pos, int(N_id_2[peaks[0]]), int(score[peaks[0]])
+
+    def acquire(self, samples):
+        """CFO correction, decimator and PSS detector for a block of input samples, continues the stream of
+        the previous call. Returns (corrected, peaks) where corrected are the outputs of the complex multiplier
+        that go to frame_sync and peaks are the detections with PEAK_DTYPE."""
+        samples = np.asarray(samples)
+        corrected = np.zeros(len(samples), complex)
+        peaks = []
+        pos = 0
+        while pos < len(samples):
+            mode, mode_end = self.PSS_mode(self.num_samples + pos)
+            stop = min(pos + self.CHUNK_LEN, len(samples))
+            if mode_end is not None:
+                stop = min(stop, mode_end - self.num_samples)
+            state = self.save_state()
+            peak = self.acquire_chunk(samples, corrected, pos, stop, mode)
+            if peak is None:
+                pos = stop
+                continue
+
+            # process the chunk again up to the peak and the samples that still reach the correlators
+            # in the old mode, the samples after them see the new mode and CFO correction
+            peak_pos, N_id_2, score = peak
+            self.restore_state(state)
+            C0_pos = min(peak_pos + (1 if self.TRACK_SSB else self.PEAK_LATENCY - 1), len(samples))
+            self.acquire_chunk(samples, corrected, pos, C0_pos, mode)
+            C0, C1 = self.timed('PSS_detector', self.PSS_detector.partial_sums, N_id_2)
+            pos = min(peak_pos + self.PEAK_LATENCY + self.MODE_LATENCY + 1, len(samples))
+            self.acquire_chunk(samples, corrected, C0_pos, pos, mode)
+            angle, DDS_inc = self.timed('PSS_detector', self.CFO_calc.process, np.array([C0]), np.array([C1]))
+            # CFO_DDS_inc_o is relative to the last correction, the latency of CFO_calc is not modelled
+            self.CFO_correction.set_CFO(self.CFO_correction.CFO_norm - int(DDS_inc[0]))
+            self.last_peak = self.num_samples + peak_pos
+            self.requested_N_id_2 = N_id_2
+            peaks.append((self.last_peak, N_id_2, score, int(angle[0]), int(DDS_inc[0]), self.CFO()))
+        self.num_samples += len(samples)
+        return corrected, np.array(peaks, PEAK_DTYPE)
+
+    def symbols(self, corrected, start, tuser, symbol_start, first):
+        """FFT windows of the 3 symbols of the SSBs that start with the symbols symbol_start[first]"""
+        sym = first[:, np.newaxis] + np.arange(channel_estimator.SYMS_PER_PBCH)
+        sym_start = symbol_start[sym]
+        CP_len = self.frame_sync.unpack_tuser(tuser[np.searchsorted(start, sym_start, 'right') - 1])[3]
+        window = sym_start + self.FFT_demod.window_start(CP_len)
+        return corrected[window[..., np.newaxis] + np.arange(self.FFT_LEN)]
+
+    def SSBs(self, corrected, SSB_pos, ibar_SSB = 0, ibar_pos = None):
+        """frame_sync and the SSB processing after it for the whole stream of corrected samples
+
+        Returns (SSB_start, N_id_2_pos, data, N_id_1, N_id, ibar_SSB, llr) for the SSBs that are completely in
+        the stream, data are the equalized PBCH samples from the channel_estimator and llr the LLRs from demap.
+        """
+        num = len(corrected)
+        start, tuser, _, _, symbol_start, SSB_start = self.timed('frame_sync', self.frame_sync.process, num, SSB_pos,
+                                                                 ibar_SSB, ibar_pos)
+        # FFT_demod counts the symbols, the first symbol at SSB_start_o is the PBCH symbol and the second one the SSS symbol
+        # in SYNCED the SSB can be detected a few samples before or after the symbol start
+        first = np.clip(np.searchsorted(symbol_start, SSB_start), 1, max(len(symbol_start) - 1, 1))
+        if len(symbol_start) > 1:
+            first -= (SSB_start - symbol_start[first - 1]) < (symbol_start[first] - SSB_start)
+        complete = first + channel_estimator.SYMS_PER_PBCH < len(symbol_start)
+        SSB_start = SSB_start[complete]
+        first = first[complete]
+        if len(first) == 0:
+            empty = np.zeros(0, np.int64)
+            return SSB_start, empty, np.zeros((0, 432), complex), empty, empty, empty, np.zeros((0, 864), np.int64)
+
+        windows = self.symbols(corrected, start, tuser, symbol_start, first)
+        data, _ = self.timed('FFT_demod', self.FFT_demod.process, windows.reshape(-1, self.FFT_LEN))
+        data = data.reshape(len(first), channel_estimator.SYMS_PER_PBCH, -1)
+
+        N_id_2 = self.peak_N_id_2(SSB_start)
+        SSS_bits = SSS_detector.hard_bits(self.FFT_demod.SSS(data[:, 1]))
+        N_id_1, N_id, _ = self.timed('SSS_detector', self.SSS_detector.process, SSS_bits, N_id_2)
+
+        # the channel estimator gets a new N_id with every SSS detection. Its correlators for the rotated input keep
+        # accumulating over the SSBs like in the HDL, which gives wrong ibar_SSB after a few SSBs, so with TRACK_SSB
+        # they are cleared for every SSB
+        PBCH = np.zeros((len(first), 432), complex)
+        ibar = np.zeros(len(first), np.int64)
+        self.channel_estimator.reset()
+        for i in range(len(first)):
+            if self.TRACK_SSB:
+                self.channel_estimator.reset()
+            if i == 0 or N_id[i] != N_id[i - 1]:
+                self.timed('channel_estimator', self.channel_estimator.set_N_id, N_id[i])
+            PBCH[i:i + 1], ibar[i:i + 1] = self.timed('channel_estimator', self.channel_estimator.process, data[i:i + 1])
+        llr = self.timed('demap', self.demap.process, PBCH.ravel())[0].reshape(len(first), -1)
+        return SSB_start, N_id_2, PBCH, N_id_1, N_id, ibar, llr
+
+    def peak_N_id_2(self, SSB_start):
+        idx = np.searchsorted(self.peaks['pos'] + self.SSB_OFFSET, SSB_start)
+        return self.peaks['N_id_2'][np.minimum(idx, len(self.peaks) - 1)] if len(self.peaks) else np.zeros(len(SSB_start), np.int64)
+
+    def process(self, samples):
+        """block mode, processes samples starting from reset state
+
+        samples can be packed IN_DW words or complex values at 3.84 MSPS * FFT_LEN / 256. Returns (peaks, SSBs, PBCH, llr)
+        where peaks are all PSS detections with PEAK_DTYPE, SSBs are the SSBs from frame_sync with SSB_DTYPE, PBCH are
+        the equalized PBCH samples (m_axis_cest_out_tdata) with shape (num_SSBs, 432) and llr the PBCH LLRs
+        (m_axis_llr_out_tdata) with shape (num_SSBs, 864). The processing time of every stage is in self.timing.
+        """
+        self.reset()
+        samples = np.asarray(samples)
+        corrected, self.peaks = self.acquire(samples)
+        SSB_pos = self.peaks['pos'] + self.SSB_OFFSET
+
+        # frame_sync needs ibar_SSB from the channel estimator, it arrives after the SSB while the 3 SSB symbols
+        # do not depend on it, so the ibar_SSB of a first pass are applied at the end of the SSB in a second pass
+        SSB_start, _, _, _, _, ibar, _ = self.SSBs(corrected, SSB_pos)
+        ibar_pos = SSB_start + channel_estimator.SYMS_PER_PBCH * (self.FFT_LEN + self.frame_sync.CP2_LEN)
+        SSB_start, N_id_2, PBCH, N_id_1, N_id, ibar, llr = self.SSBs(corrected, SSB_pos, ibar, ibar_pos)
+
+        SSBs = np.zeros(len(SSB_start), SSB_DTYPE)
+        idx = np.searchsorted(SSB_pos, SSB_start)
+        for name in ('score', 'CFO_angle', 'CFO_DDS_inc', 'CFO'):
+            SSBs[name] = self.peaks[name][idx]
+        SSBs['pos'] = SSB_start
+        SSBs['N_id_2'] = N_id_2
+        SSBs['N_id_1'] = N_id_1
+        SSBs['N_id'] = N_id
+        SSBs['ibar_SSB'] = ibar
+        return self.peaks, SSBs, PBCH, llr
+
+    def segments(self, blocks, segment_len = None):
+        """splits a stream that arrives in blocks of samples into overlapping segments
+
+        Yields (samples, start, own_start, own_stop) for every segment as soon as its samples are complete, start is the
+        position of samples in the stream. A segment only reports the PSS detections at own_start .. own_stop - 1, the
+        own ranges of consecutive segments cover every sample exactly once. segment_len is rounded up to a multiple
+        of CIC_RATE.
+        """
+        segment_len = self.SEGMENT_LEN if segment_len is None else int(segment_len)
+        # segments have to start on the decimation grid of the stream, otherwise the CIC takes other samples
+        segment_len = -(-segment_len // self.CIC_RATE) * self.CIC_RATE
+        buffer = None
+        first = 0
+        own_start = 0
+        for block in itertools.chain(blocks, [None]):
+            if block is not None:
+                buffer = np.asarray(block) if buffer is None else np.concatenate((buffer, block))
+            if buffer is None:
+                continue
+            end = first + len(buffer)
+            while own_start < end:
+                own_stop = own_start + segment_len
+                if block is not None and end < own_stop + self.SEGMENT_TAIL:
+                    break
+                start = max(own_start - self.SEGMENT_HISTORY, 0)
+                yield buffer[start - first:own_stop + self.SEGMENT_TAIL - first], start, own_start, min(own_stop, end)
+                own_start = own_stop
+                # the history of the next segment has to stay in the buffer
+                drop = max(own_start - self.SEGMENT_HISTORY - first, 0)
+                buffer = buffer[drop:]
+                first += drop
+
+    def process_segment(self, samples, offset, own_start, own_stop):
+        """process() for a segment that starts at sample offset of the stream
+
+        Returns (peaks, SSBs, llr) with positions in the stream for the PSS detections at own_start .. own_stop - 1
+        and the SSBs that belong to them.
+        """
+        peaks, SSBs, _, llr = self.process(samples)
+        peaks['pos'] += offset
+        SSBs['pos'] += offset
+        own = (peaks['pos'] >= own_start) & (peaks['pos'] < own_stop)
+        # same assignment of SSBs to detections as in process()
+        idx = np.searchsorted(peaks['pos'] + self.SSB_OFFSET, SSBs['pos'])
+        own_SSB = own[idx] if len(peaks) else np.zeros(len(SSBs), bool)
+        return peaks[own], SSBs[own_SSB], llr[own_SSB]
+
+    def timing_report(self):
+        """processing time and throughput of every stage for the last call of process() as text"""
+        total = sum(self.timing.values())
+        lines = []
+        for stage in STAGES + ('total',):
+            seconds = total if stage == 'total' else self.timing[stage]
+            rate = self.num_samples / seconds / 1e6 if seconds > 0 else np.inf
+            lines.append(f'{stage:18s} {seconds * 1e3:10.1f} ms {rate:10.2f} MSPS')
+        real_time = self.num_samples / self.SAMPLE_RATE / total if total > 0 else np.inf
+        lines.append(f'{self.num_samples} samples, {real_time:.2f} x real time')
+        return '\n'.join(lines)
+
+    def reset(self):
+        self.CFO_correction.set_CFO(0)
+        self.CFO_correction.reset()
+        self.decimator.reset()
+        self.PSS_detector.reset()
+        self.channel_estimator.reset()
+        self.num_samples = 0
+        self.num_decimated = 0
+        self.last_peak = None
+        self.requested_N_id_2 = 0
+        self.peaks = np.zeros(0, PEAK_DTYPE)
+        self.timing = dict.fromkeys(STAGES, 0.0)
+
+# model of the worker processes of process_parallel()
+_worker_model = None
+
+def _init_worker(params):
+    global _worker_model
+    _worker_model = Model(**params)
+
+def _process_segment(samples, offset, own_start, own_stop):
+    return _worker_model.process_segment(samples, offset, own_start, own_stop)
+
+def process_segments(segments, max_workers = None, **params):
+    """Model.process_segment() for every (samples, start, own_start, own_stop) from segments in a process pool
+
+    params are the parameters of Model. Yields the results in the order of the segments, only a few segments per
+    worker are queued at a time, so segments can be a generator over a recording that does not fit into memory.
+    """
+    max_workers = max_workers or os.cpu_count()
+    with concurrent.futures.ProcessPoolExecutor(max_workers = max_workers, initializer = _init_worker,
+                                                initargs = (params,)) as executor:
+        pending = collections.deque()
+        for segment in segments:
+            pending.append(executor.submit(_process_segment, *segment))
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def merge(results):
+    """concatenates the (peaks, SSBs, llr) of consecutive segments"""
+    results = list(results)
+    if len(results) == 0:
+        return np.zeros(0, PEAK_DTYPE), np.zeros(0, SSB_DTYPE), np.zeros((0, 864), np.int64)
+    return tuple(np.concatenate([result[i] for result in results]) for i in range(3))
+
+def process_parallel(samples, max_workers = None, segment_len = None, **params):
+    """processes a long recording in a process pool, params are the parameters of Model
+
+    The recording is split into segments of one SSB period, see Model.segments(). Every segment starts from reset
+    state like a receiver that is switched on at the start of the segment, so CFO is the coarse estimate of the first
+    detection in the segment. Segments without an earlier detection in the stream give the same results as
+    Model.process(), also for SSBs across segment boundaries. Returns (peaks, SSBs, llr) like Model.process()
+    ordered by position.
+    """
+    segments = Model(**params).segments([np.asarray(samples)], segment_len)
+    return merge(process_segments(segments, max_workers, **params))
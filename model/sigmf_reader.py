@@ -0,0 +1,91 @@
+import json
+import os
+import numpy as np
+
+# Reader for SigMF recordings with complex integer samples. The .sigmf-data file is memory mapped as a structured
+# array with the fields re and im, so time windows of a long recording can be taken without reading the whole file.
+
+# SigMF datatypes that can be memory mapped and the dtype of one component
+DATATYPES = {
+    'ci32_le': '<i4',
+    'ci32_be': '>i4',
+    'ci16_le': '<i2',
+    'ci16_be': '>i2',
+    'ci8': 'i1'
+}
+
+def base_name(filename):
+    """filename without the .sigmf-data or .sigmf-meta extension"""
+    for extension in ('.sigmf-data', '.sigmf-meta'):
+        if filename.endswith(extension):
+            return filename[:-len(extension)]
+    return filename
+
+class Recording:
+    def __init__(self, filename):
+        """filename can be the .sigmf-data or .sigmf-meta file or the name without extension"""
+        base = base_name(filename)
+        self.data_file = base + '.sigmf-data'
+        with open(base + '.sigmf-meta') as f:
+            self.meta = json.load(f)
+        datatype = self.meta['global']['core:datatype']
+        if datatype not in DATATYPES:
+            raise ValueError(f'datatype {datatype} is not supported, only {", ".join(DATATYPES)}')
+        component = np.dtype(DATATYPES[datatype])
+        self.BITS = component.itemsize * 8
+        self.dtype = np.dtype([('re', component), ('im', component)])
+        self.sample_rate = float(self.meta['global']['core:sample_rate'])
+
+        captures = self.meta.get('captures', [])
+        header_bytes = captures[0].get('core:header_bytes', 0) if captures else 0
+        available = (os.path.getsize(self.data_file) - header_bytes) // self.dtype.itemsize
+        # SDRangel writes the number of samples into the captures, without it the whole file is used
+        if captures and all('core:length' in capture for capture in captures):
+            length = sum(int(capture['core:length']) for capture in captures)
+            if length > available:
+                raise ValueError(f'{self.data_file} has {available} samples, but the meta data has core:length = {length}')
+        else:
+            length = available
+        # the file is only mapped, samples are read from disk when they are accessed
+        if length > 0:
+            self.samples = np.memmap(self.data_file, self.dtype, mode = 'r', offset = header_bytes, shape = (length,))
+        else:
+            self.samples = np.zeros(0, self.dtype)
+
+    def __len__(self):
+        return len(self.samples)
+
+    @property
+    def duration(self):
+        return len(self) / self.sample_rate
+
+    def index(self, seconds):
+        """number of the sample at time seconds"""
+        return int(round(seconds * self.sample_rate))
+
+    def window(self, start = 0, duration = None):
+        """structured view of the samples from start for duration seconds, nothing is copied or read"""
+        first = min(self.index(start), len(self))
+        stop = len(self) if duration is None else min(first + self.index(duration), len(self))
+        return self.samples[first:stop]
+
+    def read_samples(self, start_index = 0, count = -1):
+        """reads count samples from start_index like sigmf.SigMFFile.read_samples() with autoscale,
+        returns complex64 samples scaled to -1 .. 1. count = -1 reads until the end of the recording"""
+        if start_index < 0 or start_index > len(self):
+            raise IOError(f'start_index {start_index} is outside of the recording')
+        stop = len(self) if count == -1 else start_index + count
+        if stop > len(self):
+            raise IOError('Cannot read beyond EOF.')
+        data = self.samples[start_index:stop]
+        samples = np.empty(len(data), np.complex64)
+        samples.real = data['re']
+        samples.imag = data['im']
+        samples *= np.float32(2.0 ** -(self.BITS - 1))
+        return samples
+
+    def read_window(self, start = 0, duration = None):
+        """read_samples() for a time window in seconds, the window is cut at the end of the recording"""
+        first = min(self.index(start), len(self))
+        count = len(self) - first if duration is None else min(self.index(duration), len(self) - first)
+        return self.read_samples(first, count)
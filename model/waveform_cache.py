@@ -0,0 +1,92 @@
+import hashlib
+import os
+import sys
+import numpy as np
+import scipy
+import scipy.signal
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import cache
+import sigmf_reader
+
+# Test waveforms from SigMF recordings after the preprocessing that the tests do before driving the samples into
+# the HDL: CFO rotation, normalization, decimation and scaling to IN_DW bit I/Q samples. The result is stored in the
+# cache with a key that contains a hash of the raw samples, so a changed recording never gives stale waveforms.
+# The key also contains PREPROCESS_VERSION and a hash of the decimator, so a changed preprocessing does not either.
+# The decimation uses scipy.signal.decimate() like the tests did, which gives exactly the same samples, even
+# though it filters the complex64 samples in complex64. fir_decimator differs from it by 1 LSB in a few samples.
+
+# increase this when preprocess() gives other results for the same parameters
+PREPROCESS_VERSION = 2
+
+def recording_hash(samples):
+    """sha1 of the raw samples of a recording window"""
+    return hashlib.sha1(np.ascontiguousarray(samples).view(np.uint8)).hexdigest()
+
+def decimator_hash(dec_factor):
+    """sha1 of the filter taps of scipy.signal.decimate() for dec_factor and the scipy version, None without decimation"""
+    if dec_factor <= 1:
+        return None
+    taps = scipy.signal.firwin(20 * dec_factor + 1, 1. / dec_factor, window = 'hamming')
+    return hashlib.sha1(taps.tobytes() + scipy.__version__.encode()).hexdigest()
+
+def default_scale(IN_DW):
+    """largest value of an IN_DW / 2 bit component"""
+    return 2 ** (IN_DW // 2 - 1) - 1
+
+def preprocess(samples, sample_rate, CFO = 0, dec_factor = 1, IN_DW = 32, scale = None):
+    """preprocessing like in the tests, samples are complex values
+
+    The samples are rotated by CFO Hz, decimated with scipy.signal.decimate() and scaled so that the largest component
+    is scale, which is 2 ** (IN_DW // 2 - 1) - 1 by default. The fractional part is truncated like .astype(int).
+    Returns an array with shape (num, 2) of I and Q as int16 or int32, whichever holds all values.
+    """
+    waveform = np.array(samples, np.complex64)
+    if scale is None:
+        scale = default_scale(IN_DW)
+    if CFO:
+        waveform *= np.exp(np.arange(len(waveform)) * 1j * 2 * np.pi * CFO / sample_rate)
+    waveform /= max(waveform.real.max(), waveform.imag.max())
+    if dec_factor > 1:
+        waveform = scipy.signal.decimate(waveform, dec_factor, ftype = 'fir')
+        waveform /= max(waveform.real.max(), waveform.imag.max())
+    waveform *= scale
+    iq = np.stack((waveform.real, waveform.imag), axis = -1).astype(np.int64)
+    # values outside of IN_DW bits are kept like in the tests, they only decide the type
+    for dtype in (np.int16, np.int32):
+        if len(iq) == 0 or (iq.min() >= np.iinfo(dtype).min and iq.max() <= np.iinfo(dtype).max):
+            return iq.astype(dtype)
+    return iq
+
+def preprocessed(filename, start = 0, duration = None, CFO = 0, dec_factor = 1, IN_DW = 32, scale = None):
+    """preprocess() of a whole SigMF recording, the result is calculated once and then memory mapped from the cache.
+    Returns the read only (num, 2) I/Q array for the time window from start for duration seconds.
+
+    Like in the tests before the cache, the normalization uses the maximum of the whole recording and the
+    decimator sees the whole recording, so the samples of a window do not depend on the length of the window."""
+    recording = sigmf_reader.Recording(filename)
+    if scale is None:
+        scale = default_scale(IN_DW)
+    key = {
+        'version': PREPROCESS_VERSION,
+        'decimator': decimator_hash(dec_factor),
+        'recording': recording_hash(recording.samples),
+        'num': len(recording),
+        'CFO': CFO,
+        'dec_factor': dec_factor,
+        'IN_DW': IN_DW,
+        'scale': scale
+    }
+    def calc():
+        return preprocess(recording.read_samples(), recording.sample_rate, CFO, dec_factor, IN_DW, scale)
+    iq = cache.cached_array('waveform', key, calc, mmap = True)
+    # output n of the decimator is centered at input n * dec_factor
+    first = min(recording.index(start), len(recording))
+    stop = len(recording) if duration is None else min(first + recording.index(duration), len(recording))
+    step = max(dec_factor, 1)
+    return iq[-(-first // step):-(-stop // step)]
+
+def load(filename, start = 0, duration = None, CFO = 0, dec_factor = 1, IN_DW = 32, scale = None):
+    """preprocessed() as complex values with integer real and imaginary parts, like the tests use them"""
+    iq = preprocessed(filename, start, duration, CFO, dec_factor, IN_DW, scale)
+    return iq[:, 0] + 1j * iq[:, 1]
@@ -1,5 +1,6 @@
 import numpy as np
 import os
+import sys
 import pytest
 import logging
 import matplotlib.pyplot as plt
@@ -15,12 +16,10 @@ CLK_PERIOD_NS = 8
 CLK_PERIOD_S = CLK_PERIOD_NS * 0.000000001
 tests_dir = os.path.abspath(os.path.dirname(__file__))
 rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', 'hdl'))
-
-def _twos_comp(val, bits):
-    """compute the 2's complement of int value val"""
-    if (val & (1 << (bits - 1))) != 0:
-        val = val - (1 << bits)
-    return int(val)
+model_dir = os.path.abspath(os.path.join(tests_dir, '..', 'model'))
+sys.path.append(model_dir)
+import fixed_point
+import CFO_calc
 
 class TB(object):
     def __init__(self, dut):
@@ -28,6 +27,7 @@ class TB(object):
         self.C_DW = int(dut.C_DW.value)
         self.CFO_DW = int(dut.CFO_DW.value)
         self.DDS_DW = int(dut.DDS_DW.value)
+        self.model = CFO_calc.Model(self.C_DW, self.CFO_DW, self.DDS_DW)
 
         self.log = logging.getLogger('cocotb.tb')
         self.log.setLevel(logging.DEBUG)
@@ -52,13 +52,16 @@ async def simple_test(dut):
     C0 = 1
     C1 = C0 * np.exp(1j * angle / 180 * np.pi)
     MAX_VAL = int(2 ** (tb.C_DW // 2 - 1) - 1)
-    dut.C0_i.value = ((int(C0.imag*MAX_VAL) & int(2**(tb.C_DW//2)-1)) << (tb.C_DW//2)) + (int(C0.real*MAX_VAL) & int(2**(tb.C_DW//2)-1))
-    dut.C1_i.value = ((int(C1.imag*MAX_VAL) & int(2**(tb.C_DW//2)-1)) << (tb.C_DW//2)) + (int(C1.real*MAX_VAL) & int(2**(tb.C_DW//2)-1))
+    C0_i = ((int(C0.imag*MAX_VAL) & int(2**(tb.C_DW//2)-1)) << (tb.C_DW//2)) + (int(C0.real*MAX_VAL) & int(2**(tb.C_DW//2)-1))
+    C1_i = ((int(C1.imag*MAX_VAL) & int(2**(tb.C_DW//2)-1)) << (tb.C_DW//2)) + (int(C1.real*MAX_VAL) & int(2**(tb.C_DW//2)-1))
+    dut.C0_i.value = C0_i
+    dut.C1_i.value = C1_i
     dut.valid_i.value = 1
 
     await RisingEdge(dut.clk_i)
     dut.valid_i.value = 0
-    received_angle = 0
+    CFO_angle_word = 0
+    DDS_inc_word = 0
 
     clk_cnt = 0
     max_clk_cnt = 1000
@@ -66,15 +69,24 @@ async def simple_test(dut):
         await RisingEdge(dut.clk_i)
         clk_cnt += 1
         if (dut.valid_o.value == 1):
-            received_angle = _twos_comp(dut.CFO_angle_o.value.integer, tb.CFO_DW) / (2**(tb.CFO_DW-1) - 1) * 180
-            print(f'received CFO {received_angle} deg')
-            print(f'expected CFO {angle} deg')
-            DDS_inc = _twos_comp(dut.CFO_DDS_inc_o.value.integer, tb.DDS_DW)
-            print(f'received DDS inc {DDS_inc}')
+            CFO_angle_word = dut.CFO_angle_o.value.integer
+            DDS_inc_word = dut.CFO_DDS_inc_o.value.integer
             break
 
+    CFO_angle = fixed_point.sign_extend(CFO_angle_word, tb.CFO_DW)
+    received_angle = CFO_angle / (2**(tb.CFO_DW-1) - 1) * 180
+    print(f'received CFO {received_angle} deg')
+    print(f'expected CFO {angle} deg')
+    DDS_inc = fixed_point.sign_extend(DDS_inc_word, tb.DDS_DW)
+    print(f'received DDS inc {DDS_inc}')
+
     assert np.abs(received_angle + angle) < 1
 
+    angle_model, DDS_inc_model = tb.model.process([C0_i], [C1_i])
+    print(f'model CFO {angle_model[0] / (2**(tb.CFO_DW-1) - 1) * 180} deg, DDS inc {DDS_inc_model[0]}')
+    assert CFO_angle == angle_model[0]
+    assert DDS_inc == DDS_inc_model[0]
+
 @pytest.mark.parametrize("C_DW", [30, 32])
 @pytest.mark.parametrize("CFO_DW", [20, 32])
 @pytest.mark.parametrize("DDS_DW", [20])
@@ -1,6 +1,6 @@
 import numpy as np
-import scipy
 import os
+import sys
 import pytest
 import logging
 import importlib
@@ -14,18 +14,17 @@ from cocotb.triggers import Timer
 from cocotb.triggers import RisingEdge
 
 import py3gpp
-import sigmf
 
 CLK_PERIOD_NS = 8
 CLK_PERIOD_S = CLK_PERIOD_NS * 0.000000001
 tests_dir = os.path.abspath(os.path.dirname(__file__))
 rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', 'hdl'))
-
-def _twos_comp(val, bits):
-    """compute the 2's complement of int value val"""
-    if (val & (1 << (bits - 1))) != 0:
-        val = val - (1 << bits)
-    return int(val)
+model_dir = os.path.abspath(os.path.join(tests_dir, '..', 'model'))
+sys.path.append(model_dir)
+import waveform_cache
+import PSS_taps
+import fixed_point
+import CFO_correction
 
 class TB(object):
     def __init__(self, dut):
@@ -39,6 +38,9 @@ class TB(object):
         self.MULT_REUSE = int(dut.MULT_REUSE.value)
         self.CIC_OUT_DW = int(dut.CIC_OUT_DW.value)
         self.DDS_PHASE_DW = int(dut.DDS_PHASE_DW.value)
+        self.DDS_OUT_DW = int(dut.DDS_OUT_DW.value)
+        self.COMPL_MULT_OUT_DW = int(dut.COMPL_MULT_OUT_DW.value)
+        self.CFO_correction = CFO_correction.Model(self.IN_DW, self.DDS_OUT_DW, self.DDS_PHASE_DW, self.COMPL_MULT_OUT_DW)
 
         self.log = logging.getLogger('cocotb.tb')
         self.log.setLevel(logging.DEBUG)
@@ -75,19 +77,12 @@ class TB(object):
 @cocotb.test()
 async def simple_test(dut):
     tb = TB(dut)
-    handle = sigmf.sigmffile.fromfile('../../tests/30720KSPS_dl_signal.sigmf-data')
-    waveform = handle.read_samples()
     fs = 30720000
     CFO = int(os.getenv('CFO'))
     print(f'CFO = {CFO} Hz')
-    waveform *= np.exp(np.arange(len(waveform))*1j*2*np.pi*CFO/fs)
-    waveform /= max(waveform.real.max(), waveform.imag.max())
     decimation_factor = 8
     FFT_LEN  = 2048 // decimation_factor
-    waveform = scipy.signal.decimate(waveform, decimation_factor, ftype='fir')
-    waveform /= max(waveform.real.max(), waveform.imag.max())
-    waveform *= 2 ** (tb.IN_DW // 2 - 1) - 1
-    waveform = waveform.real.astype(int) + 1j*waveform.imag.astype(int)
+    waveform = waveform_cache.load('../../tests/30720KSPS_dl_signal.sigmf-data', 0, 0.05, CFO = CFO, dec_factor = decimation_factor, IN_DW = tb.IN_DW)
 
     requested_CFO_corr = int(os.environ['CFO_CORR'])
     print(f'requested CFO correction is {requested_CFO_corr} Hz')
@@ -110,10 +105,20 @@ async def simple_test(dut):
     C0 = []
     C1 = []
     C_DW = int(tb.CIC_OUT_DW + tb.TAP_DW + 2 + 2*np.ceil(np.log2(tb.PSS_LEN)))
+    # inputs that are sampled with every clock edge since CFO_norm_in was set, and the multiplier outputs
+    in_data = [0, 0]
+    in_valid = [0, 0]
+    mult_data = []
+    mult_valid = []
     while rx_counter < num_items:
         await RisingEdge(dut.clk_i)
+        # the outputs are read before the registers update, so they belong to the previous clock edge
+        mult_valid.append(dut.mult_out_tvalid.value.integer)
+        mult_data.append(dut.mult_out_tdata.value.integer if mult_valid[-1] else 0)
         if clk_div < (decimation_factor - 1):
             dut.s_axis_in_tvalid.value = 0
+            in_data.append(in_data[-1])
+            in_valid.append(0)
             clk_div += 1
         else:
             clk_div = 0
@@ -122,15 +127,25 @@ async def simple_test(dut):
             dut.s_axis_in_tdata.value = data
             dut.s_axis_in_tvalid.value = 1
             tb.model.set_data(data)
+            in_data.append(data)
+            in_valid.append(1)
             in_counter += 1
 
         if dut.m_axis_correlator_debug_tvalid.value.integer == 1:
             received[rx_counter] = dut.m_axis_correlator_debug_tdata.value.integer
-            C0.append(_twos_comp(dut.C0.value.integer & (2 ** (C_DW // 2) - 1),C_DW // 2) \
-                    + 1j * _twos_comp((dut.C0.value.integer >> (C_DW // 2)) & (2 ** (C_DW // 2) - 1), C_DW // 2))
-            C1.append(_twos_comp(dut.C1.value.integer & (2 ** (C_DW // 2) - 1), C_DW // 2) \
-                    + 1j * _twos_comp((dut.C1.value.integer >> (C_DW // 2)) & (2 ** (C_DW // 2) - 1), C_DW // 2))
+            C0.append(dut.C0.value.integer)
+            C1.append(dut.C1.value.integer)
             rx_counter  += 1
+    C0 = fixed_point.unpack_complex(C0, C_DW)
+    C1 = fixed_point.unpack_complex(C1, C_DW)
+
+    # DDS and complex multiplier have to match the model in every clock cycle, this also checks their latency
+    # and that the phase accumulator adds CFO_norm_in
+    model_data, model_valid = tb.CFO_correction.process_cycles(in_data, in_valid, eff_CFO_corr_norm)
+    model_valid = model_valid[:len(mult_valid)]
+    assert np.array_equal(np.array(mult_valid, bool), model_valid)
+    mult_data = fixed_point.unpack_complex(np.array(mult_data)[model_valid], tb.COMPL_MULT_OUT_DW)
+    assert np.array_equal(mult_data, model_data[:len(mult_valid)][model_valid])
 
     PSS_LEN = 128
     ssb_start = np.argmax(received) - PSS_LEN
@@ -219,17 +234,7 @@ def test(IN_DW, OUT_DW, TAP_DW, ALGO, CFO, MULT_REUSE, CFO_CORR, PSS_CORRELATOR_
     parameters['PSS_CORRELATOR_MR'] = PSS_CORRELATOR_MR
 
     # imaginary part is in upper 16 Bit
-    PSS = np.zeros(PSS_LEN, 'complex')
-    PSS[0:-1] = py3gpp.nrPSS(2)
-    taps = np.fft.ifft(np.fft.fftshift(PSS))
-    taps /= max(taps.real.max(), taps.imag.max())
-    taps *= 2 ** (TAP_DW // 2 - 1) - 1
-    # for i in range(10):
-    #     print(f'taps[{i}] = {taps[i]}')
-    parameters['PSS_LOCAL'] = 0
-    for i in range(len(taps)):
-        parameters['PSS_LOCAL'] += ((int(np.imag(taps[i])) & (2 ** (TAP_DW // 2) - 1)) << (TAP_DW * i + TAP_DW // 2)) \
-                                +  ((int(np.real(taps[i])) & (2 ** (TAP_DW // 2) - 1)) << (TAP_DW * i))
+    parameters['PSS_LOCAL'] = PSS_taps.PSS_LOCAL(2, PSS_LEN, TAP_DW, scale = 2 ** (TAP_DW // 2 - 1) - 1)
     extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
     os.environ['CFO'] = str(CFO)
     os.environ['CFO_CORR'] = str(CFO_CORR)
@@ -1,6 +1,6 @@
 import numpy as np
-import scipy
 import os
+import sys
 import pytest
 import logging
 import importlib
@@ -14,18 +14,17 @@ from cocotb.triggers import Timer
 from cocotb.triggers import RisingEdge
 
 import py3gpp
-import sigmf
 
 CLK_PERIOD_NS = 8
 CLK_PERIOD_S = CLK_PERIOD_NS * 0.000000001
 tests_dir = os.path.abspath(os.path.dirname(__file__))
 rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', 'hdl'))
-
-def _twos_comp(val, bits):
-    """compute the 2's complement of int value val"""
-    if (val & (1 << (bits - 1))) != 0:
-        val = val - (1 << bits)
-    return int(val)
+model_dir = os.path.abspath(os.path.join(tests_dir, '..', 'model'))
+sys.path.append(model_dir)
+import waveform_cache
+import PSS_taps
+import fixed_point
+import cic_d
 
 class TB(object):
     def __init__(self, dut):
@@ -61,13 +60,7 @@ class TB(object):
 @cocotb.test()
 async def simple_test(dut):
     tb = TB(dut)
-    handle = sigmf.sigmffile.fromfile('../../tests/30720KSPS_dl_signal.sigmf-data')
-    waveform = handle.read_samples()
-    waveform /= max(waveform.real.max(), waveform.imag.max())
-    waveform = scipy.signal.decimate(waveform, 16//2, ftype='fir')
-    waveform /= max(waveform.real.max(), waveform.imag.max())
-    waveform *= 2 ** (tb.IN_DW // 2 - 1)
-    waveform = waveform.real.astype(int) + 1j*waveform.imag.astype(int)
+    waveform = waveform_cache.load('../../tests/30720KSPS_dl_signal.sigmf-data', 0, 0.05, dec_factor = 16//2, IN_DW = tb.IN_DW, scale = 2 ** (tb.IN_DW // 2 - 1))
 
     await tb.cycle_reset()
 
@@ -91,11 +84,18 @@ async def simple_test(dut):
             received_correlator.append(dut.m_axis_correlator_debug_tdata.value.integer)
 
         if dut.m_axis_cic_debug_tvalid.value.binstr == '1':
-            received_data.append(1j*_twos_comp(dut.m_axis_cic_debug_tdata.value.integer & (2**(tb.OUT_DW//2) - 1), tb.OUT_DW//2)
-                + _twos_comp((dut.m_axis_cic_debug_tdata.value.integer>>(tb.OUT_DW//2)) & (2**(tb.OUT_DW//2) - 1), tb.OUT_DW//2))
+            received_data.append(dut.m_axis_cic_debug_tdata.value.integer)
 
         received[rx_counter] = dut.peak_detected_o.value.integer
         rx_counter += 1
+    received_re, received_im = fixed_point.unpack_iq(received_data, tb.IN_DW)
+
+    # the cic outputs that are still in the comb pipeline at the end of the simulation are missing in the hdl data
+    model_data = cic_d.Decimator(tb.IN_DW).process(waveform[:in_counter])
+    print(f'received {len(received_re)} decimated samples, model {len(model_data)}')
+    assert len(model_data) - 3 <= len(received_re) <= len(model_data)
+    assert np.array_equal(received_re, model_data.real[:len(received_re)])
+    assert np.array_equal(received_im, model_data.imag[:len(received_im)])
 
     peak_pos = np.argmax(received)
     if 'PLOTS' in os.environ and os.environ['PLOTS'] == '1':
@@ -144,15 +144,7 @@ def test(IN_DW, OUT_DW, TAP_DW, ALGO, WINDOW_LEN):
     parameters['WINDOW_LEN'] = WINDOW_LEN
 
     # imaginary part is in upper 16 Bit
-    PSS = np.zeros(PSS_LEN, 'complex')
-    PSS[0:-1] = py3gpp.nrPSS(2)
-    taps = np.fft.ifft(np.fft.fftshift(PSS))
-    taps /= max(taps.real.max(), taps.imag.max())
-    taps *= 2 ** (TAP_DW // 2 - 1)
-    parameters['PSS_LOCAL'] = 0
-    for i in range(len(taps)):
-        parameters['PSS_LOCAL'] += ((int(np.round(np.imag(taps[i]))) & (2 ** (TAP_DW // 2) - 1)) << (TAP_DW * i + TAP_DW // 2)) \
-                                 + ((int(np.round(np.real(taps[i]))) & (2 ** (TAP_DW // 2) - 1)) << (TAP_DW * i))
+    parameters['PSS_LOCAL'] = PSS_taps.PSS_LOCAL(2, PSS_LEN, TAP_DW, rounding = 'round')
     extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
     parameters_no_taps = parameters.copy()
     del parameters_no_taps['PSS_LOCAL']
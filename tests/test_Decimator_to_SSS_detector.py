@@ -1,6 +1,6 @@
 import numpy as np
-import scipy
 import os
+import sys
 import pytest
 import logging
 import importlib
@@ -14,18 +14,17 @@ from cocotb.triggers import Timer
 from cocotb.triggers import RisingEdge
 
 import py3gpp
-import sigmf
 
 CLK_PERIOD_NS = 8
 CLK_PERIOD_S = CLK_PERIOD_NS * 0.000000001
 tests_dir = os.path.abspath(os.path.dirname(__file__))
 rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', 'hdl'))
-
-def _twos_comp(val, bits):
-    """compute the 2's complement of int value val"""
-    if (val & (1 << (bits - 1))) != 0:
-        val = val - (1 << bits)
-    return int(val)
+model_dir = os.path.abspath(os.path.join(tests_dir, '..', 'model'))
+sys.path.append(model_dir)
+import waveform_cache
+import PSS_taps
+import fixed_point
+import SSS_detector
 
 class TB(object):
     def __init__(self, dut):
@@ -71,17 +70,11 @@ class TB(object):
 async def simple_test(dut):
     tb = TB(dut)
     CFO = int(os.getenv('CFO'))
-    handle = sigmf.sigmffile.fromfile('../../tests/30720KSPS_dl_signal.sigmf-data')
-    waveform = handle.read_samples()
     fs = 30720000
     print(f'CFO = {CFO} Hz')
-    waveform *= np.exp(np.arange(len(waveform)) * 1j * 2 * np.pi * CFO / fs)
-    waveform /= max(waveform.real.max(), waveform.imag.max())
     dec_factor = 2048 // (2 ** tb.NFFT)
-    waveform = scipy.signal.decimate(waveform, dec_factor, ftype='fir')  # decimate to 3.840 MSPS
-    waveform /= max(waveform.real.max(), waveform.imag.max())
-    waveform *= (2 ** (tb.IN_DW // 2 - 1) - 1)
-    waveform = waveform.real.astype(int) + 1j * waveform.imag.astype(int)
+    # decimate to 3.840 MSPS
+    waveform = waveform_cache.load('../../tests/30720KSPS_dl_signal.sigmf-data', 0, 0.05, CFO = CFO, dec_factor = dec_factor, IN_DW = tb.IN_DW)
 
     await tb.cycle_reset()
 
@@ -141,12 +134,12 @@ async def simple_test(dut):
         if dut.PBCH_valid_o.value.integer == 1:
             # print(f"rx PBCH[{len(received_PBCH):3d}] re = {dut.m_axis_out_tdata.value.integer & (2**(FFT_OUT_DW//2) - 1):4x} " \
             #     "im = {(dut.m_axis_out_tdata.value.integer>>(FFT_OUT_DW//2)) & (2**(FFT_OUT_DW//2) - 1):4x}")
-            received_PBCH.append(_twos_comp(dut.m_axis_out_tdata.value.integer & (2**(FFT_OUT_DW//2) - 1), FFT_OUT_DW//2)
-                + 1j * _twos_comp((dut.m_axis_out_tdata.value.integer>>(FFT_OUT_DW//2)) & (2**(FFT_OUT_DW//2) - 1), FFT_OUT_DW//2))
+            received_PBCH.append(dut.m_axis_out_tdata.value.integer)
 
         if dut.SSS_valid_o.value.integer == 1:
-            received_SSS.append(_twos_comp(dut.m_axis_out_tdata.value.integer & (2**(FFT_OUT_DW//2) - 1), FFT_OUT_DW//2)
-                + 1j * _twos_comp((dut.m_axis_out_tdata.value.integer>>(FFT_OUT_DW//2)) & (2**(FFT_OUT_DW//2) - 1), FFT_OUT_DW//2))
+            received_SSS.append(dut.m_axis_out_tdata.value.integer)
+    received_PBCH = fixed_point.unpack_complex(received_PBCH, FFT_OUT_DW)
+    received_SSS = fixed_point.unpack_complex(received_SSS, FFT_OUT_DW)
 
     assert len(received_SSS) == SSS_LEN
     
@@ -155,10 +148,12 @@ async def simple_test(dut):
     assert detected_N_id == 209
     assert detected_N_id_1 == 69
 
-    corr = np.zeros(335)
-    for i in range(335):
-        sss = py3gpp.nrSSS(i)
-        corr[i] = np.abs(np.vdot(sss, received_SSS))
+    # the SSS_detector gets the hard decisions of the received SSS
+    N_id_1_model, N_id_model, _ = SSS_detector.Model().process(SSS_detector.hard_bits(received_SSS), detected_N_id % 3)
+    assert detected_N_id_1 == N_id_1_model[0]
+    assert detected_N_id == N_id_model[0]
+
+    corr = np.abs(SSS_detector.SSS_table() @ received_SSS)
     detected_NID1 = np.argmax(corr)
     assert detected_NID1 == 209
 
@@ -240,25 +235,12 @@ def test(IN_DW, OUT_DW, TAP_DW, ALGO, WINDOW_LEN, CFO, HALF_CP_ADVANCE, USE_TAP_
 
     for i in range(3):
         # imaginary part is in upper 16 Bit
-        PSS = np.zeros(PSS_LEN, 'complex')
-        PSS[0:-1] = py3gpp.nrPSS(i)
-        taps = np.fft.ifft(np.fft.fftshift(PSS))
-        taps /= max(taps.real.max(), taps.imag.max())
-        taps *= 2 ** (TAP_DW // 2 - 1)
-        parameters[f'PSS_LOCAL_{i}'] = 0
-        PSS_taps = np.empty(PSS_LEN, int)
-        for k in range(len(taps)):
-            if not USE_TAP_FILE:
-                parameters[f'PSS_LOCAL_{i}'] += ((int(np.round(np.imag(taps[k]))) & (2 ** (TAP_DW // 2) - 1)) << (TAP_DW * k + TAP_DW // 2)) \
-                                        + ((int(np.round(np.real(taps[k]))) & (2 ** (TAP_DW // 2) - 1)) << (TAP_DW * k))
-            else:
-                PSS_taps[k] = ((int(np.imag(taps[k])) & (2 ** (TAP_DW // 2) - 1)) << (TAP_DW // 2)) \
-                                        + (int(np.real(taps[k])) & (2 ** (TAP_DW // 2) - 1))              
+        parameters[f'PSS_LOCAL_{i}'] = 0 if USE_TAP_FILE else PSS_taps.PSS_LOCAL(i, PSS_LEN, TAP_DW, rounding = 'round')
         if USE_TAP_FILE:
             parameters[f'TAP_FILE_{i}'] = f'\"../{folder}_PSS_{i}_taps.txt\"'
             os.environ[f'TAP_FILE_{i}'] = f'../{folder}_PSS_{i}_taps.txt'
             os.makedirs("sim_build", exist_ok=True)
-            np.savetxt(sim_build + f'_PSS_{i}_taps.txt', PSS_taps, fmt = '%x', delimiter = ' ')
+            PSS_taps.write_tap_file(sim_build + f'_PSS_{i}_taps.txt', PSS_taps.calc_taps(i, PSS_LEN, TAP_DW), TAP_DW)
     extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
     
     compile_args = []
@@ -1,6 +1,6 @@
 import numpy as np
-import scipy
 import os
+import sys
 import pytest
 import logging
 import importlib
@@ -14,12 +14,15 @@ from cocotb.triggers import Timer
 from cocotb.triggers import RisingEdge
 
 import py3gpp
-import sigmf
 
 CLK_PERIOD_NS = 8
 CLK_PERIOD_S = CLK_PERIOD_NS * 0.000000001
 tests_dir = os.path.abspath(os.path.dirname(__file__))
 rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', 'hdl'))
+model_dir = os.path.abspath(os.path.join(tests_dir, '..', 'model'))
+sys.path.append(model_dir)
+import waveform_cache
+import PSS_taps
 
 class TB(object):
     def __init__(self, dut):
@@ -50,13 +53,6 @@ class TB(object):
         self.model = foo.Model(self.IN_DW, self.OUT_DW, self.TAP_DW, self.PSS_LEN, self.PSS_LOCAL, self.ALGO, self.USE_TAP_FILE, self.TAP_FILE)
 
         cocotb.start_soon(Clock(self.dut.clk_i, CLK_PERIOD_NS, units='ns').start())
-        cocotb.start_soon(self.model_clk(CLK_PERIOD_NS, 'ns'))
-
-    async def model_clk(self, period, period_units):
-        timer = Timer(period, period_units)
-        while True:
-            self.model.tick()
-            await timer
 
     async def generate_input(self):
         pass
@@ -69,37 +65,27 @@ class TB(object):
         await RisingEdge(self.dut.clk_i)
         self.dut.reset_ni.value = 1
         await RisingEdge(self.dut.clk_i)
-        self.model.reset()
 
 @cocotb.test()
 async def simple_test(dut):
     tb = TB(dut)
-    handle = sigmf.sigmffile.fromfile('../../tests/30720KSPS_dl_signal.sigmf-data')
-    waveform = handle.read_samples()
     fs = 30720000
     CFO = int(os.getenv('CFO'))
     print(f'CFO = {CFO} Hz')
-    waveform *= np.exp(np.arange(len(waveform))*1j*2*np.pi*CFO/fs)
-    waveform /= max(waveform.real.max(), waveform.imag.max())
-    waveform = scipy.signal.decimate(waveform, 16, ftype='fir')
-    waveform /= max(waveform.real.max(), waveform.imag.max())
-    waveform *= 2 ** (tb.IN_DW // 2 - 1) - 1
-    waveform = waveform.real.astype(int) + 1j*waveform.imag.astype(int)
+    waveform = waveform_cache.load('../../tests/30720KSPS_dl_signal.sigmf-data', 0, 0.05, CFO = CFO, dec_factor = 16, IN_DW = tb.IN_DW)
     await tb.cycle_reset()
 
     num_items = 500
     rx_counter = 0
-    rx_counter_model = 0
     in_counter = 0
     received = np.empty(num_items, int)
-    received_model = np.empty(num_items, int)
+    received_model, _ = tb.model.process(waveform[:num_items])
     while rx_counter < num_items:
         await RisingEdge(dut.clk_i)
         data = (((int(waveform[in_counter].imag)  & (2 ** (tb.IN_DW // 2) - 1)) << (tb.IN_DW // 2)) \
               + ((int(waveform[in_counter].real)) & (2 ** (tb.IN_DW // 2) - 1))) & (2 ** tb.IN_DW - 1)
         dut.s_axis_in_tdata.value = data
         dut.s_axis_in_tvalid.value = 1
-        tb.model.set_data(data)
         in_counter += 1
 
         if dut.m_axis_out_tvalid == 1:
@@ -107,11 +93,6 @@ async def simple_test(dut):
             # print(f'{rx_counter}: rx hdl {received[rx_counter]}')
             rx_counter  += 1
 
-        if tb.model.data_valid() and rx_counter_model < num_items:
-            received_model[rx_counter_model] = tb.model.get_data()
-            # print(f'{rx_counter_model}: rx mod {received_model[rx_counter_model]}')
-            rx_counter_model += 1
-
     ssb_start = np.argmax(received)
     print(f'max model {max(received_model)} max hdl {max(received)}')
     if 'PLOTS' in os.environ and os.environ['PLOTS'] == '1':
@@ -126,15 +107,11 @@ async def simple_test(dut):
     print(f'max correlation is {received[ssb_start]} at {ssb_start}')
 
     print(f'max model-hdl difference is {max(np.abs(received - received_model))}')
-    if tb.ALGO == 0:
-        #ok_limit = 0.0001
-        #for i in range(len(received)):
-        #    assert np.abs((received[i] - received_model[i]) / received[i]) < ok_limit
-        for i in range(len(received)):
-            assert received[i] == received_model[i]
-    else:
-        # there is not yet a model for ALGO=1
-        pass
+    #ok_limit = 0.0001
+    #for i in range(len(received)):
+    #    assert np.abs((received[i] - received_model[i]) / received[i]) < ok_limit
+    for i in range(len(received)):
+        assert received[i] == received_model[i]
 
     assert ssb_start == 412
     assert len(received) == num_items
@@ -166,22 +143,8 @@ def test(IN_DW, OUT_DW, TAP_DW, ALGO, CFO, USE_TAP_FILE):
     parameters['USE_TAP_FILE'] = USE_TAP_FILE
 
     # imaginary part is in upper 16 Bit
-    PSS = np.zeros(PSS_LEN, 'complex')
-    PSS[0:-1] = py3gpp.nrPSS(2)
-    taps = np.fft.ifft(np.fft.fftshift(PSS))
-    taps /= max(taps.real.max(), taps.imag.max())
-    taps *= 2 ** (TAP_DW // 2 - 1) - 1
-    # for i in range(10):
-    #     print(f'taps[{i}] = {taps[i]}')
-    parameters['PSS_LOCAL'] = 0
-    PSS_taps = np.empty(PSS_LEN, int)
-    for i in range(len(taps)):
-        if not USE_TAP_FILE:
-            parameters['PSS_LOCAL'] += ((int(np.imag(taps[i])) & (2 ** (TAP_DW // 2) - 1)) << (TAP_DW * i + TAP_DW // 2)) \
-                                    +  ((int(np.real(taps[i])) & (2 ** (TAP_DW // 2) - 1)) << (TAP_DW * i))
-        else:
-            PSS_taps[i] = ((int(np.imag(taps[i])) & (2 ** (TAP_DW // 2) - 1)) << (TAP_DW // 2)) \
-                                    + (int(np.real(taps[i])) & (2 ** (TAP_DW // 2) - 1))
+    taps = PSS_taps.calc_taps(2, PSS_LEN, TAP_DW, scale = 2 ** (TAP_DW // 2 - 1) - 1)
+    parameters['PSS_LOCAL'] = 0 if USE_TAP_FILE else PSS_taps.pack(taps, TAP_DW)
 
     extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
     os.environ['CFO'] = str(CFO)
@@ -194,7 +157,7 @@ def test(IN_DW, OUT_DW, TAP_DW, ALGO, CFO, USE_TAP_FILE):
         parameters['TAP_FILE'] = f'\"../{folder}_PSS_taps.txt\"'
         os.environ["TAP_FILE"] = f'../{folder}_PSS_taps.txt'
         os.makedirs("sim_build", exist_ok=True)
-        np.savetxt(sim_build + '_PSS_taps.txt', PSS_taps.T, fmt = '%x', delimiter = ' ')
+        PSS_taps.write_tap_file(sim_build + '_PSS_taps.txt', taps, TAP_DW)
 
     cocotb_test.simulator.run(
         python_search=[tests_dir],
@@ -1,6 +1,6 @@
 import numpy as np
-import scipy
 import os
+import sys
 import pytest
 import logging
 import importlib
@@ -14,18 +14,16 @@ from cocotb.triggers import Timer
 from cocotb.triggers import RisingEdge
 
 import py3gpp
-import sigmf
 
 CLK_PERIOD_NS = 8
 CLK_PERIOD_S = CLK_PERIOD_NS * 0.000000001
 tests_dir = os.path.abspath(os.path.dirname(__file__))
 rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', 'hdl'))
-
-def _twos_comp(val, bits):
-    """compute the 2's complement of int value val"""
-    if (val & (1 << (bits - 1))) != 0:
-        val = val - (1 << bits)
-    return int(val)
+model_dir = os.path.abspath(os.path.join(tests_dir, '..', 'model'))
+sys.path.append(model_dir)
+import waveform_cache
+import PSS_taps
+import fixed_point
 
 class TB(object):
     def __init__(self, dut):
@@ -42,20 +40,13 @@ class TB(object):
         self.log.setLevel(logging.DEBUG)
 
         tests_dir = os.path.abspath(os.path.dirname(__file__))
-        model_dir = os.path.abspath(os.path.join(tests_dir, '../model/PSS_correlator.py'))
-        spec = importlib.util.spec_from_file_location('PSS_correlator', model_dir)
+        model_dir = os.path.abspath(os.path.join(tests_dir, '../model/PSS_correlator_mr.py'))
+        spec = importlib.util.spec_from_file_location('PSS_correlator_mr', model_dir)
         foo = importlib.util.module_from_spec(spec)
         spec.loader.exec_module(foo)
-        self.model = foo.Model(self.IN_DW, self.OUT_DW, self.TAP_DW, self.PSS_LEN, self.PSS_LOCAL, self.ALGO)
+        self.model = foo.Model(self.IN_DW, self.OUT_DW, self.TAP_DW, self.PSS_LEN, self.PSS_LOCAL, self.ALGO, self.MULT_REUSE)
 
         cocotb.start_soon(Clock(self.dut.clk_i, CLK_PERIOD_NS, units='ns').start())
-        cocotb.start_soon(self.model_clk(CLK_PERIOD_NS, 'ns'))
-
-    async def model_clk(self, period, period_units):
-        timer = Timer(period, period_units)
-        while True:
-            self.model.tick()
-            await timer
 
     async def generate_input(self):
         pass
@@ -68,31 +59,26 @@ class TB(object):
         await RisingEdge(self.dut.clk_i)
         self.dut.reset_ni.value = 1
         await RisingEdge(self.dut.clk_i)
-        self.model.reset()
 
 @cocotb.test()
 async def simple_test(dut):
     tb = TB(dut)
-    handle = sigmf.sigmffile.fromfile('../../tests/30720KSPS_dl_signal.sigmf-data')
-    waveform = handle.read_samples()
     fs = 30720000
     CFO = int(os.getenv('CFO'))
     print(f'CFO = {CFO} Hz')
-    waveform *= np.exp(np.arange(len(waveform))*1j*2*np.pi*CFO/fs)
-    waveform /= max(waveform.real.max(), waveform.imag.max())
     decimation_factor = 16
-    waveform = scipy.signal.decimate(waveform, decimation_factor, ftype='fir')
-    waveform /= max(waveform.real.max(), waveform.imag.max())
-    waveform *= 2 ** (tb.IN_DW // 2 - 1) - 1
-    waveform = waveform.real.astype(int) + 1j*waveform.imag.astype(int)
+    waveform = waveform_cache.load('../../tests/30720KSPS_dl_signal.sigmf-data', 0, 0.05, CFO = CFO, dec_factor = decimation_factor, IN_DW = tb.IN_DW)
     await tb.cycle_reset()
 
     num_items = 500
     rx_counter = 0
-    rx_counter_model = 0
     in_counter = 0
     received = np.empty(num_items, int)
-    received_model = np.empty(num_items, int)
+    # inputs are recorded for the clock edge that samples them, starting with the idle input driven by cycle_reset
+    # outputs are recorded after each clock edge, so index k of out_valid matches index k of the model
+    cycle_data = [0]
+    cycle_valid = [0]
+    out_valid = []
     clk_div = 0
     clk_decimation = 16
     C0 = []
@@ -100,8 +86,17 @@ async def simple_test(dut):
     C_DW = int(tb.IN_DW + tb.TAP_DW + 2 + 2*np.ceil(np.log2(tb.PSS_LEN)))
     while rx_counter < num_items:
         await RisingEdge(dut.clk_i)
+        out_valid.append(dut.m_axis_out_tvalid.value.integer)
+        if dut.m_axis_out_tvalid.value == 1:
+            received[rx_counter] = dut.m_axis_out_tdata.value.integer
+            C0.append(dut.C0.value.integer)
+            C1.append(dut.C1.value.integer)
+            rx_counter  += 1
+
         if clk_div < (clk_decimation - 1):
             dut.s_axis_in_tvalid.value = 0
+            cycle_data.append(0)
+            cycle_valid.append(0)
             clk_div += 1
         else:
             clk_div = 0
@@ -109,45 +104,39 @@ async def simple_test(dut):
                   + ((int(waveform[in_counter].real)) & (2 ** (tb.IN_DW // 2) - 1))) & (2 ** tb.IN_DW - 1)
             dut.s_axis_in_tdata.value = data
             dut.s_axis_in_tvalid.value = 1
-            tb.model.set_data(data)
+            cycle_data.append(data)
+            cycle_valid.append(1)
             in_counter += 1
 
-        if dut.m_axis_out_tvalid == 1:
-            # print(f'{rx_counter}: rx hdl {dut.m_axis_out_tdata.value}')
-            received[rx_counter] = dut.m_axis_out_tdata.value.integer
-            C0.append(_twos_comp(dut.C0.value.integer & (2 ** (C_DW // 2) - 1),C_DW // 2) \
-                    + 1j * _twos_comp((dut.C0.value.integer >> (C_DW // 2)) & (2 ** (C_DW // 2) - 1), C_DW // 2))
-            C1.append(_twos_comp(dut.C1.value.integer & (2 ** (C_DW // 2) - 1), C_DW // 2) \
-                    + 1j * _twos_comp((dut.C1.value.integer >> (C_DW // 2)) & (2 ** (C_DW // 2) - 1), C_DW // 2))
-            rx_counter  += 1
+    C0 = fixed_point.unpack_complex(C0, C_DW)
+    C1 = fixed_point.unpack_complex(C1, C_DW)
 
-        if tb.model.data_valid() and rx_counter_model < num_items:
-            received_model[rx_counter_model] = tb.model.get_data()
-            # print(f'{rx_counter_model}: rx mod {received_model[rx_counter_model]}')
-            rx_counter_model += 1
+    # the last recorded input is sampled after the simulation stops
+    received_model, valid_model, C0_model, C1_model = tb.model.process(cycle_data[:-1], cycle_valid[:-1])
+    valid_model = valid_model[:len(out_valid)]
+    # checks LATENCY = MULT_REUSE + 1 and which inputs are accepted by the correlator
+    assert np.array_equal(np.flatnonzero(out_valid), np.flatnonzero(valid_model))
+    received_model = received_model[:len(out_valid)][valid_model]
+    assert np.array_equal(C0, C0_model[:len(out_valid)][valid_model])
+    assert np.array_equal(C1, C1_model[:len(out_valid)][valid_model])
 
-    ssb_start = np.argmax(received) - 128
-    received = np.array(received)[128:]
-    received_model = np.array(received_model)[128:]
+    peak_pos = np.argmax(received)
+    ssb_start = peak_pos - 128
     print(f'max model {max(received_model)} max hdl {max(received)}')
     if 'PLOTS' in os.environ and os.environ['PLOTS'] == '1':
         _, (ax, ax2) = plt.subplots(2, 1)
         print(f'{type(received.dtype)} {type(received_model.dtype)}')
         ax.plot(np.sqrt(received))
         ax2.plot(np.sqrt(received_model), 'r-')
-        ax.axvline(x = ssb_start, color = 'y', linestyle = '--', label = 'axvline - full height')
+        ax.axvline(x = peak_pos, color = 'y', linestyle = '--', label = 'axvline - full height')
         plt.show()
-    print(f'max correlation is {received[ssb_start]} at {ssb_start}')
+    print(f'max correlation is {received[peak_pos]} at {peak_pos}')
 
     print(f'max model-hdl difference is {max(np.abs(received - received_model))}')
+    for i in range(len(received)):
+        assert received[i] == received_model[i]
     if tb.ALGO == 0:
-        for i in range(len(received)):
-            assert received[i] == received_model[i]
-    else:
-        # TODO: implement model
-        pass
-    if tb.ALGO == 0:
-        prod = C0[ssb_start+128] * np.conj(C1[ssb_start+128])
+        prod = C0[peak_pos] * np.conj(C1[peak_pos])
         # detectedCFO = np.arctan2(prod.imag, prod.real)
         detectedCFO = np.angle(prod)
         detectedCFO_Hz = detectedCFO / (2*np.pi) * (fs/decimation_factor) / 64
@@ -172,7 +161,7 @@ async def simple_test(dut):
             assert np.abs(detectedCFO_Hz - detectedCFO_Hz_model) < 20
 
     assert ssb_start == 284
-    assert len(received) == num_items - 128
+    assert len(received) == num_items
 
 
 @pytest.mark.parametrize("ALGO", [0])
@@ -211,17 +200,7 @@ def test(IN_DW, OUT_DW, TAP_DW, ALGO, CFO, MULT_REUSE):
     parameters['MULT_REUSE'] = MULT_REUSE
 
     # imaginary part is in upper 16 Bit
-    PSS = np.zeros(PSS_LEN, 'complex')
-    PSS[0:-1] = py3gpp.nrPSS(2)
-    taps = np.fft.ifft(np.fft.fftshift(PSS))
-    taps /= max(taps.real.max(), taps.imag.max())
-    taps *= 2 ** (TAP_DW // 2 - 1) - 1
-    # for i in range(10):
-    #     print(f'taps[{i}] = {taps[i]}')
-    parameters['PSS_LOCAL'] = 0
-    for i in range(len(taps)):
-        parameters['PSS_LOCAL'] += ((int(np.imag(taps[i])) & (2 ** (TAP_DW // 2) - 1)) << (TAP_DW * i + TAP_DW // 2)) \
-                                +  ((int(np.real(taps[i])) & (2 ** (TAP_DW // 2) - 1)) << (TAP_DW * i))
+    parameters['PSS_LOCAL'] = PSS_taps.PSS_LOCAL(2, PSS_LEN, TAP_DW, scale = 2 ** (TAP_DW // 2 - 1) - 1)
     extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
     os.environ['CFO'] = str(CFO)
     parameters_dirname = parameters.copy()
@@ -1,6 +1,6 @@
 import numpy as np
-import scipy
 import os
+import sys
 import pytest
 import logging
 import importlib
@@ -14,12 +14,15 @@ from cocotb.triggers import Timer
 from cocotb.triggers import RisingEdge
 
 import py3gpp
-import sigmf
 
 CLK_PERIOD_NS = 8
 CLK_PERIOD_S = CLK_PERIOD_NS * 0.000000001
 tests_dir = os.path.abspath(os.path.dirname(__file__))
 rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', 'hdl'))
+model_dir = os.path.abspath(os.path.join(tests_dir, '..', 'model'))
+sys.path.append(model_dir)
+import waveform_cache
+import PSS_taps
 
 
 class TB(object):
@@ -50,14 +53,6 @@ class TB(object):
         self.peak_detector_model = foo.Model(self.OUT_DW, self.WINDOW_LEN)
 
         cocotb.start_soon(Clock(self.dut.clk_i, CLK_PERIOD_NS, units='ns').start())
-        cocotb.start_soon(self.model_clk(CLK_PERIOD_NS, 'ns'))
-
-    async def model_clk(self, period, period_units):
-        timer = Timer(period, period_units)
-        while True:
-            self.PSS_correlator_model.tick()
-            self.peak_detector_model.tick()
-            await timer
 
     async def generate_input(self):
         pass
@@ -70,35 +65,25 @@ class TB(object):
         await RisingEdge(self.dut.clk_i)
         self.dut.reset_ni.value = 1
         await RisingEdge(self.dut.clk_i)
-        self.PSS_correlator_model.reset()
-        self.peak_detector_model.reset()
 
 @cocotb.test()
 async def simple_test(dut):
     tb = TB(dut)
-    handle = sigmf.sigmffile.fromfile('../../tests/30720KSPS_dl_signal.sigmf-data')
-    waveform = handle.read_samples()
-    waveform /= max(waveform.real.max(), waveform.imag.max())
-    waveform = scipy.signal.decimate(waveform, 16, ftype='fir')
-    waveform /= max(waveform.real.max(), waveform.imag.max())
-    waveform *= 2 ** (tb.IN_DW // 2 - 1)
-    waveform = waveform.real.astype(int) + 1j*waveform.imag.astype(int)
+    waveform = waveform_cache.load('../../tests/30720KSPS_dl_signal.sigmf-data', 0, 0.05, dec_factor = 16, IN_DW = tb.IN_DW, scale = 2 ** (tb.IN_DW // 2 - 1))
 
     await tb.cycle_reset()
 
     num_items = 500
     rx_counter = 0
-    rx_counter_model = 0
     in_counter = 0
     received = np.empty(num_items, int)
-    received_model = np.empty(num_items, int)
+    received_score = np.empty(num_items, int)
     while rx_counter < num_items:
         await RisingEdge(dut.clk_i)
         data = (((int(waveform[in_counter].imag)  & ((2 ** (tb.IN_DW // 2)) - 1)) << (tb.IN_DW // 2)) \
               + ((int(waveform[in_counter].real)) & ((2 ** (tb.IN_DW // 2)) - 1))) & ((2 ** tb.IN_DW) - 1)
         dut.s_axis_in_tdata.value = data
         dut.s_axis_in_tvalid.value = 1
-        tb.PSS_correlator_model.set_data(data)
         in_counter += 1
 
         #if dut.m_axis_out_tvalid == 1:
@@ -107,14 +92,10 @@ async def simple_test(dut):
             # print(f'rx hdl {received[rx_counter]}')
           #  rx_counter  += 1
         received[rx_counter] = dut.peak_detected_o.value.integer
+        received_score[rx_counter] = dut.peak_detector.score_o.value.integer
         rx_counter += 1
         # print(dut.peak_detected_o.value.integer)
 
-        # if tb.model.data_valid() and rx_counter_model < num_items:
-        #     received_model[rx_counter_model] = tb.model.get_data()
-        #     # print(f'rx mod {received_model[rx_counter_model]}')
-        #     rx_counter_model += 1
-
     peak_pos = np.argmax(received)
     if 'PLOTS' in os.environ and os.environ['PLOTS'] == '1':
         _, ax = plt.subplots()
@@ -126,6 +107,20 @@ async def simple_test(dut):
     print(f'highest peak at {peak_pos}')
     assert peak_pos == 416
 
+    correlator_model, _ = tb.PSS_correlator_model.process(waveform[:in_counter])
+    received_model, score_model = tb.peak_detector_model.process(correlator_model)
+    peaks = np.flatnonzero(received)
+    peaks_model = np.flatnonzero(received_model)
+    assert len(peaks_model) > 0, 'model did not detect any peak'
+    assert len(peaks) > 0, 'hdl did not detect any peak'
+    print(f'first peak in model at {peaks_model[0]}')
+    # peak_detected_o is recorded every clock cycle, the sample is registered in the correlator input, the
+    # correlator output and the peak detector output, and the outputs are read before the registers update
+    LATENCY = 4
+    assert np.array_equal(received[:LATENCY], np.zeros(LATENCY))
+    assert np.array_equal(received[LATENCY:], received_model[:num_items - LATENCY])
+    assert np.array_equal(received_score[LATENCY:], score_model[:num_items - LATENCY])
+
 
 # bit growth inside PSS_correlator is a lot, be careful to not make OUT_DW too small !
 @pytest.mark.parametrize("ALGO", [0, 1])
@@ -155,15 +150,7 @@ def test(IN_DW, OUT_DW, TAP_DW, ALGO, WINDOW_LEN):
     parameters['WINDOW_LEN'] = WINDOW_LEN
 
     # imaginary part is in upper 16 Bit
-    PSS = np.zeros(PSS_LEN, 'complex')
-    PSS[0:-1] = py3gpp.nrPSS(2)
-    taps = np.fft.ifft(np.fft.fftshift(PSS))
-    taps /= max(taps.real.max(), taps.imag.max())
-    taps *= 2 ** (TAP_DW // 2 - 1)
-    parameters['PSS_LOCAL'] = 0
-    for i in range(len(taps)):
-        parameters['PSS_LOCAL'] += ((int(np.round(np.imag(taps[i]))) & (2 ** (TAP_DW // 2) - 1)) << (TAP_DW * i + TAP_DW // 2)) \
-                                 + ((int(np.round(np.real(taps[i]))) & (2 ** (TAP_DW // 2) - 1)) << (TAP_DW * i))
+    parameters['PSS_LOCAL'] = PSS_taps.PSS_LOCAL(2, PSS_LEN, TAP_DW, rounding = 'round')
     extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
     parameters_no_taps = parameters.copy()
     del parameters_no_taps['PSS_LOCAL']
@@ -1,6 +1,6 @@
 import numpy as np
-import scipy
 import os
+import sys
 import pytest
 import logging
 import importlib
@@ -15,18 +15,15 @@ from cocotb.triggers import RisingEdge
 from cocotbext.axi import AxiLiteBus, AxiLiteMaster
 
 import py3gpp
-import sigmf
 
 CLK_PERIOD_NS = 8
 CLK_PERIOD_S = CLK_PERIOD_NS * 0.000000001
 tests_dir = os.path.abspath(os.path.dirname(__file__))
 rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', 'hdl'))
-
-def _twos_comp(val, bits):
-    """compute the 2's complement of int value val"""
-    if (val & (1 << (bits - 1))) != 0:
-        val = val - (1 << bits)
-    return int(val)
+model_dir = os.path.abspath(os.path.join(tests_dir, '..', 'model'))
+sys.path.append(model_dir)
+import waveform_cache
+import PSS_taps
 
 class TB(object):
     def __init__(self, dut):
@@ -44,27 +41,20 @@ class TB(object):
         self.log.setLevel(logging.DEBUG)
 
         tests_dir = os.path.abspath(os.path.dirname(__file__))
-        model_file = os.path.abspath(os.path.join(tests_dir, '../model/PSS_correlator.py'))
-        spec = importlib.util.spec_from_file_location('PSS_correlator', model_file)
+        model_file = os.path.abspath(os.path.join(tests_dir, '../model/PSS_detector.py'))
+        spec = importlib.util.spec_from_file_location('PSS_detector', model_file)
         foo = importlib.util.module_from_spec(spec)
         spec.loader.exec_module(foo)
         if self.USE_TAP_FILE:
-            self.TAP_FILE_2 = os.environ["TAP_FILE_2"]
-            self.PSS_LOCAL_2 = 0
+            self.TAP_FILE = [os.environ[f'TAP_FILE_{i}'] for i in range(3)]
+            self.PSS_LOCAL = [0, 0, 0]
         else:
-            self.TAP_FILE_2 = ""
-            self.PSS_LOCAL_2 =  int(dut.PSS_LOCAL_2.value)
+            self.TAP_FILE = ['', '', '']
+            self.PSS_LOCAL = [int(getattr(dut, f'PSS_LOCAL_{i}').value) for i in range(3)]
 
-        self.PSS_correlator_model = foo.Model(self.IN_DW, self.OUT_DW, self.TAP_DW, self.PSS_LEN, self.PSS_LOCAL_2, self.ALGO, self.USE_TAP_FILE, self.TAP_FILE_2)
+        self.model = foo.Model(self.IN_DW, self.OUT_DW, self.TAP_DW, self.PSS_LEN, self.PSS_LOCAL, self.ALGO, self.WINDOW_LEN, self.USE_TAP_FILE, self.TAP_FILE)
 
         cocotb.start_soon(Clock(self.dut.clk_i, CLK_PERIOD_NS, units='ns').start())
-        cocotb.start_soon(self.model_clk(CLK_PERIOD_NS, 'ns'))
-
-    async def model_clk(self, period, period_units):
-        timer = Timer(period, period_units)
-        while True:
-            self.PSS_correlator_model.tick()
-            await timer
 
     async def generate_input(self):
         pass
@@ -77,18 +67,11 @@ class TB(object):
         await RisingEdge(self.dut.clk_i)
         self.dut.reset_ni.value = 1
         await RisingEdge(self.dut.clk_i)
-        self.PSS_correlator_model.reset()
 
 @cocotb.test()
 async def simple_test(dut):
     tb = TB(dut)
-    handle = sigmf.sigmffile.fromfile('../../tests/30720KSPS_dl_signal.sigmf-data')
-    waveform = handle.read_samples()
-    waveform /= max(waveform.real.max(), waveform.imag.max())
-    waveform = scipy.signal.decimate(waveform, 16, ftype='fir')
-    waveform /= max(waveform.real.max(), waveform.imag.max())
-    waveform *= 2 ** (tb.IN_DW // 2 - 1)
-    waveform = waveform.real.astype(int) + 1j*waveform.imag.astype(int)
+    waveform = waveform_cache.load('../../tests/30720KSPS_dl_signal.sigmf-data', 0, 0.05, dec_factor = 16, IN_DW = tb.IN_DW, scale = 2 ** (tb.IN_DW // 2 - 1))
 
     await tb.cycle_reset()
 
@@ -100,13 +83,13 @@ async def simple_test(dut):
     in_counter = 0
     received = np.empty(num_items, int)
     received_correlator = []
+    received_N_id_2 = []
     while rx_counter < num_items:
         await RisingEdge(dut.clk_i)
         data = (((int(waveform[in_counter].imag)  & ((2 ** (tb.IN_DW // 2)) - 1)) << (tb.IN_DW // 2)) \
               + ((int(waveform[in_counter].real)) & ((2 ** (tb.IN_DW // 2)) - 1))) & ((2 ** tb.IN_DW) - 1)
         dut.s_axis_in_tdata.value = data
         dut.s_axis_in_tvalid.value = 1
-        tb.PSS_correlator_model.set_data(data)
         in_counter += 1
 
         # print(f'{dut.m_axis_cic_tvalid.value.integer} + {dut.m_axis_cic_tdata.value.integer}')
@@ -116,6 +99,7 @@ async def simple_test(dut):
 
         if dut.N_id_2_valid_o.value.integer == 1:
             print(f'detected N_id_2 = {dut.N_id_2_o.value.integer}')
+            received_N_id_2.append(dut.N_id_2_o.value.integer)
         received[rx_counter] = dut.N_id_2_valid_o.value.integer
         rx_counter += 1
         if ((rx_counter % (1920)) == 0):
@@ -130,6 +114,10 @@ async def simple_test(dut):
     print(f'highest peak at {peak_pos}')
     assert peak_pos == 417
 
+    correlation_model, peak_valid_model, N_id_2_model = tb.model.process(waveform[:in_counter])
+    assert np.array_equal(received_correlator, correlation_model[2][:len(received_correlator)])
+    assert np.array_equal(received_N_id_2, N_id_2_model[peak_valid_model][:len(received_N_id_2)])
+
 # bit growth inside PSS_correlator is a lot, be careful to not make OUT_DW too small !
 @pytest.mark.parametrize("ALGO", [0, 1])
 @pytest.mark.parametrize("IN_DW", [32])
@@ -177,23 +165,11 @@ def test(IN_DW, OUT_DW, TAP_DW, CFO_DW, DDS_DW, ALGO, WINDOW_LEN, USE_MODE, USE_
 
     for i in range(3):
         # imaginary part is in upper 16 Bit
-        PSS = np.zeros(PSS_LEN, 'complex')
-        PSS[0:-1] = py3gpp.nrPSS(i)
-        taps = np.fft.ifft(np.fft.fftshift(PSS))
-        taps /= max(taps.real.max(), taps.imag.max())
-        taps *= 2 ** (TAP_DW // 2 - 1)
-        parameters[f'PSS_LOCAL_{i}'] = 0
-        PSS_taps = np.empty(PSS_LEN, int)
-        for k in range(len(taps)):
-            if not USE_TAP_FILE:
-                parameters[f'PSS_LOCAL_{i}'] += ((int(np.round(np.imag(taps[k]))) & (2 ** (TAP_DW // 2) - 1)) << (TAP_DW * k + TAP_DW // 2)) \
-                                        + ((int(np.round(np.real(taps[k]))) & (2 ** (TAP_DW // 2) - 1)) << (TAP_DW * k))
-            PSS_taps[k] = ((int(np.imag(taps[k])) & (2 ** (TAP_DW // 2) - 1)) << (TAP_DW // 2)) \
-                                    + (int(np.real(taps[k])) & (2 ** (TAP_DW // 2) - 1))
+        parameters[f'PSS_LOCAL_{i}'] = 0 if USE_TAP_FILE else PSS_taps.PSS_LOCAL(i, PSS_LEN, TAP_DW, rounding = 'round')
         if USE_TAP_FILE:
             parameters[f'TAP_FILE_{i}'] = f'\"../{folder}_PSS_{i}_taps.txt\"'
             os.environ[f'TAP_FILE_{i}'] = f'../{folder}_PSS_{i}_taps.txt'
-            np.savetxt(sim_build + f'_PSS_{i}_taps.txt', PSS_taps, fmt = '%x', delimiter = ' ')
+            PSS_taps.write_tap_file(sim_build + f'_PSS_{i}_taps.txt', PSS_taps.calc_taps(i, PSS_LEN, TAP_DW), TAP_DW)
 
     compile_args = []
     if os.environ.get('SIM') == 'verilator':
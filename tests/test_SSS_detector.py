@@ -1,5 +1,6 @@
 import numpy as np
 import os
+import sys
 import pytest
 import logging
 import os
@@ -9,12 +10,13 @@ import cocotb_test.simulator
 from cocotb.clock import Clock
 from cocotb.triggers import RisingEdge
 
-import py3gpp
-
 CLK_PERIOD_NS = 8
 CLK_PERIOD_S = CLK_PERIOD_NS * 0.000000001
 tests_dir = os.path.abspath(os.path.dirname(__file__))
 rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', 'hdl'))
+model_dir = os.path.abspath(os.path.join(tests_dir, '..', 'model'))
+sys.path.append(model_dir)
+import SSS_detector
 
 class TB(object):
     def __init__(self, dut):
@@ -43,7 +45,7 @@ async def simple_test(dut):
     N_id_1 = int(os.environ['N_ID_1'])
     N_id_2 = int(os.environ['N_ID_2'])
     print(f'test N_id_1 = {N_id_1}  N_id_2 = {N_id_2}')
-    SSS_seq = (py3gpp.nrSSS(3*N_id_1 + N_id_2) + 1) / 2
+    SSS_seq = (SSS_detector.SSS_table()[3*N_id_1 + N_id_2] + 1) // 2
     # SSS_seq = np.append(SSS_seq, 0)
 
     await RisingEdge(dut.clk_i)
@@ -72,6 +74,10 @@ async def simple_test(dut):
 
     assert detected_N_id_1 == N_id_1
     assert detected_N_id == N_id_1 * 3 + N_id_2
+
+    N_id_1_model, N_id_model, _ = SSS_detector.Model().process(SSS_seq, N_id_2)
+    assert detected_N_id_1 == N_id_1_model[0]
+    assert detected_N_id == N_id_model[0]
     # assert dut.m_axis_out_tdata.value == N_id_1
 
 @pytest.mark.parametrize("N_ID_1", [0, 335])
@@ -1,5 +1,6 @@
 import numpy as np
 import os
+import sys
 import pytest
 import logging
 import matplotlib.pyplot as plt
@@ -15,18 +16,18 @@ CLK_PERIOD_NS = 8
 CLK_PERIOD_S = CLK_PERIOD_NS * 0.000000001
 tests_dir = os.path.abspath(os.path.dirname(__file__))
 rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', 'hdl'))
-
-def _twos_comp(val, bits):
-    """compute the 2's complement of int value val"""
-    if (val & (1 << (bits - 1))) != 0:
-        val = val - (1 << bits)
-    return int(val)
+model_dir = os.path.abspath(os.path.join(tests_dir, '..', 'model'))
+sys.path.append(model_dir)
+import fixed_point
+import atan2
 
 class TB(object):
     def __init__(self, dut):
         self.dut = dut
         self.INPUT_WIDTH = int(dut.INPUT_WIDTH.value)
         self.OUTPUT_WIDTH = int(dut.OUTPUT_WIDTH.value)
+        self.LUT_DW = int(dut.LUT_DW.value)
+        self.model = atan2.Model(self.INPUT_WIDTH, self.LUT_DW, self.OUTPUT_WIDTH)
 
         self.log = logging.getLogger('cocotb.tb')
         self.log.setLevel(logging.DEBUG)
@@ -58,39 +59,55 @@ async def simple_test(dut):
     dut.numerator_i.value = int(numerator[tx_cnt])
     dut.denominator_i.value = int(denominator[tx_cnt])
     dut.valid_i.value = 1
+    # inputs that are sampled with every clock edge, starting with the next one
+    numerators = [numerator[tx_cnt]]
+    denominators = [denominator[tx_cnt]]
+    valids = [1]
 
     await RisingEdge(dut.clk_i)
     dut.valid_i.value = 0
+    valid = 0
     tx_cnt += 1
     expected_results.append(np.arctan2(numerator[tx_cnt], denominator[tx_cnt]))
 
     clk_cnt = 0
     max_clk_cnt = 100000
     rx_cnt = 0
+    received = []
+    received_valid = []
     PI = 2 ** (tb.OUTPUT_WIDTH - 1) - 1
 
     if os.environ['PIPELINED'] == '0':
         while (clk_cnt < max_clk_cnt) and (rx_cnt < max_rx_cnt):
+            numerators.append(numerator[tx_cnt - 1])
+            denominators.append(denominator[tx_cnt - 1])
+            valids.append(valid)
             await RisingEdge(dut.clk_i)
             clk_cnt += 1
+            # the outputs are read before the registers update, so they belong to the previous clock edge
+            received_valid.append(dut.valid_o.value.integer)
 
             if (dut.valid_o.value == 1):
-                result = _twos_comp(dut.angle_o.value.integer, tb.OUTPUT_WIDTH) / PI * 180
-                print(f'atan2({numerator[rx_cnt]} / {denominator[rx_cnt]}) = {result:.3f}  expected {np.arctan2(numerator[rx_cnt], denominator[rx_cnt]) / np.pi * 180:.3f}')
-                assert np.abs(np.abs(np.arctan2(numerator[rx_cnt], denominator[rx_cnt]) / np.pi * 180) - np.abs(result)) < 0.1
+                received.append(dut.angle_o.value.integer)
                 rx_cnt += 1
 
                 if rx_cnt < max_rx_cnt:
                     dut.numerator_i.value = int(numerator[tx_cnt])
                     dut.denominator_i.value = int(denominator[tx_cnt])
                     dut.valid_i.value = 1
+                    valid = 1
                     tx_cnt += 1
             else:
                 dut.valid_i.value = 0
+                valid = 0
     else:
         while (clk_cnt < max_clk_cnt) and (rx_cnt < max_rx_cnt):
+            numerators.append(numerator[tx_cnt - 1])
+            denominators.append(denominator[tx_cnt - 1])
+            valids.append(valid)
             await RisingEdge(dut.clk_i)
             clk_cnt += 1
+            received_valid.append(dut.valid_o.value.integer)
 
             if tx_cnt < max_rx_cnt:
                 dut.numerator_i.value = int(numerator[tx_cnt])
@@ -98,18 +115,33 @@ async def simple_test(dut):
                 dut.valid_i.value = 1
                 expected_results.append(np.arctan2(numerator[tx_cnt], denominator[tx_cnt]))
                 # print(f'tx atan2({numerator[tx_cnt]} / {denominator[tx_cnt]})  expecting {expected_results[tx_cnt] / np.pi * 180:.3f}')
+                valid = 1
                 tx_cnt += 1
             else:
                 dut.valid_i.value = 0
+                valid = 0
 
             if (dut.valid_o.value == 1):
-                result = _twos_comp(dut.angle_o.value.integer, tb.OUTPUT_WIDTH) / PI * 180
-                print(f'atan2({numerator[rx_cnt]} / {denominator[rx_cnt]}) = {result:.3f}  expected {expected_results[rx_cnt] / np.pi * 180:.3f}')
-                # assert np.abs(np.abs(result) - np.abs(expected_results[rx_cnt] / np.pi * 180)) < 0.1
+                received.append(dut.angle_o.value.integer)
                 rx_cnt += 1
 
     if clk_cnt == max_clk_cnt:
         print("no result received!")
+
+    angle = fixed_point.sign_extend(received, tb.OUTPUT_WIDTH)
+    result = angle / PI * 180
+    expected = np.arctan2(numerator[:rx_cnt], denominator[:rx_cnt]) / np.pi * 180
+    for i in range(rx_cnt):
+        print(f'atan2({numerator[i]} / {denominator[i]}) = {result[i]:.3f}  expected {expected[i]:.3f}')
+    if os.environ['PIPELINED'] == '0':
+        assert np.all(np.abs(np.abs(expected) - np.abs(result)) < 0.1)
+    assert np.array_equal(angle, tb.model.calc(numerator[:rx_cnt], denominator[:rx_cnt]))
+
+    # valid_o has to come exactly LATENCY cycles after the input, with the same angle as in the model
+    model_angle, model_valid = tb.model.process(numerators, denominators, valids)
+    model_valid = model_valid[:len(received_valid)]
+    assert np.array_equal(np.array(received_valid, bool), model_valid)
+    assert np.array_equal(angle, model_angle[:len(received_valid)][model_valid])
     
 
 @pytest.mark.parametrize("INPUT_WIDTH", [16, 32])
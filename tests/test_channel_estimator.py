@@ -1,5 +1,6 @@
 import numpy as np
 import os
+import sys
 import pytest
 import logging
 import os
@@ -12,18 +13,17 @@ from cocotb.clock import Clock
 from cocotb.triggers import RisingEdge
 
 import py3gpp
-import sigmf
 
 CLK_PERIOD_NS = 8
 CLK_PERIOD_S = CLK_PERIOD_NS * 0.000000001
 tests_dir = os.path.abspath(os.path.dirname(__file__))
 rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', 'hdl'))
-
-def _twos_comp(val, bits):
-    """compute the 2's complement of int value val"""
-    if (val & (1 << (bits - 1))) != 0:
-        val = val - (1 << bits)
-    return int(val)
+model_dir = os.path.abspath(os.path.join(tests_dir, '..', 'model'))
+sys.path.append(model_dir)
+import sigmf_reader
+import fixed_point
+import channel_estimator
+import gold_sequence
 
 class TB(object):
     def __init__(self, dut):
@@ -66,6 +66,7 @@ async def simple_test(dut):
     PBCH_DMRS = []
     ibar_SSB = 2
     PBCH_DMRS_model = py3gpp.nrPBCHDMRS(N_id, ibar_SSB)*np.sqrt(2)
+    assert np.allclose(channel_estimator.DMRS_symbols(gold_sequence.PBCH_DMRS_table()[N_id, ibar_SSB]), PBCH_DMRS_model)
     while cycle_counter < max_wait_cycles:
         await RisingEdge(dut.clk_i)
         if dut.debug_PBCH_DMRS_valid_o.value == 1:
@@ -90,8 +91,7 @@ async def simple_test2(dut):
     await RisingEdge(dut.clk_i)
     dut.N_id_valid_i.value = 0
 
-    handle = sigmf.sigmffile.fromfile(tests_dir + '/30720KSPS_dl_signal.sigmf-data')
-    waveform = handle.read_samples()
+    waveform = sigmf_reader.Recording(tests_dir + '/30720KSPS_dl_signal.sigmf-data').read_window(0, 0.05)
     waveform = scipy.signal.decimate(waveform, 8, ftype='fir')  # decimate to 3.840 MSPS
 
     CP_LEN = 18
@@ -110,6 +110,10 @@ async def simple_test2(dut):
     # plt.plot(PBCH[8:248].real, PBCH[8:248].imag, '.r')
     # plt.show()
 
+    model = channel_estimator.Model(tb.IN_DW)
+    model.set_N_id(N_id)
+    ibar_SSB_model, _ = model.detect_ibar(PBCH[SC_START:][:channel_estimator.DET_IBAR_LEN])
+
     max_wait_cycles = 15000
     cycle_counter = 0
     PBCH_cnt = 0
@@ -139,6 +143,7 @@ async def simple_test2(dut):
             ibar_SSB_det = dut.debug_ibar_SSB_o.value.integer
             print(f'detected ibar_SSB = {ibar_SSB_det}')
             assert ibar_SSB_det == ibar_SSB
+            assert ibar_SSB_det == ibar_SSB_model[0]
         cycle_counter += 1
 
 @cocotb.test()
@@ -157,8 +162,7 @@ async def simple_test3(dut):
     await RisingEdge(dut.clk_i)
     dut.N_id_valid_i.value = 0
 
-    handle = sigmf.sigmffile.fromfile(tests_dir + '/30720KSPS_dl_signal.sigmf-data')
-    waveform = handle.read_samples()
+    waveform = sigmf_reader.Recording(tests_dir + '/30720KSPS_dl_signal.sigmf-data').read_window(0, 0.05)
     waveform = scipy.signal.decimate(waveform, 8, ftype='fir')  # decimate to 3.840 MSPS
 
     CP1_LEN = 20
@@ -201,7 +205,7 @@ async def simple_test3(dut):
     ibar_SSB = 0
     ibar_SSBs = []
     IQ_data = []
-    corrected_PBCH = np.empty((10,432), 'complex')
+    corrected_PBCH_words = np.zeros((10, 432), np.int64)
     corrected_PBCH_idx = 0
     corrected_PBCH_sym_cnt = 0
     idle_clks = 0
@@ -243,8 +247,7 @@ async def simple_test3(dut):
             dut.s_axis_in_tvalid.value = 0
 
         if (dut.m_axis_out_tvalid.value == 1) and (dut.m_axis_out_tuser.value == 1):
-            corrected_PBCH[corrected_PBCH_sym_cnt, corrected_PBCH_idx] = _twos_comp(dut.m_axis_out_tdata.value.integer & (2**(FFT_OUT_DW//2) - 1), FFT_OUT_DW//2) \
-                + 1j * _twos_comp((dut.m_axis_out_tdata.value.integer>>(FFT_OUT_DW//2)) & (2**(FFT_OUT_DW//2) - 1), FFT_OUT_DW//2)
+            corrected_PBCH_words[corrected_PBCH_sym_cnt, corrected_PBCH_idx] = dut.m_axis_out_tdata.value.integer
             corrected_PBCH_idx += 1
         
         if dut.m_axis_out_tlast.value == 1:
@@ -262,6 +265,7 @@ async def simple_test3(dut):
     assert corrected_PBCH_sym_cnt == 4
     print(f'finished after {clk_cnt} clk cycles')
     print(f'received {corrected_PBCH_sym_cnt} PBCH messages')
+    corrected_PBCH = fixed_point.unpack_complex(corrected_PBCH_words, FFT_OUT_DW)
 
     # try to decode PBCH
     for i in range(corrected_PBCH_sym_cnt):
@@ -274,7 +278,8 @@ async def simple_test3(dut):
 
             E = 864
             v = ibar_SSB
-            scrambling_seq = py3gpp.nrPBCHPRBS(N_id, v, E)
+            scrambling_seq = gold_sequence.PBCH_scrambling(N_id, v, E)
+            assert np.array_equal(scrambling_seq, py3gpp.nrPBCHPRBS(N_id, v, E))
             scrambling_seq_bpsk = (-1)*scrambling_seq*2 + 1
             pbchBits_descrambled = pbchBits * scrambling_seq_bpsk
 
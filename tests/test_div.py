@@ -1,5 +1,6 @@
 import numpy as np
 import os
+import sys
 import pytest
 import logging
 import matplotlib.pyplot as plt
@@ -15,12 +16,9 @@ CLK_PERIOD_NS = 8
 CLK_PERIOD_S = CLK_PERIOD_NS * 0.000000001
 tests_dir = os.path.abspath(os.path.dirname(__file__))
 rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', 'hdl'))
-
-def _twos_comp(val, bits):
-    """compute the 2's complement of int value val"""
-    if (val & (1 << (bits - 1))) != 0:
-        val = val - (1 << bits)
-    return int(val)
+model_dir = os.path.abspath(os.path.join(tests_dir, '..', 'model'))
+sys.path.append(model_dir)
+import div
 
 class TB(object):
     def __init__(self, dut):
@@ -28,6 +26,7 @@ class TB(object):
         self.INPUT_WIDTH = int(dut.INPUT_WIDTH.value)
         self.RESULT_WIDTH = int(dut.RESULT_WIDTH.value)
         self.PIPELINED = int(dut.PIPELINED.value)
+        self.model = div.Model(self.INPUT_WIDTH, self.RESULT_WIDTH, self.PIPELINED)
 
         self.log = logging.getLogger('cocotb.tb')
         self.log.setLevel(logging.DEBUG)
@@ -56,22 +55,36 @@ async def simple_test(dut):
     dut.numerator_i.value = numerator
     dut.denominator_i.value = denominator
     dut.valid_i.value = 1
+    # inputs that are sampled with every clock edge, starting with the next one
+    numerators = [numerator]
+    denominators = [denominator]
+    valids = [1]
 
     await RisingEdge(dut.clk_i)
     dut.valid_i.value = 0
+    valid = 0
 
     clk_cnt = 0
     max_clk_cnt = 1000
     rx_cnt = 0
     max_rx_cnt = 500
+    received_result = []
+    received_valid = []
     while (clk_cnt < max_clk_cnt) and (rx_cnt < max_rx_cnt):
+        numerators.append(numerator)
+        denominators.append(denominator)
+        valids.append(valid)
         await RisingEdge(dut.clk_i)
         clk_cnt += 1
+        # the outputs are read before the registers update, so they belong to the previous clock edge
+        received_result.append(dut.result_o.value.integer)
+        received_valid.append(dut.valid_o.value.integer)
 
         if (dut.valid_o.value == 1):
             result = dut.result_o.value.integer
             # print(f'{numerator} / {denominator} = {result}')
             assert np.floor(numerator / denominator) == result
+            assert result == tb.model.calc(numerator, denominator)
             rx_cnt += 1
 
             numerator = np.random.randint(0, 2**(tb.INPUT_WIDTH) - 1)
@@ -79,12 +92,21 @@ async def simple_test(dut):
             dut.numerator_i.value = numerator
             dut.denominator_i.value = denominator
             dut.valid_i.value = 1
+            valid = 1
         else:
             dut.valid_i.value = 0
+            valid = 0
 
     if clk_cnt == max_clk_cnt:
         print("no result received!")
-    
+
+    # valid_o has to come exactly LATENCY cycles after the input, this also covers the ignored inputs while the
+    # iterative divider is busy
+    model_result, model_valid = tb.model.process(numerators, denominators, valids)
+    model_valid = model_valid[:len(received_valid)]
+    assert np.array_equal(np.array(received_valid, bool), model_valid)
+    assert np.array_equal(np.array(received_result)[model_valid], model_result[:len(received_result)][model_valid])
+
 
 @pytest.mark.parametrize("INPUT_WIDTH", [16, 32])
 @pytest.mark.parametrize("RESULT_WIDTH", [16, 32])
@@ -1,6 +1,7 @@
 import numpy as np
 import scipy
 import os
+import sys
 import pytest
 import logging
 import importlib
@@ -20,12 +21,9 @@ CLK_PERIOD_NS = 8
 CLK_PERIOD_S = CLK_PERIOD_NS * 0.000000001
 tests_dir = os.path.abspath(os.path.dirname(__file__))
 rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', 'hdl'))
-
-def _twos_comp(val, bits):
-    """compute the 2's complement of int value val"""
-    if (val & (1 << (bits - 1))) != 0:
-        val = val - (1 << bits)
-    return int(val)
+model_dir = os.path.abspath(os.path.join(tests_dir, '..', 'model'))
+sys.path.append(model_dir)
+import fixed_point
 
 class TB(object):
     def __init__(self, dut):
@@ -78,8 +76,7 @@ class TB(object):
         for i in range(10):
             await RisingEdge(self.dut.clk_i)
             if self.dut.valid_o == 1:
-                return _twos_comp(self.dut.result_o.value.integer & (2 ** (self.OUT_DW // 2) - 1), self.OUT_DW // 2) \
-                    + 1j * _twos_comp((self.dut.result_o.value.integer >> (self.OUT_DW // 2)) & (2 ** (self.OUT_DW // 2) - 1), self.OUT_DW // 2)
+                return self.dut.result_o.value.integer
         assert False, "no answer received"
 
 
@@ -92,35 +89,23 @@ async def simple_test(dut):
     for _ in range(10):
         await RisingEdge(dut.clk_i)
 
+    vectors = []
     vec_a = np.ones(128)
-    vec_b = np.ones(128)
-    res = await tb.send_vector(vec_a, vec_b)
-    print(f'result = {res}')
-    assert res == np.dot(vec_a, vec_b)
-
-    vec_a = np.ones(128)
+    vectors.append((vec_a, np.ones(128), np.ones(128)))
     vec_b = np.arange(128)
-    res = await tb.send_vector(vec_a, vec_b)
-    print(f'result = {res}')
-    assert res == np.dot(vec_a, vec_b)
-
-    vec_a = np.ones(128)
-    vec_b = -np.arange(128)
-    vec_b_twos = np.empty(128)
-    for i in range(128):
-        vec_b_twos[i] = vec_b[i] & (2 ** (tb.B_DW // 2) - 1)
-    res = await tb.send_vector(vec_a, vec_b_twos)
-    print(f'result = {res}')
-    assert res == np.dot(vec_a, vec_b)
-
-    vec_a = np.ones(128)
+    vectors.append((vec_a, vec_b, vec_b))
+    # negative values are sent as B_DW / 2 bit two's complement in the real or imaginary part
     vec_b = -np.arange(128)
-    vec_b_twos = np.empty(128)
-    for i in range(128):
-        vec_b_twos[i] = (vec_b[i] & (2 ** (tb.B_DW // 2) - 1)) << (tb.B_DW // 2)
-    res = await tb.send_vector(vec_a, vec_b_twos)
-    print(f'result = {res}')
-    assert res == np.dot(vec_a, 1j * vec_b)
+    vectors.append((vec_a, fixed_point.pack_iq(vec_b, 0, tb.B_DW), vec_b))
+    vectors.append((vec_a, fixed_point.pack_iq(0, vec_b, tb.B_DW), 1j * vec_b))
+
+    received = []
+    for vec_a, vec_b_words, _ in vectors:
+        received.append(await tb.send_vector(vec_a, vec_b_words))
+    results = fixed_point.unpack_complex(received, tb.OUT_DW)
+    for res, (vec_a, _, vec_b) in zip(results, vectors):
+        print(f'result = {res}')
+        assert res == np.dot(vec_a, vec_b)
 
 
 # bit growth inside PSS_correlator is a lot, be careful to not make OUT_DW too small !
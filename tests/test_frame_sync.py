@@ -1,9 +1,9 @@
 import numpy as np
 import os
+import sys
 import pytest
 import logging
 import os
-import scipy
 import matplotlib.pyplot as plt
 
 import cocotb
@@ -12,12 +12,15 @@ from cocotb.clock import Clock
 from cocotb.triggers import RisingEdge
 
 import py3gpp
-import sigmf
 
 CLK_PERIOD_NS = 260416
 CLK_PERIOD_S = CLK_PERIOD_NS * 1e-12
 tests_dir = os.path.abspath(os.path.dirname(__file__))
 rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', 'hdl'))
+model_dir = os.path.abspath(os.path.join(tests_dir, '..', 'model'))
+sys.path.append(model_dir)
+import waveform_cache
+import frame_sync
 
 class TB(object):
     def __init__(self, dut):
@@ -44,13 +47,8 @@ async def stream_tb(dut):
     tb = TB(dut)
     await tb.cycle_reset()
 
-    handle = sigmf.sigmffile.fromfile(tests_dir + '/30720KSPS_dl_signal.sigmf-data')
-    waveform = handle.read_samples()
-    waveform /= max(waveform.real.max(), waveform.imag.max())
-    waveform = scipy.signal.decimate(waveform, 16//2, ftype='fir')
-    waveform /= max(waveform.real.max(), waveform.imag.max())
-    waveform *= 2 ** (tb.IN_DW // 2 - 1)
-    waveform = waveform.real.astype(int) + 1j*waveform.imag.astype(int)
+    waveform = waveform_cache.load(tests_dir + '/30720KSPS_dl_signal.sigmf-data', 0, 0.05, dec_factor = 16//2, IN_DW = tb.IN_DW,
+                                   scale = 2 ** (tb.IN_DW // 2 - 1))
 
     CP1_LEN = 20
     CP2_LEN = 18
@@ -88,6 +86,9 @@ async def stream_tb(dut):
     pos = 0
     current_CP_len = CP2_LEN
     ibar_SSB_DEALAY = 1000
+    received_tuser = []
+    received_tlast = []
+    received_SSB_start = []
     while clk_cnt < max_clk_cnt:
         await RisingEdge(dut.clk_i)
 
@@ -127,6 +128,11 @@ async def stream_tb(dut):
         if pos == SSB_POS[1] + 2:
             assert dut.SSB_start_o.value == 1
 
+        received_tuser.append(dut.m_axis_out_tuser.value.integer)
+        received_tlast.append(dut.m_axis_out_tlast.value.integer)
+        if dut.SSB_start_o.value == 1:
+            received_SSB_start.append(pos)
+
         if dut.symbol_start_o.value == 1:
             print('symbol_start')
         if dut.SSB_start_o.value == 1:
@@ -135,6 +141,21 @@ async def stream_tb(dut):
         pos += 1
     print(f'finished after {clk_cnt} clk cycles')
 
+    # outputs of the HDL appear 2 clk cycles after the input sample
+    model = frame_sync.Model(NFFT = 8)
+    start, tuser, tvalid, tlast, symbol_start, SSB_start = model.process(max_clk_cnt, SSB_POS, 0, ibar_SSB_DEALAY)
+    assert np.array_equal(np.array(received_SSB_start) - 2, SSB_start)
+    symbol_end = (np.append(start[1:], max_clk_cnt) - 1)[tlast]
+    assert np.array_equal(np.flatnonzero(received_tlast) - 2, symbol_end[symbol_end < max_clk_cnt - 2])
+    # sym_cnt is a blocking assignment in the HDL, tuser is therefore not compared at the last sample of a symbol
+    # and at the SSB start, where the symbol counter is reset in the same cycle
+    valid = model.expand(start, tvalid, max_clk_cnt).astype(bool)
+    valid[symbol_end] = False
+    valid[SSB_POS] = False
+    valid = np.flatnonzero(valid[:max_clk_cnt - 2])
+    assert np.array_equal(np.array(received_tuser)[valid + 2], model.expand(start, tuser, max_clk_cnt)[valid])
+    print(f'model: {len(symbol_start)} symbols, SSB_start at {SSB_start}')
+
 
 @pytest.mark.parametrize("IN_DW", [32])
 def test_stream(IN_DW):
@@ -0,0 +1,398 @@
+import numpy as np
+import json
+import os
+import sys
+import pytest
+import py3gpp
+import scipy.signal
+
+# tests for the python models that do not need a simulator
+
+tests_dir = os.path.abspath(os.path.dirname(__file__))
+model_dir = os.path.abspath(os.path.join(tests_dir, '..', 'model'))
+sys.path.append(model_dir)
+import cell_search
+import channel_estimator
+import cic_d
+import complex_multiplier
+import demap
+import fir_decimator
+import fixed_point
+import gold_sequence
+import PSS_correlator
+import PSS_taps
+import receiver
+import sigmf_reader
+import waveform_cache
+
+def random_samples(rng, num, IN_DW):
+    max_value = 2 ** (IN_DW // 2 - 1) - 1
+    return rng.integers(-max_value, max_value + 1, num) + 1j * rng.integers(-max_value, max_value + 1, num)
+
+def random_splits(rng, num, num_chunks):
+    """random chunk boundaries, chunks can also be empty or a single sample"""
+    return np.sort(rng.integers(0, num + 1, num_chunks - 1))
+
+@pytest.mark.parametrize("ALGO", [0, 1])
+@pytest.mark.parametrize("IN_DW", [14, 32])
+@pytest.mark.parametrize("with_tvalid", [False, True])
+def test_PSS_correlator_chunks(ALGO, IN_DW, with_tvalid):
+    rng = np.random.default_rng(ALGO * 100 + IN_DW + with_tvalid)
+    PSS_LEN = 128
+    TAP_DW = 32
+    num = 3000
+    model = PSS_correlator.Model(IN_DW, 48, TAP_DW, PSS_LEN, PSS_taps.PSS_LOCAL(0, PSS_LEN, TAP_DW), ALGO)
+    samples = random_samples(rng, num, IN_DW)
+    tvalid = rng.random(num) < 0.7 if with_tvalid else None
+    result, valid = model.process(samples, tvalid)
+
+    for _ in range(5):
+        model.reset()
+        results = []
+        valids = []
+        for chunk in np.split(np.arange(num), random_splits(rng, num, 20)):
+            chunk_result, chunk_valid = model.process_chunk(samples[chunk], None if tvalid is None else tvalid[chunk])
+            results.append(chunk_result)
+            valids.append(chunk_valid)
+        assert np.array_equal(np.concatenate(valids), valid)
+        assert np.array_equal(np.concatenate(results), result)
+
+@pytest.mark.parametrize("bits", [8, 32, 63, 64, 80])
+def test_fixed_point(bits):
+    rng = np.random.default_rng(bits)
+    # python ints are the reference, they never overflow
+    values = [int(x) for x in rng.integers(-2 ** 62, 2 ** 62, 100)] + [-(1 << (bits - 1)), (1 << (bits - 1)) - 1, 0, -1]
+    values = [v << max(bits - 63, 0) for v in values]
+    words = [v & ((1 << bits) - 1) for v in values]
+    signed = [(w ^ (1 << (bits - 1))) - (1 << (bits - 1)) for w in words]
+    assert list(fixed_point.unsigned(words, bits)) == words
+    assert list(fixed_point.sign_extend(words, bits)) == signed
+    assert list(fixed_point.saturate(values, bits)) == [min(max(v, -(1 << (bits - 1))), (1 << (bits - 1)) - 1) for v in values]
+    for shift in (0, 1, 17):
+        assert list(fixed_point.truncate(values, shift)) == [v >> shift for v in values]
+
+    DW = 2 * bits
+    re = np.array(signed[:52], object if bits > 63 else np.int64)
+    im = np.array(signed[52:], object if bits > 63 else np.int64)
+    words = fixed_point.pack_iq(re, im, DW)
+    assert list(words) == [(int(i) & ((1 << bits) - 1)) << bits | (int(r) & ((1 << bits) - 1)) for r, i in zip(re, im)]
+    unpacked_re, unpacked_im = fixed_point.unpack_iq(words, DW)
+    assert list(unpacked_re) == list(re)
+    assert list(unpacked_im) == list(im)
+
+def upper_bits(value, width, bits):
+    """the upper bits of the width bit two's complement word of value as signed number, like a slice in the HDL"""
+    word = value & ((1 << width) - 1)
+    upper = word >> (width - bits)
+    return upper - (1 << bits) if upper >> (bits - 1) else upper
+
+@pytest.mark.parametrize("A, B, OUT", [(16, 16, 16), (31, 20, 40), (40, 40, 48), (40, 33, 30)])
+def test_complex_multiplier(A, B, OUT):
+    rng = np.random.default_rng(A * B + OUT)
+    # the product is A + B + 1 bits wide, CFO_calc needs the python int path above 63 bits
+    model = complex_multiplier.Model(A, B, OUT)
+    assert model.wide == (A + B + 1 > 63)
+    a = [int(x) for x in rng.integers(-2 ** (A - 1), 2 ** (A - 1), 2 * 100)] + [-2 ** (A - 1)] * 4
+    b = [int(x) for x in rng.integers(-2 ** (B - 1), 2 ** (B - 1), 2 * 100)] + [-2 ** (B - 1)] * 4
+    a_words = [(i & ((1 << A) - 1)) << A | (r & ((1 << A) - 1)) for r, i in zip(a[0::2], a[1::2])]
+    b_words = [(i & ((1 << B) - 1)) << B | (r & ((1 << B) - 1)) for r, i in zip(b[0::2], b[1::2])]
+    re, im = model.multiply(np.array(a_words, object), np.array(b_words, object))
+    # python ints never overflow, the output are the upper OUT bits of the full A + B + 1 bit product
+    products = [(ar * br - ai * bi, ar * bi + ai * br) for ar, ai, br, bi in zip(a[0::2], a[1::2], b[0::2], b[1::2])]
+    assert [int(x) for x in re] == [upper_bits(p[0], A + B + 1, OUT) for p in products]
+    assert [int(x) for x in im] == [upper_bits(p[1], A + B + 1, OUT) for p in products]
+
+@pytest.mark.parametrize("TAP_DW", [32, 64, 80])
+def test_PSS_taps(TAP_DW, tmp_path):
+    rng = np.random.default_rng(TAP_DW)
+    # python ints as reference, the components of wide taps do not fit into int64 when they are packed
+    max_value = 2 ** (TAP_DW // 2 - 1) - 1
+    taps = rng.integers(-max_value, max_value, 128, endpoint = True) + 1j * rng.integers(-max_value, max_value, 128, endpoint = True)
+    taps[:2] = [max_value - 1j * max_value, -max_value + 1j * max_value]
+    mask = (1 << (TAP_DW // 2)) - 1
+    words = [(int(t.imag) & mask) << (TAP_DW // 2) | (int(t.real) & mask) for t in taps]
+    assert PSS_taps.pack(taps, TAP_DW) == sum(word << (k * TAP_DW) for k, word in enumerate(words))
+    assert np.array_equal(PSS_taps.unpack(PSS_taps.pack(taps, TAP_DW), len(taps), TAP_DW), taps)
+    PSS_taps.write_tap_file(tmp_path / 'taps.hex', taps, TAP_DW)
+    assert np.array_equal(PSS_taps.read_tap_file(tmp_path / 'taps.hex', TAP_DW), taps)
+
+def cic_reference(data, model):
+    """clock by clock cic_d with registered integrators, downsampler and combs and the pruned register widths"""
+    def wrap(value, bits):
+        return ((value + (1 << (bits - 1))) % (1 << bits)) - (1 << (bits - 1))
+    N, R, M, B, widths = model.CIC_N, model.CIC_R, model.CIC_M, model.B, model.widths
+    integrators = [0] * N
+    combs = [[0] * M for _ in range(N)]
+    count = 0
+    out = []
+    for x in data:
+        # all integrators see the outputs of the previous clock cycle
+        inputs = [int(x)] + integrators[:-1]
+        sample = integrators[-1]
+        integrators = [wrap(integrators[k] + (inputs[k] >> (B[k + 1] - B[k])), widths[k + 1]) for k in range(N)]
+        if count == R - 1:
+            for k in range(N):
+                j = N + k + 1
+                sample = sample >> (B[j] - B[j - 1])
+                combs[k].append(sample)
+                sample = wrap(sample - combs[k].pop(0), widths[j])
+            out.append(wrap(sample >> (B[-1] - B[-2]), model.OUT_DW))
+        count = (count + 1) % R
+    return np.array(out, np.int64)
+
+def cic_full_precision(data, N, R, M):
+    """clock by clock cic_d with python ints and without pruning, the output is not scaled"""
+    integrators = [0] * N
+    combs = [[0] * M for _ in range(N)]
+    count = 0
+    out = []
+    for x in data:
+        inputs = [int(x)] + integrators[:-1]
+        sample = integrators[-1]
+        integrators = [integrators[k] + inputs[k] for k in range(N)]
+        if count == R - 1:
+            for k in range(N):
+                combs[k].append(sample)
+                sample = sample - combs[k].pop(0)
+            out.append(sample)
+        count = (count + 1) % R
+    return np.array(out, float)
+
+@pytest.mark.parametrize("CIC_R", [2, 4, 16])
+@pytest.mark.parametrize("CIC_M", [1, 2])
+def test_cic_d(CIC_R, CIC_M):
+    rng = np.random.default_rng(CIC_R * 10 + CIC_M)
+    model = cic_d.Model(16, 16, CIC_R, 3, CIC_M)
+    data = rng.integers(-2 ** 15, 2 ** 15, 2000)
+    # full scale steps make the registers wrap around
+    data[500:700] = 2 ** 15 - 1
+    data[900:1100] = -2 ** 15
+    out = model.process(data)
+    assert np.array_equal(out, cic_reference(data, model))
+
+    # the output keeps the upper 16 bits of 16 + log2(gain) bits, the truncation of the output gives an error
+    # of -1 .. 0 LSB, the pruned stages may add up to 1 LSB
+    error = out - cic_full_precision(data, 3, CIC_R, CIC_M) / (CIC_R * CIC_M) ** 3
+    print(f'error to full precision: {error.min()} .. {error.max()}, mean {error.mean()}')
+    assert np.all(np.abs(error) < 2)
+    assert -1 < error.mean() < 0
+
+    model.reset()
+    chunks = np.split(data, random_splits(rng, len(data), 20))
+    assert np.array_equal(np.concatenate([model.process_chunk(chunk) for chunk in chunks]), out)
+
+@pytest.mark.parametrize("OUT_DW", [10, 12, 16])
+def test_cic_d_merged_stages(OUT_DW):
+    rng = np.random.default_rng(OUT_DW)
+    model = cic_d.Model(16, OUT_DW, 2, 3)
+    # without pruning between them, the last integrators and the first combs run as one FIR filter
+    assert model.MERGED == (2 if OUT_DW == 16 else 1)
+    data = rng.integers(-2 ** 15, 2 ** 15, 2000)
+    data[500:700] = 2 ** 15 - 1
+    out = model.process(data)
+    assert np.array_equal(out, cic_reference(data, model))
+    model.reset()
+    chunks = np.split(data, random_splits(rng, len(data), 20))
+    assert np.array_equal(np.concatenate([model.process_chunk(chunk) for chunk in chunks]), out)
+
+def test_cic_d_decimator():
+    rng = np.random.default_rng(2)
+    IN_DW = 32
+    for FFT_LEN in (256, 512):
+        decimator = cic_d.Decimator(IN_DW, FFT_LEN)
+        assert decimator.CIC_RATE == FFT_LEN // 128
+        samples = random_samples(rng, 3000, IN_DW)
+        out = decimator.process(samples)
+        assert len(out) == len(samples) // decimator.CIC_RATE
+        assert np.array_equal(out.real, cic_reference(samples.real, decimator.real))
+        assert np.array_equal(out.imag, cic_reference(samples.imag, decimator.imag))
+
+@pytest.mark.parametrize("dec_factor", [2, 4, 8, 16])
+def test_fir_decimator(dec_factor):
+    rng = np.random.default_rng(dec_factor)
+    num = 20000 + dec_factor // 2
+    samples = rng.standard_normal(num) + 1j * rng.standard_normal(num)
+    expected = scipy.signal.decimate(samples, dec_factor, ftype='fir')
+    assert np.max(np.abs(fir_decimator.decimate(samples, dec_factor) - expected)) < 1e-12
+    # the outputs do not depend on the chunks
+    decimator = fir_decimator.Decimator(dec_factor)
+    out = [decimator.process_chunk(chunk) for chunk in np.split(samples, random_splits(rng, num, 20))]
+    out = np.concatenate(out + [decimator.flush()])
+    assert len(out) == len(expected)
+    assert np.max(np.abs(out - expected)) < 1e-12
+
+@pytest.mark.parametrize("N_id", [0, 209, 1007])
+def test_gold_sequence(N_id):
+    # the tables are cached, so they are checked against py3gpp once here instead of in every testbench
+    for ibar_SSB in range(8):
+        DMRS = channel_estimator.DMRS_symbols(gold_sequence.PBCH_DMRS_table()[N_id, ibar_SSB])
+        assert np.allclose(DMRS, py3gpp.nrPBCHDMRS(N_id, ibar_SSB) * np.sqrt(2))
+    for v in (0, 3, 7, 8):
+        scrambling_seq = gold_sequence.PBCH_scrambling(N_id, v)
+        assert np.array_equal(scrambling_seq, py3gpp.nrPBCHPRBS(N_id, v, gold_sequence.PBCH_E))
+        # the testbenches map the bits to BPSK, this overflowed with uint8
+        assert np.array_equal(np.unique((-1) * scrambling_seq * 2 + 1), [-1, 1])
+
+def test_demap_sweep():
+    rng = np.random.default_rng(18)
+    num = 5000
+    bits = rng.integers(0, 2, 2 * num)
+    symbols = ((1 - 2 * bits[0::2]) + 1j * (1 - 2 * bits[1::2])) / np.sqrt(2)
+    noise = (rng.normal(size = num) + 1j * rng.normal(size = num)) / np.sqrt(2)
+    SNRs = [0, 3, 6, 9]
+    LLR_DWs = [2, 4, 8]
+    ber = np.zeros((len(SNRs), len(LLR_DWs)))
+    for i, SNR in enumerate(SNRs):
+        samples = symbols + noise * 10 ** (-SNR / 20)
+        results = demap.sweep(samples, [16], LLR_DWs, max_workers = 2, bits = bits)
+        assert [r['LLR_DW'] for r in results] == LLR_DWs
+        ber[i] = [r['ber'] for r in results]
+    print(ber)
+    # the same noise is scaled down for higher SNRs, so the bit errors can only get less
+    assert np.all(np.diff(ber, axis = 0) < 0)
+    assert ber[0, 0] > 0.05
+
+def SSB_waveform(rng, N_id, ibar_SSB, num_subframes, SSB_subframes, SNR = 30, FFT_LEN = 256):
+    """subframes at 3.84 MSPS * FFT_LEN / 256 with random QPSK and an SSB in the symbols 2 .. 5 of every subframe
+    in SSB_subframes, 16 bit I and Q"""
+    qpsk = lambda num: ((1 - 2 * rng.integers(0, 2, num)) + 1j * (1 - 2 * rng.integers(0, 2, num))) / np.sqrt(2)
+    estimator = channel_estimator.Model()
+    estimator.set_N_id(N_id)
+    pilot, _ = estimator.pilot_mask()
+    PBCH = qpsk(pilot.size).reshape(pilot.shape)
+    PBCH[pilot] = channel_estimator.DMRS_symbols(estimator.PBCH_DMRS[ibar_SSB][:np.sum(pilot)]) / np.sqrt(2)
+    PBCH[1, 48:192] = 0
+    PBCH[1, 56:183] = py3gpp.nrSSS(N_id)
+    symbols = []
+    for subframe in range(num_subframes):
+        for l in range(14):
+            carriers = qpsk(estimator.SC_LEN)
+            if subframe in SSB_subframes and l == 2:
+                carriers = np.zeros(estimator.SC_LEN, complex)
+                carriers[56:183] = py3gpp.nrPSS(N_id % 3)
+            elif subframe in SSB_subframes and 3 <= l <= 5:
+                carriers = PBCH[l - 3]
+            grid = np.zeros(FFT_LEN, complex)
+            grid[FFT_LEN // 2 - estimator.SC_LEN // 2:][:estimator.SC_LEN] = carriers
+            symbol = np.fft.ifft(np.fft.ifftshift(grid))
+            CP_LEN = (20 if l in (0, 7) else 18) * FFT_LEN // 256
+            symbols.append(np.concatenate((symbol[-CP_LEN:], symbol)))
+    waveform = np.concatenate(symbols)
+    noise_power = np.mean(np.abs(waveform) ** 2) * 10 ** (-SNR / 10)
+    waveform += (rng.normal(size = len(waveform)) + 1j * rng.normal(size = len(waveform))) * np.sqrt(noise_power / 2)
+    waveform *= 0.8 * (2 ** 15 - 1) / max(np.abs(waveform.real).max(), np.abs(waveform.imag).max())
+    return np.round(waveform.real) + 1j * np.round(waveform.imag)
+
+@pytest.mark.parametrize("boundary", [-147, 101, 600])
+def test_receiver_parallel(boundary):
+    rng = np.random.default_rng(21)
+    N_id = 209
+    ibar_SSB = 3
+    waveform = SSB_waveform(rng, N_id, ibar_SSB, 8, [3])
+    model = receiver.Model()
+    peaks, SSBs, _, llr = model.process(waveform)
+    assert len(peaks) == 1
+    assert list(SSBs['N_id']) == [N_id]
+    assert list(SSBs['ibar_SSB']) == [ibar_SSB]
+
+    # the third segment boundary is in the PSS, after the PSS or in the PBCH symbols. Segments start from reset,
+    # so they only give the same result as one continuous run if there is no detection before them
+    segment_len = (SSBs['pos'][0] + boundary) // 3
+    own_start = [segment[2] for segment in model.segments([waveform], segment_len)]
+    assert len(own_start) > 5
+    assert peaks['pos'][0] - 2 * model.FFT_LEN < own_start[3] < SSBs['pos'][0] + 3 * model.FFT_LEN
+    parallel_peaks, parallel_SSBs, parallel_llr = receiver.process_parallel(waveform, max_workers = 2, segment_len = segment_len)
+    assert np.array_equal(parallel_peaks, peaks)
+    assert np.array_equal(parallel_SSBs, SSBs)
+    assert np.array_equal(parallel_llr, llr)
+
+def test_receiver_SSB_tracking():
+    rng = np.random.default_rng(22)
+    N_id = 209
+    ibar_SSB = 3
+    SSB_subframes = list(range(3, 200, 20))
+    waveform = SSB_waveform(rng, N_id, ibar_SSB, 200, SSB_subframes)
+    peaks, SSBs, _, _ = receiver.Model().process(waveform)
+    print(peaks)
+    print(SSBs)
+    # every SSB is found and the CFO estimates do not add up
+    assert len(peaks) == len(SSB_subframes)
+    assert np.all(np.diff(peaks['pos']) == 76800)
+    assert np.all(np.abs(peaks['CFO']) < 200)
+    assert list(SSBs['N_id']) == [N_id] * len(SSB_subframes)
+    assert list(SSBs['ibar_SSB']) == [ibar_SSB] * len(SSB_subframes)
+
+    # like the HDL, the model without TRACK_SSB loses the sync and misses SSBs
+    _, SSBs, _, _ = receiver.Model(TRACK_SSB = 0).process(waveform)
+    assert len(SSBs) < len(SSB_subframes)
+
+def write_sigmf(base, samples, sample_rate, datatype = 'ci16_le'):
+    """writes integer complex samples as a SigMF recording and returns the name of the .sigmf-data file"""
+    component = sigmf_reader.DATATYPES[datatype]
+    data = np.zeros(len(samples), [('re', component), ('im', component)])
+    data['re'] = np.real(samples)
+    data['im'] = np.imag(samples)
+    data.tofile(f'{base}.sigmf-data')
+    meta = {'global': {'core:datatype': datatype, 'core:sample_rate': sample_rate}, 'captures': [{'core:sample_start': 0}]}
+    with open(f'{base}.sigmf-meta', 'w') as f:
+        json.dump(meta, f)
+    return f'{base}.sigmf-data'
+
+def test_waveform_cache(tmp_path, monkeypatch):
+    cache_dir = tmp_path / 'cache'
+    monkeypatch.setenv('OPEN5G_CACHE_DIR', str(cache_dir))
+    rng = np.random.default_rng(24)
+    filename = write_sigmf(tmp_path / 'recording', random_samples(rng, 20000, 32), 30720000)
+    samples = sigmf_reader.Recording(filename).read_samples()
+    expected = waveform_cache.preprocess(samples, 30720000, CFO = 1000, dec_factor = 8, IN_DW = 32)
+    assert np.array_equal(waveform_cache.preprocessed(filename, CFO = 1000, dec_factor = 8, IN_DW = 32), expected)
+    # the default scale is resolved before the key is built, so both calls share the cache entry
+    scale = 2 ** 15 - 1
+    assert np.array_equal(waveform_cache.preprocessed(filename, CFO = 1000, dec_factor = 8, IN_DW = 32, scale = scale), expected)
+    assert len(os.listdir(cache_dir)) == 1
+    # a window is a part of the whole preprocessed recording, normalized with the maximum of the whole recording
+    window = waveform_cache.preprocessed(filename, 10001 / 30720000, 5000 / 30720000, CFO = 1000, dec_factor = 8, IN_DW = 32)
+    assert np.array_equal(window, expected[1251:1876])
+    assert len(os.listdir(cache_dir)) == 1
+    # a new preprocessing version never returns the old entry
+    monkeypatch.setattr(waveform_cache, 'PREPROCESS_VERSION', waveform_cache.PREPROCESS_VERSION + 1)
+    waveform_cache.preprocessed(filename, CFO = 1000, dec_factor = 8, IN_DW = 32)
+    assert len(os.listdir(cache_dir)) == 2
+
+def test_cell_search(tmp_path, capsys):
+    rng = np.random.default_rng(25)
+    N_id = 209
+    ibar_SSB = 3
+    # 7.68 MSPS recording with two SSB periods, the blocks do not line up with the segments
+    filename = write_sigmf(tmp_path / 'recording', SSB_waveform(rng, N_id, ibar_SSB, 30, [3, 23], FFT_LEN = 512), 7680000)
+    SSBs, dec_factor, num_samples = cell_search.search(filename, max_workers = 2, block_duration = 0.0021)
+    assert dec_factor == 2
+    assert num_samples == 30 * 7680
+    assert list(SSBs['N_id']) == [N_id, N_id]
+    assert list(SSBs['ibar_SSB']) == [ibar_SSB, ibar_SSB]
+    # the PBCH symbol starts after 3 symbols of the subframe
+    assert np.all(np.abs(SSBs['pos'] - (np.array([3, 23]) * 3840 + 20 + 2 * 18 + 3 * 256)) <= 2)
+    # the gain of the recording does not depend on the blocks
+    assert np.array_equal(cell_search.search(filename, max_workers = 2, block_duration = 1)[0], SSBs)
+
+    cell_search.main([filename, '--max-workers', '2'])
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 3
+    assert [int(line.split()[5]) for line in lines[1:]] == [N_id, N_id]
+
+def test_cell_search_throughput(tmp_path, capsys):
+    rng = np.random.default_rng(25)
+    # 200 ms at 7.68 MSPS with an SSB every 20 ms, long enough that the start of the worker is not most of the time
+    filename = write_sigmf(tmp_path / 'recording', SSB_waveform(rng, 209, 3, 200, list(range(3, 200, 20)), FFT_LEN = 512),
+                           7680000)
+    cell_search.main([filename, '--max-workers', '1'])
+    out, err = capsys.readouterr()
+    assert len(out.splitlines()) == 11
+    # 'recording: 10 SSBs, 1536000 samples in 0.64 s, 2.38 MSPS, 0.31 x real time'
+    fields = err.splitlines()[0].split()
+    assert fields[1:5] == ['10', 'SSBs,', '1536000', 'samples']
+    elapsed, MSPS, real_time = float(fields[6]), float(fields[8]), float(fields[10])
+    assert MSPS == pytest.approx(1.536 / elapsed, rel = 0.05, abs = 0.01)
+    assert real_time == pytest.approx(MSPS / 7.68, rel = 0.05, abs = 0.01)
+    # about 0.3 x real time with one worker on one core, the limit leaves room for slow or busy machines
+    assert real_time > 0.05
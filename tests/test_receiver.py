@@ -1,6 +1,6 @@
 import numpy as np
-import scipy
 import os
+import sys
 import pytest
 import logging
 import matplotlib.pyplot as plt
@@ -13,18 +13,20 @@ from cocotb.triggers import RisingEdge
 from cocotbext.axi import AxiLiteBus, AxiLiteMaster
 
 import py3gpp
-import sigmf
 
 CLK_PERIOD_NS = 8
 CLK_PERIOD_S = CLK_PERIOD_NS * 0.000000001
 tests_dir = os.path.abspath(os.path.dirname(__file__))
 rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', 'hdl'))
-
-def _twos_comp(val, bits):
-    """compute the 2's complement of int value val"""
-    if (val & (1 << (bits - 1))) != 0:
-        val = val - (1 << bits)
-    return int(val)
+model_dir = os.path.abspath(os.path.join(tests_dir, '..', 'model'))
+sys.path.append(model_dir)
+import waveform_cache
+import PSS_taps
+import fixed_point
+import SSS_detector
+import gold_sequence
+import demap
+import receiver
 
 class TB(object):
     def __init__(self, dut):
@@ -75,20 +77,16 @@ async def simple_test(dut):
     NFFT = tb.NFFT
     FFT_LEN = 2 ** NFFT
     CFO = int(os.getenv('CFO'))
-    handle = sigmf.sigmffile.fromfile('../../tests/30720KSPS_dl_signal.sigmf-data')
-    waveform = handle.read_samples()
     fs = 30720000
     print(f'CFO = {CFO} Hz')
-    waveform *= np.exp(np.arange(len(waveform)) * 1j * 2 * np.pi * CFO / fs)
     dec_factor = 2048 // FFT_LEN
-    waveform = scipy.signal.decimate(waveform, dec_factor, ftype='fir')  # decimate to 3.840 MSPS
     fs = fs // dec_factor
-    waveform /= max(np.abs(waveform.real.max()), np.abs(waveform.imag.max()))
     MAX_AMPLITUDE = (2 ** (tb.IN_DW // 2 - 1) - 1)
-    waveform *= MAX_AMPLITUDE * 0.8  # need this 0.8 because rounding errors caused overflows, nasty bug!
+    # decimate to 3.840 MSPS, need this 0.8 because rounding errors caused overflows, nasty bug!
+    waveform = waveform_cache.load('../../tests/30720KSPS_dl_signal.sigmf-data', 0, 0.05, CFO = CFO, dec_factor = dec_factor, IN_DW = tb.IN_DW,
+                                   scale = MAX_AMPLITUDE * 0.8)
     assert np.abs(waveform.real).max().astype(int) <= MAX_AMPLITUDE, "Error: input data overflow!"
     assert np.abs(waveform.imag).max().astype(int) <= MAX_AMPLITUDE, "Error: input data overflow!"
-    waveform = waveform.real.astype(int) + 1j * waveform.imag.astype(int)
 
     await tb.cycle_reset()
     USE_COCOTB_AXI = 1
@@ -134,6 +132,7 @@ async def simple_test(dut):
     received_SSS = []
     corrected_PBCH = []
     received_PBCH_LLR = []
+    received_ibar_SSB = []
     fft_started = False
     HALF_CP_ADVANCE = tb.HALF_CP_ADVANCE
     CP2_LEN = 18 * FFT_LEN // 256
@@ -168,31 +167,36 @@ async def simple_test(dut):
         #     print(f'detected N_id_1 = {dut.m_axis_SSS_tdata.value.integer}')
 
         if dut.m_axis_llr_out_tvalid.value == 1 and dut.m_axis_llr_out_tuser.value == 1:
-            received_PBCH_LLR.append(_twos_comp(dut.m_axis_llr_out_tdata.value.integer & (2 ** (tb.LLR_DW) - 1), tb.LLR_DW))
+            received_PBCH_LLR.append(dut.m_axis_llr_out_tdata.value.integer)
+
+        if dut.ce_ibar_SSB_valid.value == 1:
+            received_ibar_SSB.append(dut.ce_ibar_SSB.value.integer)
 
         if dut.m_axis_cest_out_tvalid.value == 1 and dut.m_axis_cest_out_tuser.value == 1:
-            corrected_PBCH.append(_twos_comp(dut.m_axis_cest_out_tdata.value.integer & (2**(FFT_OUT_DW//2) - 1), FFT_OUT_DW//2)
-                + 1j * _twos_comp((dut.m_axis_cest_out_tdata.value.integer>>(FFT_OUT_DW//2)) & (2**(FFT_OUT_DW//2) - 1), FFT_OUT_DW//2))
+            corrected_PBCH.append(dut.m_axis_cest_out_tdata.value.integer)
 
         if dut.PBCH_valid_o.value.integer == 1:
             # print(f"rx PBCH[{len(received_PBCH):3d}] re = {dut.m_axis_out_tdata.value.integer & (2**(FFT_OUT_DW//2) - 1):4x} " \
             #     "im = {(dut.m_axis_out_tdata.value.integer>>(FFT_OUT_DW//2)) & (2**(FFT_OUT_DW//2) - 1):4x}")
-            received_PBCH.append(_twos_comp(dut.m_axis_demod_out_tdata.value.integer & (2**(FFT_OUT_DW//2) - 1), FFT_OUT_DW//2)
-                + 1j * _twos_comp((dut.m_axis_demod_out_tdata.value.integer>>(FFT_OUT_DW//2)) & (2**(FFT_OUT_DW//2) - 1), FFT_OUT_DW//2))
+            received_PBCH.append(dut.m_axis_demod_out_tdata.value.integer)
 
         if dut.SSS_valid_o.value.integer == 1:
-            received_SSS.append(_twos_comp(dut.m_axis_demod_out_tdata.value.integer & (2**(FFT_OUT_DW//2) - 1), FFT_OUT_DW//2)
-                + 1j * _twos_comp((dut.m_axis_demod_out_tdata.value.integer>>(FFT_OUT_DW//2)) & (2**(FFT_OUT_DW//2) - 1), FFT_OUT_DW//2))
+            received_SSS.append(dut.m_axis_demod_out_tdata.value.integer)
 
         if dut.m_axis_demod_out_tvalid.value.integer == 1:
             # print(f'{rx_counter}: fft_demod {dut.m_axis_out_tdata.value}')
-            received_fft_demod.append(_twos_comp(dut.m_axis_demod_out_tdata.value.integer & (2**(FFT_OUT_DW//2) - 1), FFT_OUT_DW//2)
-                + 1j * _twos_comp((dut.m_axis_demod_out_tdata.value.integer>>(FFT_OUT_DW//2)) & (2**(FFT_OUT_DW//2) - 1), FFT_OUT_DW//2))
+            received_fft_demod.append(dut.m_axis_demod_out_tdata.value.integer)
 
         if fft_started:
             # print(f'{rx_counter}: fft_debug {dut.fft_result_debug_o.value}')
-            received_fft.append(_twos_comp(dut.fft_result_debug_o.value.integer & (2**(FFT_OUT_DW//2) - 1), FFT_OUT_DW//2)
-                + 1j * _twos_comp((dut.fft_result_debug_o.value.integer>>(FFT_OUT_DW//2)) & (2**(FFT_OUT_DW//2) - 1), FFT_OUT_DW//2))
+            received_fft.append(dut.fft_result_debug_o.value.integer)
+
+    received_PBCH_LLR = fixed_point.sign_extend(received_PBCH_LLR, tb.LLR_DW)
+    corrected_PBCH = fixed_point.unpack_complex(corrected_PBCH, FFT_OUT_DW)
+    received_PBCH = fixed_point.unpack_complex(received_PBCH, FFT_OUT_DW)
+    received_SSS = fixed_point.unpack_complex(received_SSS, FFT_OUT_DW)
+    received_fft_demod = fixed_point.unpack_complex(received_fft_demod, FFT_OUT_DW)
+    received_fft = fixed_point.unpack_complex(received_fft, FFT_OUT_DW)
 
     print(f'received {len(corrected_PBCH)} PBCH IQ samples')
     print(f'received {len(received_PBCH_LLR)} PBCH LLRs samples')
@@ -200,6 +204,8 @@ async def simple_test(dut):
     assert len(corrected_PBCH) == 432 * 2, print('received PBCH does not have correct length!')
     assert len(received_PBCH_LLR) == 432 * 4, print('received PBCH LLRs do not have correct length!')
     assert not np.array_equal(np.array(received_PBCH_LLR), np.zeros(len(received_PBCH_LLR)))
+    demap_model = demap.Model(FFT_OUT_DW // 2, tb.LLR_DW)
+    assert np.array_equal(received_PBCH_LLR, demap_model.process(corrected_PBCH)[0])
 
     fifo_data = []
     if USE_COCOTB_AXI:
@@ -209,7 +215,7 @@ async def simple_test(dut):
         assert data == 864 * 2
         for i in range(data):
             data = await axi_master.read_dword(7 * 4)
-            fifo_data.append(_twos_comp(data & (2 ** (tb.LLR_DW) - 1), tb.LLR_DW))
+            fifo_data.append(data)
     else:
         addr = 0
         data = await tb.read_axil(addr * 4)
@@ -221,8 +227,9 @@ async def simple_test(dut):
         addr = 7
         for i in range(data):
             data = await tb.read_axil(addr * 4)
-            fifo_data.append(_twos_comp(data & (2 ** (tb.LLR_DW) - 1), tb.LLR_DW))
+            fifo_data.append(data)
             print(data)
+    fifo_data = fixed_point.sign_extend(fifo_data, tb.LLR_DW)
     assert not np.array_equal(np.array(fifo_data), np.zeros(len(fifo_data)))
     assert np.array_equal(np.array(received_PBCH_LLR), np.array(fifo_data))
 
@@ -296,15 +303,42 @@ async def simple_test(dut):
     ideal_SSS = ideal_SSS.real / scaling_factor + 1j * ideal_SSS.imag / scaling_factor
 
     assert peak_pos == 850
-    corr = np.zeros(335)
-    for i in range(335):
-        sss = py3gpp.nrSSS(i)
-        corr[i] = np.abs(np.vdot(sss, received_SSS[:SSS_LEN]))
+    corr = np.abs(SSS_detector.SSS_table() @ received_SSS[:SSS_LEN])
     detected_NID = np.argmax(corr)
     assert detected_NID == 209
 
+    # TRACK_SSB = 0 takes C0 and C1 and counts the symbols between the SSBs like the HDL
+    receiver_model = receiver.Model(tb.IN_DW, tb.OUT_DW, tb.TAP_DW, tb.PSS_LEN, ALGO = tb.ALGO, WINDOW_LEN = tb.WINDOW_LEN,
+                                    HALF_CP_ADVANCE = tb.HALF_CP_ADVANCE, LLR_DW = tb.LLR_DW, NFFT = NFFT, TRACK_SSB = 0)
+    model_peaks, model_SSBs, _, model_llr = receiver_model.process(waveform[:max_tx])
+    print(receiver_model.timing_report())
+    print(f'model peaks: {model_peaks}')
+    print(f'model SSBs: {model_SSBs}')
+    assert len(model_SSBs) > 0
+    assert model_SSBs['N_id'][0] == detected_NID
+
+    # the model counts the clock cycles from the input of the CFO correction, the DUT has the input FIFO
+    # in front of it, so the peaks are shifted by a constant latency
+    hdl_peaks = np.flatnonzero(received)
+    assert len(hdl_peaks) >= len(model_peaks) > 0
+    peak_offset = hdl_peaks[:len(model_peaks)] - model_peaks['pos']
+    print(f'hdl peaks: {hdl_peaks}, offset to the model: {peak_offset}')
+    assert np.all(peak_offset == peak_offset[0])
+
+    print(f'hdl ibar_SSB: {received_ibar_SSB}')
+    assert len(received_ibar_SSB) == len(received_PBCH_LLR) // 864
+    assert np.array_equal(model_SSBs['ibar_SSB'][:len(received_ibar_SSB)], received_ibar_SSB)
+
+    # the FFT core is not modelled bit exactly, so the LLRs can differ by a few LSBs,
+    # but the hard decisions of all LLRs that are not close to 0 have to be the same
+    model_llr = model_llr[:len(received_PBCH_LLR) // 864].ravel()
+    assert len(model_llr) == len(received_PBCH_LLR)
+    print(f'max LLR difference between model and hdl: {np.max(np.abs(model_llr - received_PBCH_LLR))}')
+    reliable = np.abs(received_PBCH_LLR) >= 2 ** (tb.LLR_DW - 4)
+    assert np.array_equal(np.sign(model_llr[reliable]), np.sign(received_PBCH_LLR[reliable]))
+
     # try to decode PBCH
-    ibar_SSB = 0 # TODO grab this from hdl
+    ibar_SSB = received_ibar_SSB[0]
     nVar = 1
     corrected_PBCH = np.array(corrected_PBCH)[:432]
     for mode in ['hard', 'soft', 'hdl']:
@@ -316,7 +350,8 @@ async def simple_test(dut):
 
         E = 864
         v = ibar_SSB
-        scrambling_seq = py3gpp.nrPBCHPRBS(detected_NID, v, E)
+        scrambling_seq = gold_sequence.PBCH_scrambling(detected_NID, v, E)
+        assert np.array_equal(scrambling_seq, py3gpp.nrPBCHPRBS(detected_NID, v, E))
         scrambling_seq_bpsk = (-1) * scrambling_seq * 2 + 1
         pbchBits_descrambled = pbchBits * scrambling_seq_bpsk
 
@@ -424,24 +459,12 @@ def test(IN_DW, OUT_DW, TAP_DW, ALGO, WINDOW_LEN, CFO, HALF_CP_ADVANCE, USE_TAP_
 
     for i in range(3):
         # imaginary part is in upper 16 Bit
-        PSS = np.zeros(PSS_LEN, 'complex')
-        PSS[0:-1] = py3gpp.nrPSS(i)
-        taps = np.fft.ifft(np.fft.fftshift(PSS))
-        taps /= max(taps.real.max(), taps.imag.max())
-        taps *= 2 ** (TAP_DW // 2 - 1)
-        parameters[f'PSS_LOCAL_{i}'] = 0
-        PSS_taps = np.empty(PSS_LEN, int)
-        for k in range(len(taps)):
-            if not USE_TAP_FILE:
-                parameters[f'PSS_LOCAL_{i}'] += ((int(np.round(np.imag(taps[k]))) & (2 ** (TAP_DW // 2) - 1)) << (TAP_DW * k + TAP_DW // 2)) \
-                                        + ((int(np.round(np.real(taps[k]))) & (2 ** (TAP_DW // 2) - 1)) << (TAP_DW * k))
-            PSS_taps[k] = ((int(np.imag(taps[k])) & (2 ** (TAP_DW // 2) - 1)) << (TAP_DW // 2)) \
-                                    + (int(np.real(taps[k])) & (2 ** (TAP_DW // 2) - 1))
+        parameters[f'PSS_LOCAL_{i}'] = 0 if USE_TAP_FILE else PSS_taps.PSS_LOCAL(i, PSS_LEN, TAP_DW, rounding = 'round')
         if USE_TAP_FILE:
             parameters[f'TAP_FILE_{i}'] = f'\"../{folder}_PSS_{i}_taps.txt\"'
             os.environ[f'TAP_FILE_{i}'] = f'../{folder}_PSS_{i}_taps.txt'
             os.makedirs("sim_build", exist_ok=True)
-            np.savetxt(sim_build + f'_PSS_{i}_taps.txt', PSS_taps, fmt = '%x', delimiter = ' ')
+            PSS_taps.write_tap_file(sim_build + f'_PSS_{i}_taps.txt', PSS_taps.calc_taps(i, PSS_LEN, TAP_DW), TAP_DW)
     extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
     
     compile_args = []